@@ -2,14 +2,38 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import re
-import joblib
-import pickle
+import os
+import sys
 from datetime import datetime
 
+# Address resolution shared with the preprocessing notebooks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data Preprocessing'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Modeling', 'Alonhatot'))
+from gazetteer import get_gazetteer
+from dataset_store import load_processed
+from feature_store import district_price_categories
+from instrumentation import METRICS_ENV, Metrics
+
+# Model artifacts are cached per process and only reloaded when the files change
+from model_registry import get_registry
+from outliers import IQRFilter
+
+@st.cache_resource
+def model_registry():
+    return get_registry()
+
+registry = model_registry()
+
+@st.cache_resource
+def app_metrics():
+    # Prediction timings add up over the app's lifetime; written after each prediction if PIPELINE_METRICS is set
+    return Metrics("app")
+
+metrics = app_metrics()
+
 # Load the model features
 try:
-    with open('model_features.pkl', 'rb') as f:
-        model_features = pickle.load(f)
+    model_features = registry.features()
     st.sidebar.success("Model features loaded successfully!")
     numeric_features = model_features['numeric_features']
     categorical_features = model_features['categorical_features']
@@ -21,57 +45,42 @@ except Exception as e:
                       'is_main_road', 'is_corner', 'has_car_access']
     categorical_features = ['district', 'district_price_category']
     is_log_transformed = True
+    model_features = {}
+
+@st.cache_resource
+def training_district_price_categories():
+    # Models exported before the buckets were saved alongside: rebuild them from the training data
+    training = load_processed('alonhadat', columns=['district', 'price_converted'])
+    return district_price_categories(training)
+
+# District price buckets the model was trained with (the same mapping batch_predict, serve and compiled_model use)
+district_price_category_map = model_features.get('district_price_category') or training_district_price_categories()
+
+# Training data's IQR bounds, to warn about inputs the model has rarely seen
+outlier_filter = IQRFilter.from_dict(model_features['outlier_bounds']) if 'outlier_bounds' in model_features else None
 
-# Load the trained model
+# Load the trained model (XGBoost first, falling back to KNN if it is not available)
 try:
-    # Try loading the XGBoost model first
-    model = joblib.load('xgboost_model.joblib')
-    model_type = "XGBoost"
-    st.sidebar.success(f"{model_type} model loaded successfully!")
-except Exception as e:
-    # Fall back to KNN model if XGBoost is not available
-    try:
-        model = joblib.load('knn_model.joblib')
-        model_type = "KNN"
+    model, model_type = registry.model()
+    if model_type == "XGBoost":
+        st.sidebar.success(f"{model_type} model loaded successfully!")
+    else:
         st.sidebar.info(f"XGBoost model not found, using {model_type} model instead.")
-    except Exception as e2:
-        st.sidebar.error(f"Error loading models: {e2}")
-        model = None
-        model_type = "None"
+except Exception as e2:
+    st.sidebar.error(f"Error loading models: {e2}")
+    model = None
+    model_type = "None"
 
 # Function to extract district from address
 def extract_district(address):
-    # Common districts in Hanoi
-    districts = [
-        "Ba Đình", "Hoàn Kiếm", "Tây Hồ", "Long Biên", "Cầu Giấy", 
-        "Đống Đa", "Hai Bà Trưng", "Hoàng Mai", "Thanh Xuân", "Hà Đông", 
-        "Bắc Từ Liêm", "Nam Từ Liêm", "Sơn Tây", "Ba Vì", "Chương Mỹ", 
-        "Đan Phượng", "Đông Anh", "Gia Lâm", "Hoài Đức", "Mê Linh", 
-        "Mỹ Đức", "Phú Xuyên", "Phúc Thọ", "Quốc Oai", "Sóc Sơn", 
-        "Thạch Thất", "Thanh Oai", "Thanh Trì", "Thường Tín", "Ứng Hòa"
-    ]
-    
-    # Try to find a district match
-    for district in districts:
-        if district.lower() in address.lower():
-            return district
-    
-    # Default if no district found
-    return "Unknown"
-
-# Function to extract ward category from address
-def extract_ward_category(address):
-    # Simple logic: categorize by district affluence
-    # This is a simplified version - would need to be enhanced with actual data
-    affluent_districts = ["Ba Đình", "Hoàn Kiếm", "Tây Hồ", "Cầu Giấy", "Đống Đa", "Hai Bà Trưng"]
-    district = extract_district(address)
-    
-    if district in affluent_districts:
-        return "high_price"  # Updated to match model's price category values
-    elif district == "Unknown":
-        return "mid_price"  # Default category
-    else:
-        return "low_price"  # Less affluent category
+    # One pass over the address with the gazetteer shared with batch scoring and preprocessing
+    district = get_gazetteer().resolve(address)['district']
+    return district if district else "Unknown"
+
+# Function to extract ward category from the district
+def extract_ward_category(district):
+    # Price bucket of the district in the training data; None for districts the model has not seen
+    return district_price_category_map.get(district)
 
 # Function to check if property is on a corner
 def is_corner_property(address):
@@ -126,8 +135,9 @@ if submitted and model:
         is_main_road_val = 1 if is_main_road_manual else (1 if is_main_road(dia_chi) else 0)
         has_car_access_val = 1 if has_car_access_manual else (1 if has_car_access(dia_chi) else 0)
         
-        district = extract_district(dia_chi)
-        district_price_category = extract_ward_category(dia_chi)
+        with metrics.stage("resolve_address"):
+            district = extract_district(dia_chi)
+        district_price_category = extract_ward_category(district)
         
         # Display extracted features for transparency
         st.write("Thông tin đã nhập:")
@@ -182,7 +192,11 @@ if submitted and model:
         
         # Make prediction
         try:
-            price_prediction = model.predict(input_df)[0]
+            with metrics.stage("predict"):
+                price_prediction = model.predict(input_df)[0]
+            metrics.count("predictions")
+            if os.environ.get(METRICS_ENV):
+                metrics.write(os.environ[METRICS_ENV])
             
             # Transform prediction back if log-transformed
             if is_log_transformed:
@@ -202,6 +216,12 @@ if submitted and model:
             # Show model information
             st.info(f"Dự đoán bằng mô hình: {model_type}")
             
+            if outlier_filter is not None:
+                flags = outlier_filter.out_of_range(input_df).iloc[0]
+                if flags.any():
+                    st.warning("Giá trị nằm ngoài khoảng dữ liệu huấn luyện, dự đoán có thể kém chính xác: "
+                               + ", ".join(flags.index[flags]))
+            
         except Exception as pred_error:
             st.error(f"Lỗi khi dự đoán: {pred_error}")
             st.write("Chi tiết đầu vào:")
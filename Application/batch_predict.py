@@ -0,0 +1,256 @@
+"""
+Batch price prediction with the exported XGBoost pipeline.
+
+Streams a CSV or Parquet file of listings in chunks, derives the model's
+features for a whole chunk at once (the same definitions as
+`Modeling/Alonhatot/feature_store.py`), scores it with a single `predict`
+call and appends the chunk with a `predicted_price` column (millions of
+VND) and an `out_of_range` column (inputs outside the training data's IQR
+bounds) to the output file.
+
+Listings can be processed rows (`area`, `bedrooms`, `floors`, `district`,
+`address_complete`, `title`) or raw crawl rows (`address`, "80 m2" areas,
+"4 phòng ngủ" counts); missing fields are parsed from the raw ones, with
+addresses resolved by the gazetteer in `Data Preprocessing/gazetteer.py`.
+
+Usage:
+    python batch_predict.py listings.csv predictions.csv
+    python batch_predict.py listings.parquet predictions.parquet --chunk-size 100000 --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(APP_DIR, '..', 'Data Preprocessing'))
+sys.path.insert(0, os.path.join(APP_DIR, '..', 'Modeling', 'Alonhatot'))
+import parsing
+from gazetteer import get_gazetteer
+from dataset_store import load_processed
+from feature_store import add_derived_features, district_price_categories, load_outlier_filter
+from instrumentation import NO_METRICS, add_arguments, instrumented
+from outliers import IQRFilter
+from model_registry import get_registry
+
+MODEL_PATH = os.path.join(APP_DIR, 'xgboost_model.joblib')
+FEATURES_PATH = os.path.join(APP_DIR, 'model_features.pkl')
+PREDICTION_COLUMN = 'predicted_price'
+# Inputs outside the training data's IQR bounds, e.g. "area,floors" ('' if none)
+OUT_OF_RANGE_COLUMN = 'out_of_range'
+
+
+def load_model(model_path=MODEL_PATH, features_path=FEATURES_PATH):
+    """
+    Load the pipeline and its feature description
+
+    Models exported before the district price buckets and outlier bounds
+    were saved alongside get them rebuilt from the training data, as
+    `export_model.py` does.
+
+    Returns:
+        tuple: (model, model_features dict)
+    """
+    registry = get_registry()
+    model = registry.get(model_path, joblib.load)
+    model_features = dict(registry.features(features_path))
+    if 'district_price_category' not in model_features:
+        training = load_processed('alonhadat', columns=['district', 'price_converted'])
+        model_features['district_price_category'] = district_price_categories(training)
+    if 'outlier_bounds' not in model_features:
+        model_features['outlier_bounds'] = load_outlier_filter('alonhadat').to_dict()
+    return model, model_features
+
+
+def prepare_features(listings, model_features):
+    """
+    Build the model input for a chunk of listings
+
+    Args:
+        listings (pd.DataFrame): Processed or raw listing rows
+        model_features (dict): Feature description saved by export_model.py
+
+    Returns:
+        pd.DataFrame: Numeric features as float64, categorical features as objects
+    """
+    def numeric(column, parse):
+        values = listings[column]
+        if pd.api.types.is_numeric_dtype(values):
+            return values.astype('float64')
+        # Raw strings ("80 m2") are parsed; numbers mixed in (e.g. from JSON) are kept as-is
+        is_text = values.map(lambda value: isinstance(value, str)).astype(bool)
+        numbers = pd.to_numeric(values.where(~is_text), errors='coerce').astype('float64')
+        return numbers.fillna(parse(values.where(is_text)).astype('float64'))
+
+    # Fields missing from processed rows come from the raw address; without an
+    # address, listings count as complete (the app's default)
+    components = get_gazetteer().resolve_many(listings['address']) if 'address' in listings.columns else None
+    if 'district' in listings.columns:
+        district = listings['district'].astype(object)
+        if components is not None:
+            district = district.where(district.notna(), components['district'])
+    else:
+        district = components['district']
+    if 'address_complete' in listings.columns:
+        address_complete = listings['address_complete']
+    elif components is not None:
+        # Complete when the address itself names road, ward and district (an inferred district does not count)
+        address_complete = (components[['road', 'ward', 'district']].notnull().all(axis=1)
+                            & ~components['district_inferred']).astype(int)
+    else:
+        address_complete = pd.Series(1, index=listings.index)
+
+    features = pd.DataFrame({
+        'area': numeric('area', parsing.parse_area),
+        'bedrooms': numeric('bedrooms', parsing.parse_count),
+        'floors': numeric('floors', parsing.parse_count),
+        'address_complete': address_complete.astype('float64'),
+        'district': district.astype(object),
+        'title': listings['title'].fillna('').astype(str) if 'title' in listings.columns else '',
+    }, index=listings.index)
+    features = add_derived_features(features)
+    features['district_price_category'] = features['district'].map(model_features['district_price_category'])
+
+    numeric_features = model_features['numeric_features']
+    categorical_features = model_features['categorical_features']
+    features[numeric_features] = features[numeric_features].astype('float64')
+    return features[numeric_features + categorical_features]
+
+
+def predict_prices(model, model_features, listings, features=None):
+    """Predicted prices (millions of VND) for every row of `listings`, from one `predict` call"""
+    if features is None:
+        features = prepare_features(listings, model_features)
+    predictions = model.predict(features)
+    if model_features.get('is_log_transformed', False):
+        predictions = np.expm1(predictions)
+    return predictions
+
+
+def out_of_range(features, model_features):
+    """Comma-separated names of the inputs outside the training data's IQR bounds, per row"""
+    flags = IQRFilter.from_dict(model_features['outlier_bounds']).out_of_range(features)
+    labels = pd.Series('', index=features.index, dtype=object)
+    for column in flags.columns:
+        labels = labels + np.where(flags[column], f"{column},", '')
+    return labels.str.rstrip(',')
+
+
+# Per-process model, loaded once by `_init_worker`
+_worker = {}
+
+
+def _init_worker(model_path, features_path, n_threads=None):
+    model, model_features = load_model(model_path, features_path)
+    if n_threads:
+        model.named_steps['regressor'].set_params(n_jobs=n_threads)
+    _worker['model'], _worker['features'] = model, model_features
+
+
+def _score_chunk(listings):
+    features = prepare_features(listings, _worker['features'])
+    listings[PREDICTION_COLUMN] = predict_prices(_worker['model'], _worker['features'], listings, features)
+    listings[OUT_OF_RANGE_COLUMN] = out_of_range(features, _worker['features'])
+    return listings
+
+
+def iter_chunks(path, chunk_size):
+    """Yield DataFrames of at most `chunk_size` listings from a CSV or Parquet file"""
+    if str(path).endswith('.parquet'):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def _scored_chunks(chunks, workers, model_path, features_path):
+    """Score chunks in order, in-process or in a pool with at most 2 * workers chunks in flight"""
+    if workers <= 1:
+        _init_worker(model_path, features_path)
+        for chunk in chunks:
+            yield _score_chunk(chunk)
+        return
+    n_threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_path, features_path, n_threads)) as executor:
+        pending = []
+        for chunk in chunks:
+            pending.append(executor.submit(_score_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def score_file(input_path, output_path, chunk_size=100_000, workers=1,
+               model_path=MODEL_PATH, features_path=FEATURES_PATH, metrics=NO_METRICS):
+    """
+    Score every listing of `input_path` and write them with predictions to `output_path`
+
+    Args:
+        input_path (str): CSV or Parquet file of listings
+        output_path (str): CSV or Parquet file to write (by extension)
+        chunk_size (int): Listings per `predict` call
+        workers (int): Scoring processes; 1 scores in-process
+        model_path (str): Exported pipeline
+        features_path (str): Feature description saved next to the pipeline
+        metrics (Metrics): Receives the "score" (read, features, predict) and "write" timings per chunk
+
+    Returns:
+        int: Number of listings scored
+    """
+    started = time.perf_counter()
+    to_parquet = str(output_path).endswith('.parquet')
+    writer = None
+    total = 0
+    try:
+        chunks = iter(_scored_chunks(iter_chunks(input_path, chunk_size), workers, model_path, features_path))
+        while True:
+            # Reading, feature derivation and predict of one chunk (in the workers when workers > 1)
+            with metrics.stage("score"):
+                scored = next(chunks, None)
+            if scored is None:
+                break
+            with metrics.stage("write"):
+                if to_parquet:
+                    if writer is None:
+                        table = pa.Table.from_pandas(scored, preserve_index=False)
+                        writer = pq.ParquetWriter(output_path, table.schema, compression='zstd')
+                    else:
+                        table = pa.Table.from_pandas(scored, schema=writer.schema, preserve_index=False)
+                    writer.write_table(table)
+                else:
+                    scored.to_csv(output_path, mode='w' if total == 0 else 'a', header=total == 0, index=False)
+            metrics.count("listings", len(scored))
+            total += len(scored)
+            elapsed = time.perf_counter() - started
+            print(f"Scored {total} listings ({total / max(elapsed, 1e-9) * 60:,.0f} listings/min)")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    print(f"Wrote {total} predictions to {output_path} in {time.perf_counter() - started:.2f}s")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a file of listings with the exported XGBoost model")
+    parser.add_argument("input", help="CSV or Parquet file of listings")
+    parser.add_argument("output", help="CSV or Parquet file to write predictions to")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="Listings per predict call")
+    parser.add_argument("--workers", type=int, default=1, help="Scoring processes (1 = in-process)")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--features", default=FEATURES_PATH)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    with instrumented("batch_predict", args.metrics, args.trace_memory, args.profile) as metrics:
+        score_file(args.input, args.output, chunk_size=args.chunk_size, workers=args.workers,
+                   model_path=args.model, features_path=args.features, metrics=metrics)
@@ -0,0 +1,384 @@
+"""
+Compiled inference path for the XGBoost price model.
+
+`freeze()` turns the fitted sklearn pipeline into three files next to it:
+
+    xgboost_model.ubj           the booster, in XGBoost's native UBJSON format
+    xgboost_model_trees.npz     the same trees flattened into NumPy arrays
+    xgboost_model_frozen.json   the fitted preprocessing as plain numbers (Yeo-Johnson
+                                lambdas, RobustScaler centers/scales, one-hot category
+                                tables) plus the feature-derivation rules (title flag
+                                patterns, the address gazetteer, district price buckets)
+
+`CompiledModel` scores listing dicts with NumPy and the booster only: no
+pandas, no sklearn and no unpickling at start-up. Single listings (and
+other small batches) are scored by walking the trees in NumPy, which skips
+XGBoost's per-call overhead.
+
+Usage:
+    python compiled_model.py freeze     # write the frozen artifacts from xgboost_model.joblib
+    python compiled_model.py check      # parity with the joblib pipeline, and latency
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import xgboost as xgb
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(APP_DIR, '..', 'Data Preprocessing'))
+from gazetteer import Gazetteer, get_gazetteer
+
+BOOSTER_PATH = os.path.join(APP_DIR, 'xgboost_model.ubj')
+TREES_PATH = os.path.join(APP_DIR, 'xgboost_model_trees.npz')
+FROZEN_PATH = os.path.join(APP_DIR, 'xgboost_model_frozen.json')
+
+
+def freeze(pipeline, model_features, booster_path=BOOSTER_PATH, frozen_path=FROZEN_PATH, trees_path=TREES_PATH):
+    """
+    Write the booster and the fitted preprocessing of `pipeline` as plain artifacts
+
+    Args:
+        pipeline (Pipeline): The exported preprocessor + XGBRegressor pipeline
+        model_features (dict): Feature description, including the district price buckets
+        booster_path (str): Where to save the native booster
+        frozen_path (str): Where to save the preprocessing description
+        trees_path (str): Where to save the flattened trees
+
+    Returns:
+        dict: The frozen preprocessing description
+    """
+    # Only needed at export time; the runtime itself never imports it
+    from feature_store import TITLE_FLAGS
+
+    preprocessor = pipeline.named_steps['preprocessor']
+    transformers = {name: (transformer, columns) for name, transformer, columns in preprocessor.transformers_}
+    numeric, numeric_columns = transformers['num']
+    categorical, categorical_columns = transformers['cat']
+    # 0/1 features passed through unscaled (pipelines exported before this have none)
+    passthrough_columns = transformers.get('bin', (None, []))[1]
+    if set(transformers) - {'num', 'bin', 'cat', 'remainder'} or transformers.get('remainder', ('drop',))[0] != 'drop':
+        raise ValueError("Only a 'num' (+ 'bin') + 'cat' ColumnTransformer with dropped remainder can be frozen")
+    if dict((name, t) for name, t, _ in preprocessor.transformers).get('bin', 'passthrough') != 'passthrough':
+        raise ValueError("The 'bin' features must be passed through unchanged")
+
+    if 'onehot' not in categorical.named_steps:
+        raise ValueError("Only one-hot encoded categoricals can be frozen (not a --native-categorical export)")
+    power = numeric.named_steps['power']
+    scaler = numeric.named_steps['scaler']
+    onehot = categorical.named_steps['onehot']
+    if power.method != 'yeo-johnson' or onehot.drop is not None or onehot.handle_unknown != 'ignore':
+        raise ValueError("Unsupported transformer settings for freezing")
+
+    frozen = {
+        'numeric_features': list(numeric_columns),
+        'passthrough_features': list(passthrough_columns),
+        'categorical_features': list(categorical_columns),
+        'power_lambdas': power.lambdas_.tolist(),
+        'power_mean': power._scaler.mean_.tolist() if power.standardize else None,
+        'power_scale': power._scaler.scale_.tolist() if power.standardize else None,
+        'scaler_center': scaler.center_.tolist() if scaler.with_centering else None,
+        'scaler_scale': scaler.scale_.tolist() if scaler.with_scaling else None,
+        'categories': {column: [str(c) for c in categories]
+                       for column, categories in zip(categorical_columns, onehot.categories_)},
+        'is_log_transformed': bool(model_features.get('is_log_transformed', False)),
+        'district_price_category': model_features['district_price_category'],
+        'title_flags': TITLE_FLAGS,
+        'gazetteer': {'names': get_gazetteer().names, 'district_of': get_gazetteer().district_of},
+        'booster': os.path.basename(booster_path),
+        'trees': os.path.basename(trees_path),
+    }
+    booster = pipeline.named_steps['regressor'].get_booster()
+    booster.save_model(booster_path)
+    TreeEnsemble.from_booster(booster).save(trees_path)
+    with open(frozen_path, 'w', encoding='utf-8') as f:
+        json.dump(frozen, f, ensure_ascii=False, indent=1)
+    print(f"Booster saved to {booster_path}, flattened trees to {trees_path}")
+    print(f"Frozen preprocessing saved to {frozen_path}")
+    return frozen
+
+
+def yeo_johnson(X, lambdas):
+    """Column-wise Yeo-Johnson transform, with the same float operations as sklearn's PowerTransformer"""
+    lambdas = np.asarray(lambdas, dtype=float)
+    log_pos = np.abs(lambdas) < np.spacing(1.0)
+    log_neg = np.abs(lambdas - 2) <= np.spacing(1.0)
+    # Placeholders keep the unused branch free of divisions by zero
+    lam_pos = np.where(log_pos, 1.0, lambdas)
+    lam_neg = np.where(log_neg, 1.0, 2 - lambdas)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        positive = np.where(log_pos, np.log1p(X), (np.power(X + 1, lam_pos) - 1) / lam_pos)
+        negative = np.where(log_neg, -np.log1p(-X), -(np.power(-X + 1, lam_neg) - 1) / lam_neg)
+    # NaN compares False and stays NaN through the negative branch
+    return np.where(X >= 0, positive, negative)
+
+
+class TreeEnsemble:
+    """
+    The booster's trees as flat NumPy arrays, evaluated level by level for all trees at once
+
+    For one or a few listings this avoids XGBoost's per-call overhead. Leaves
+    point to themselves, so every row can take `depth` steps; leaf values are
+    accumulated in float32 in tree order, as XGBoost does, so predictions are
+    bit-identical to `Booster.inplace_predict`.
+    """
+
+    ARRAYS = ('left', 'right', 'features', 'conditions', 'default_left', 'roots')
+
+    def __init__(self, arrays, base_score, n_features, depth):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.base_score = np.float32(base_score)
+        self.n_features = int(n_features)
+        self.depth = int(depth)
+
+    @classmethod
+    def from_booster(cls, booster):
+        learner = json.loads(booster.save_raw('json'))['learner']
+        if learner['objective']['name'] != 'reg:squarederror':
+            raise ValueError("Only reg:squarederror boosters can be evaluated without XGBoost")
+        trees = learner['gradient_booster']['model']['trees']
+
+        left, right, features, conditions, default_left, roots = [], [], [], [], [], []
+        offset, depth = 0, 0
+        for tree in trees:
+            children_left = np.array(tree['left_children'])
+            children_right = np.array(tree['right_children'])
+            nodes = np.arange(len(children_left))
+            is_leaf = children_left == -1
+            left.append(np.where(is_leaf, nodes, children_left) + offset)
+            right.append(np.where(is_leaf, nodes, children_right) + offset)
+            features.append(np.where(is_leaf, 0, tree['split_indices']))
+            conditions.append(tree['split_conditions'])  # leaf values for leaves
+            default_left.append(tree['default_left'])
+            roots.append(offset)
+            offset += len(nodes)
+            depth = max(depth, _tree_depth(children_left, children_right))
+
+        arrays = {
+            'left': np.concatenate(left).astype(np.intp),
+            'right': np.concatenate(right).astype(np.intp),
+            'features': np.concatenate(features).astype(np.intp),
+            'conditions': np.concatenate(conditions).astype(np.float32),
+            'default_left': np.concatenate(default_left).astype(bool),
+            'roots': np.array(roots, dtype=np.intp),
+        }
+        base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+        return cls(arrays, base_score, learner['learner_model_param']['num_feature'], depth)
+
+    def save(self, path):
+        np.savez(path, base_score=self.base_score, n_features=self.n_features, depth=self.depth,
+                 **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            arrays = {name: data[name].astype(np.intp) if data[name].dtype.kind == 'i' else data[name]
+                      for name in cls.ARRAYS}
+            return cls(arrays, data['base_score'], data['n_features'], data['depth'])
+
+    def predict(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n = len(X)
+        values = X.ravel()
+        row_offsets = (np.arange(n) * self.n_features)[:, None]
+        nodes = np.broadcast_to(self.roots, (n, len(self.roots))).copy()
+        for _ in range(self.depth):
+            x = values[row_offsets + self.features[nodes]]
+            go_left = (x < self.conditions[nodes]) | (np.isnan(x) & self.default_left[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        margins = np.concatenate([np.full((n, 1), self.base_score, dtype=np.float32), self.conditions[nodes]], axis=1)
+        return np.cumsum(margins, axis=1, dtype=np.float32)[:, -1]
+
+
+def _tree_depth(left, right):
+    depth, level = 0, [0]
+    while True:
+        level = [child for node in level if left[node] != -1 for child in (left[node], right[node])]
+        if not level:
+            return depth
+        depth += 1
+
+
+def _number(value, area=False):
+    """Numbers pass through; raw strings are parsed like parsing.parse_area / parse_count"""
+    if value is None:
+        return math.nan
+    if not isinstance(value, str):
+        return float(value)
+    if area:
+        match = re.search(r'(\d+(?:\.\d+)?)', value.replace('.', '').replace(',', '.'))
+    else:
+        match = re.search(r'(\d+)', value)
+    return float(match.group(1)) if match else math.nan
+
+
+class CompiledModel:
+    """
+    Frozen pipeline: derives features for listing dicts and scores them with the native booster
+
+    Listings take the same fields as batch_predict.py: `area`, `bedrooms`,
+    `floors`, `district` and/or `address`, optionally `address_complete` and `title`.
+    """
+
+    def __init__(self, frozen, booster, trees, n_threads=1, small_batch=4):
+        self.numeric_features = frozen['numeric_features']
+        self.passthrough_features = frozen.get('passthrough_features', [])
+        self.categorical_features = frozen['categorical_features']
+        self.lambdas = frozen['power_lambdas']
+        self.power_mean = None if frozen['power_mean'] is None else np.array(frozen['power_mean'])
+        self.power_scale = None if frozen['power_scale'] is None else np.array(frozen['power_scale'])
+        self.center = None if frozen['scaler_center'] is None else np.array(frozen['scaler_center'])
+        self.scale = None if frozen['scaler_scale'] is None else np.array(frozen['scaler_scale'])
+        self.category_index = {column: {c: i for i, c in enumerate(categories)}
+                               for column, categories in frozen['categories'].items()}
+        self.width = len(self.numeric_features) + len(self.passthrough_features) + sum(len(c) for c in frozen['categories'].values())
+        self.is_log_transformed = frozen['is_log_transformed']
+        self.district_price_category = frozen['district_price_category']
+        self.title_flags = {flag: re.compile(pattern, re.IGNORECASE) for flag, pattern in frozen['title_flags'].items()}
+        self.gazetteer = Gazetteer(frozen['gazetteer']['names'], frozen['gazetteer']['district_of'])
+        self.booster = booster
+        self.booster.set_param({'nthread': n_threads})
+        self.trees = trees
+        self.small_batch = small_batch
+
+    @classmethod
+    def load(cls, frozen_path=FROZEN_PATH, n_threads=1):
+        with open(frozen_path, encoding='utf-8') as f:
+            frozen = json.load(f)
+        directory = os.path.dirname(frozen_path)
+        booster = xgb.Booster(model_file=os.path.join(directory, frozen['booster']))
+        trees = TreeEnsemble.load(os.path.join(directory, frozen['trees']))
+        return cls(frozen, booster, trees, n_threads)
+
+    def derive(self, listing):
+        """Raw feature values of one listing: (numeric values by name, categorical values by name)"""
+        area = _number(listing.get('area'), area=True)
+        bedrooms = _number(listing.get('bedrooms'))
+        title = listing.get('title')
+        title = title if isinstance(title, str) else ''
+
+        district = listing.get('district')
+        address_complete = listing.get('address_complete')
+        address = listing.get('address')
+        if isinstance(address, str) and (district is None or address_complete is None):
+            parts = self.gazetteer.resolve(address)
+            if district is None:
+                district = parts['district']
+            if address_complete is None:
+                address_complete = int(all(parts[part] for part in ('road', 'ward', 'district'))
+                                       and not parts['district_inferred'])
+
+        values = {
+            'area': area,
+            'bedrooms': bedrooms,
+            'floors': _number(listing.get('floors')),
+            'address_complete': 1.0 if address_complete is None else float(address_complete),
+            'bedroom_per_area': float(np.divide(bedrooms, area)),
+            'district': district,
+            'district_price_category': self.district_price_category.get(district),
+        }
+        for flag, pattern in self.title_flags.items():
+            values[flag] = float(pattern.search(title) is not None)
+        return values
+
+    def transform(self, listings):
+        """Model input matrix for a list of listing dicts"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rows = [self.derive(listing) for listing in listings]
+        n_numeric = len(self.numeric_features)
+        X = np.zeros((len(rows), self.width))
+        numeric = np.array([[row[name] for name in self.numeric_features] for row in rows], dtype=float)
+        numeric = yeo_johnson(numeric, self.lambdas)
+        if self.power_mean is not None:
+            numeric = (numeric - self.power_mean) / self.power_scale
+        if self.center is not None:
+            numeric -= self.center
+        if self.scale is not None:
+            numeric /= self.scale
+        X[:, :n_numeric] = numeric
+        offset = n_numeric + len(self.passthrough_features)
+        X[:, n_numeric:offset] = [[row[name] for name in self.passthrough_features] for row in rows]
+
+        for column in self.categorical_features:
+            index = self.category_index[column]
+            for i, row in enumerate(rows):
+                position = index.get(row[column])
+                if position is not None:  # unknown categories encode as all zeros
+                    X[i, offset + position] = 1.0
+            offset += len(index)
+        return X
+
+    def predict(self, listings):
+        """Predicted prices (millions of VND) for a list of listing dicts"""
+        X = self.transform(listings)
+        # NumPy tree walk for a few listings, XGBoost's own predictor for larger batches
+        predictions = self.trees.predict(X) if len(X) <= self.small_batch else self.booster.inplace_predict(X)
+        if self.is_log_transformed:
+            predictions = np.expm1(predictions)
+        return predictions
+
+
+def freeze_joblib():
+    """Freeze the current xgboost_model.joblib / model_features.pkl"""
+    from batch_predict import load_model
+    model, model_features = load_model()
+    freeze(model, model_features)
+
+
+def check_parity(n=2000):
+    """Compare the compiled path with the joblib pipeline on processed listings, and time both"""
+    import pandas as pd
+    from batch_predict import load_model, predict_prices
+
+    df = pd.read_csv(os.path.join(APP_DIR, '..', 'Data Preprocessing', 'alonhadat_processed.csv'),
+                     usecols=['area', 'bedrooms', 'floors', 'address', 'district', 'address_complete', 'title'])
+    df = df.sample(n=min(n, len(df)), random_state=42).reset_index(drop=True)
+
+    started = time.perf_counter()
+    compiled = CompiledModel.load()
+    cold_compiled = time.perf_counter() - started
+    started = time.perf_counter()
+    model, model_features = load_model()
+    cold_pipeline = time.perf_counter() - started
+
+    processed = df.drop(columns=['address']).astype(object).where(df.drop(columns=['address']).notna(), None)
+    raw = df[['area', 'bedrooms', 'floors', 'address', 'title']]
+    for label, frame in (("processed rows", processed), ("raw address rows", raw)):
+        listings = frame.to_dict('records')
+        expected = predict_prices(model, model_features, pd.DataFrame(listings))
+        batched = compiled.predict(listings)
+        one_by_one = np.concatenate([compiled.predict([listing]) for listing in listings])
+        for path, actual in (("batched", batched), ("one by one", one_by_one)):
+            diff = np.abs(expected - actual)
+            status = "ok" if np.allclose(expected, actual, rtol=1e-5, equal_nan=True) else "MISMATCH"
+            print(f"{label:<17} {path:<11} {len(listings)} listings, max abs diff {np.nanmax(diff):.6f}, "
+                  f"max rel diff {np.nanmax(diff / np.abs(expected)):.2e}  {status}")
+
+    listing = processed.iloc[0].to_dict()
+    for label, predict in (("pipeline", lambda: predict_prices(model, model_features, pd.DataFrame([listing]))),
+                           ("compiled", lambda: compiled.predict([listing]))):
+        timings = []
+        for _ in range(200):
+            started = time.perf_counter()
+            predict()
+            timings.append(time.perf_counter() - started)
+        p50, p99 = np.percentile(timings, [50, 99]) * 1e6
+        print(f"{label:<9} single listing: p50 {p50:,.0f} us, p99 {p99:,.0f} us")
+    print(f"Cold start: pipeline {cold_pipeline * 1000:,.0f} ms, compiled {cold_compiled * 1000:,.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Freeze the XGBoost pipeline or check the frozen artifacts")
+    parser.add_argument("command", choices=["freeze", "check"])
+    args = parser.parse_args()
+
+    if args.command == "freeze":
+        freeze_joblib()
+    else:
+        check_parity()
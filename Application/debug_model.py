@@ -1,10 +1,10 @@
 import pandas as pd
 import numpy as np
-import joblib
-import pickle
 import os
 import sys
 
+from model_registry import get_registry
+
 def debug_prediction(area=100, bedrooms=3, floors=4, district="Đống Đa", 
                     is_main_road=1, is_corner=1, has_car_access=1):
     """
@@ -36,10 +36,11 @@ def debug_prediction(area=100, bedrooms=3, floors=4, district="Đống Đa",
     print(f"  Is corner property: {'Yes' if is_corner else 'No'}")
     print(f"  Has car access: {'Yes' if has_car_access else 'No'}")
     
+    registry = get_registry()
+
     # Load model features
     try:
-        with open('model_features.pkl', 'rb') as f:
-            model_features = pickle.load(f)
+        model_features = registry.features()
         print("\nModel features loaded successfully!")
         numeric_features = model_features['numeric_features']
         categorical_features = model_features['categorical_features']
@@ -51,21 +52,16 @@ def debug_prediction(area=100, bedrooms=3, floors=4, district="Đống Đa",
         print(f"\nERROR: Could not load model features: {e}")
         return
         
-    # Load the trained model
+    # Load the trained model (XGBoost first, falling back to KNN)
     try:
-        # Try loading the XGBoost model first
-        model = joblib.load('xgboost_model.joblib')
-        model_type = "XGBoost"
-        print(f"\n{model_type} model loaded successfully!")
+        model, model_type = registry.model()
+        if model_type == "XGBoost":
+            print(f"\n{model_type} model loaded successfully!")
+        else:
+            print(f"\nXGBoost model not found, using {model_type} model instead.")
     except Exception as e:
-        # Fall back to KNN model
-        try:
-            model = joblib.load('knn_model.joblib')
-            model_type = "KNN"
-            print(f"\nXGBoost model not found, using {model_type} model instead: {e}")
-        except Exception as e2:
-            print(f"\nERROR: Could not load any model: {e2}")
-            return
+        print(f"\nERROR: Could not load any model: {e}")
+        return
     
     # Prepare input data
     print("\nPreparing input data...")
@@ -0,0 +1,147 @@
+"""
+Load test for the prediction service in serve.py.
+
+Sends single-listing POST /predict requests at a fixed request rate from a
+pool of keep-alive connections (open loop: requests are scheduled on a
+clock, so a slow server shows up as latency rather than as a lower send
+rate). Listings are sampled from the processed alonhadat data. Prints the
+client-side latency percentiles and the server's /metrics.
+
+Usage:
+    python load_test.py --spawn --rps 300 --duration 20
+    python load_test.py --spawn --runtime pipeline --rps 300 --duration 20
+    python load_test.py --url http://127.0.0.1:8000 --rps 300 --duration 20 --connections 32
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+PROCESSED_CSV = os.path.join(APP_DIR, '..', 'Data Preprocessing', 'alonhadat_processed.csv')
+
+
+def sample_payloads(n=1000, seed=42):
+    """JSON bodies of single listings drawn from the processed data"""
+    df = pd.read_csv(PROCESSED_CSV, usecols=['area', 'bedrooms', 'floors', 'address', 'title']).dropna()
+    df = df.sample(n=min(n, len(df)), random_state=seed)
+    return [json.dumps(row, ensure_ascii=False).encode('utf-8') for row in df.to_dict('records')]
+
+
+def spawn_server(port=None, runtime="compiled"):
+    """Start serve.py in a subprocess and wait until /health answers"""
+    if port is None:
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+    process = subprocess.Popen([sys.executable, '-W', 'ignore', os.path.join(APP_DIR, 'serve.py'), '--port', str(port),
+                                '--runtime', runtime],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            get_json(url, '/health')
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Prediction server did not start")
+
+
+def get_json(url, path):
+    parsed = urlparse(url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=5)
+    try:
+        conn.request('GET', path)
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+
+def run_load(url, payloads, rps, duration, connections):
+    """
+    Send `rps * duration` requests on a fixed schedule
+
+    Returns:
+        tuple: (latencies in ms, error count, wall time in seconds)
+    """
+    parsed = urlparse(url)
+    total = int(rps * duration)
+    schedule = iter(range(total))
+    schedule_lock = threading.Lock()
+    latencies, errors = [], []
+    start = time.perf_counter() + 0.1
+
+    def worker():
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=10)
+        while True:
+            with schedule_lock:
+                i = next(schedule, None)
+            if i is None:
+                break
+            due = start + i / rps
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                conn.request('POST', '/predict', body=payloads[i % len(payloads)],
+                             headers={'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=10)
+                ok = False
+            # Latency counts from the scheduled send time, so queueing in the client is included
+            latencies.append((time.perf_counter() - due) * 1000.0)
+            if not ok:
+                errors.append(i)
+        conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies), len(errors), time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the prediction service")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--spawn", action="store_true", help="Start serve.py on a free port for the test")
+    parser.add_argument("--runtime", choices=["pipeline", "compiled"], default="compiled",
+                        help="Runtime of the spawned server")
+    parser.add_argument("--rps", type=float, default=300, help="Target requests per second")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to run")
+    parser.add_argument("--connections", type=int, default=32, help="Concurrent keep-alive connections")
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if args.spawn:
+        process, url = spawn_server(runtime=args.runtime)
+    try:
+        payloads = sample_payloads()
+        get_json(url, '/health')
+        print(f"Sending {int(args.rps * args.duration)} requests at {args.rps:g} req/s "
+              f"over {args.connections} connections to {url}")
+        latencies, errors, elapsed = run_load(url, payloads, args.rps, args.duration, args.connections)
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        print(f"Achieved {len(latencies) / elapsed:,.0f} req/s, {errors} errors")
+        print(f"Client latency: p50 {p50:.2f} ms, p90 {p90:.2f} ms, p99 {p99:.2f} ms, max {latencies.max():.2f} ms")
+        print("Server metrics:", json.dumps(get_json(url, '/metrics'), indent=2))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
@@ -0,0 +1,119 @@
+"""
+Process-wide cache of the model artifacts in Application/.
+
+Streamlit re-runs app.py on every interaction. Loading through this module
+deserializes `xgboost_model.joblib` and `model_features.pkl` once per
+process and hands back the same objects afterwards. An artifact is reloaded
+only when its file changes on disk: its mtime and size are checked at most
+every `check_interval` seconds, and a changed stat whose SHA-256 is still
+the same (a `touch`, a re-copy of the same export) keeps the loaded object.
+"""
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+import joblib
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+FEATURES_FILE = 'model_features.pkl'
+# Tried in order; the first one that loads is used
+MODEL_CANDIDATES = [("XGBoost", 'xgboost_model.joblib'), ("KNN", 'knn_model.joblib')]
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+class ModelRegistry:
+    """
+    Thread-safe cache of loaded artifacts, keyed by file path
+
+    Args:
+        app_dir (str): Directory relative file names are resolved against
+        check_interval (float): Seconds between stat checks of a cached file
+    """
+
+    def __init__(self, app_dir=APP_DIR, check_interval=2.0):
+        self.app_dir = app_dir
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.loads = 0
+
+    def path(self, filename):
+        return filename if os.path.isabs(filename) else os.path.join(self.app_dir, filename)
+
+    def get(self, filename, loader):
+        """
+        Return the loaded artifact, calling `loader(path)` only if the file is new or changed
+
+        Raises whatever `loader` or `os.stat` raise (e.g. FileNotFoundError).
+        """
+        path = self.path(filename)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and now - entry['checked'] < self.check_interval:
+                return entry['value']
+
+            stat = os.stat(path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if entry is not None and entry['signature'] == signature:
+                entry['checked'] = now
+                return entry['value']
+
+            digest = file_sha256(path)
+            if entry is not None and entry['sha256'] == digest:
+                entry.update(signature=signature, checked=now)
+                return entry['value']
+
+            value = loader(path)
+            self.entries[path] = {'value': value, 'signature': signature, 'sha256': digest, 'checked': now}
+            self.loads += 1
+            return value
+
+    def features(self, filename=FEATURES_FILE):
+        """Feature description saved by export_model.py"""
+        return self.get(filename, load_pickle)
+
+    def model(self, candidates=MODEL_CANDIDATES):
+        """
+        Load the first available model
+
+        Returns:
+            tuple: (model, model_type); raises the last load error if no candidate loads
+        """
+        error = None
+        for model_type, filename in candidates:
+            try:
+                return self.get(filename, joblib.load), model_type
+            except Exception as e:
+                error = e
+        raise error
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(app_dir=APP_DIR):
+    """The process-wide registry for `app_dir`"""
+    with _registries_lock:
+        if app_dir not in _registries:
+            _registries[app_dir] = ModelRegistry(app_dir)
+        return _registries[app_dir]
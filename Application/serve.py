@@ -0,0 +1,294 @@
+"""
+JSON prediction service for the exported XGBoost pipeline.
+
+The model is loaded once at startup. Concurrent requests are queued and a
+single batching thread coalesces them into one `predict` call (up to
+`--max-batch` listings, waiting at most `--max-wait-ms` for more to arrive
+after the first one), so the per-call pandas/sklearn overhead is paid once
+per batch instead of once per listing.
+
+Listings use the same fields as batch_predict.py: `area`, `bedrooms`,
+`floors`, and `district` and/or `address`, optionally `title`.
+
+Endpoints:
+    POST /predict   {"area": 80, "bedrooms": 3, "floors": 4, "address": "..."}
+                    -> {"predicted_price": 8123.4}
+                    {"listings": [{...}, {...}]}
+                    -> {"predicted_prices": [8123.4, ...]}
+    GET  /metrics   request/batch counters and p50/p90/p99 latency in ms
+    GET  /health
+
+Usage:
+    python serve.py --port 8000
+    python serve.py --port 8000 --runtime pipeline   # score with the joblib sklearn pipeline instead
+    python load_test.py --url http://127.0.0.1:8000 --rps 300 --duration 20
+"""
+import argparse
+import json
+import math
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from batch_predict import FEATURES_PATH, MODEL_PATH, load_model, predict_prices
+from compiled_model import FROZEN_PATH, CompiledModel
+from model_registry import get_registry
+
+REQUIRED_FIELDS = ('area', 'bedrooms', 'floors')
+# Numbers, or raw strings such as "80 m2" / "4 phòng ngủ"
+NUMERIC_FIELDS = REQUIRED_FIELDS + ('address_complete',)
+TEXT_FIELDS = ('district', 'address', 'title')
+
+
+class LatencyStats:
+    """Thread-safe counters and a sliding window of recent latencies"""
+
+    def __init__(self, window=10_000):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+
+    def record(self, seconds, error=False):
+        with self.lock:
+            self.latencies.append(seconds * 1000.0)
+            self.count += 1
+            self.errors += int(error)
+
+    def snapshot(self):
+        with self.lock:
+            window = np.array(self.latencies)
+            count, errors = self.count, self.errors
+        summary = {'count': count, 'errors': errors}
+        if len(window):
+            p50, p90, p99 = np.percentile(window, [50, 90, 99])
+            summary.update({'p50_ms': round(p50, 3), 'p90_ms': round(p90, 3), 'p99_ms': round(p99, 3),
+                            'max_ms': round(float(window.max()), 3)})
+        return summary
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent prediction requests into batched `predict_fn` calls
+
+    Args:
+        predict_fn (callable): Takes a list of listing dicts, returns one prediction per listing
+        max_batch (int): Most listings per `predict_fn` call
+        max_wait (float): Seconds to wait for more requests after the first one
+    """
+
+    def __init__(self, predict_fn, max_batch=64, max_wait=0.002):
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.batch_sizes = deque(maxlen=10_000)
+        self.predict_times = LatencyStats()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, listings):
+        """Queue a list of listing dicts; returns a Future of their predictions"""
+        future = Future()
+        self.requests.put((listings, future))
+        return future
+
+    def _collect(self):
+        """Block for one request, then take more until the batch is full or `max_wait` has passed"""
+        batch = [self.requests.get()]
+        size = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            rows = [listing for listings, _ in batch for listing in listings]
+            started = time.perf_counter()
+            try:
+                predictions = np.asarray(self.predict_fn(rows), dtype=float).tolist()
+            except Exception:
+                # One bad request must not fail the others batched with it: score each on its own
+                self._run_separately(batch)
+                continue
+            finally:
+                self.predict_times.record(time.perf_counter() - started)
+                self.batch_sizes.append(len(rows))
+            offset = 0
+            for listings, future in batch:
+                future.set_result(predictions[offset:offset + len(listings)])
+                offset += len(listings)
+
+    def _run_separately(self, batch):
+        for listings, future in batch:
+            try:
+                future.set_result(np.asarray(self.predict_fn(listings), dtype=float).tolist())
+            except Exception as e:
+                future.set_exception(e)
+
+
+def validate_listing(listing):
+    """Return an error message for a malformed listing, or None"""
+    if not isinstance(listing, dict):
+        return "each listing must be a JSON object"
+    missing = [field for field in REQUIRED_FIELDS if listing.get(field) is None]
+    if listing.get('district') is None and listing.get('address') is None:
+        missing.append('district or address')
+    if missing:
+        return f"missing fields: {', '.join(missing)}"
+    for field in NUMERIC_FIELDS:
+        value = listing.get(field)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            return f"'{field}' must be a number"
+        if isinstance(value, str) and not re.search(r'\d', value):
+            return f"'{field}' has no number: {value!r}"
+        if isinstance(value, float) and not math.isfinite(value):
+            return f"'{field}' must be finite"
+    for field in TEXT_FIELDS:
+        if listing.get(field) is not None and not isinstance(listing[field], str):
+            return f"'{field}' must be a string"
+    return None
+
+
+def make_handler(batcher, stats, timeout=10.0):
+    class PredictionHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive for integrators reusing connections
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.send_json(200, {'status': 'ok'})
+            elif self.path == '/metrics':
+                sizes = list(batcher.batch_sizes)
+                self.send_json(200, {
+                    'requests': stats.snapshot(),
+                    'predict_calls': batcher.predict_times.snapshot(),
+                    'batch_size': {'mean': round(float(np.mean(sizes)), 2) if sizes else 0,
+                                   'max': max(sizes, default=0)},
+                    'queue_depth': batcher.requests.qsize(),
+                })
+            else:
+                self.send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            started = time.perf_counter()
+            if self.path != '/predict':
+                self.send_json(404, {'error': 'not found'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+            except ValueError:
+                length = -1
+            if length < 0:
+                self.send_json(400, {'error': 'invalid Content-Length'})
+                stats.record(time.perf_counter() - started, error=True)
+                self.close_connection = True  # the body cannot be skipped without a length
+                return
+            try:
+                payload = json.loads(self.rfile.read(length) or b'null')
+            except (ValueError, UnicodeDecodeError):
+                self.send_json(400, {'error': 'invalid JSON'})
+                stats.record(time.perf_counter() - started, error=True)
+                return
+
+            single = not (isinstance(payload, dict) and 'listings' in payload)
+            listings = [payload] if single else payload['listings']
+            errors = [validate_listing(listing) for listing in listings] if isinstance(listings, list) else ["'listings' must be a list"]
+            error = next((e for e in errors if e), None) if listings else "no listings given"
+            if error:
+                self.send_json(400, {'error': error})
+                stats.record(time.perf_counter() - started, error=True)
+                return
+
+            try:
+                predictions = batcher.submit(listings).result(timeout=timeout)
+            except Exception as e:
+                self.send_json(500, {'error': str(e)})
+                stats.record(time.perf_counter() - started, error=True)
+                return
+            self.send_json(200, {'predicted_price': predictions[0]} if single else {'predicted_prices': predictions})
+            stats.record(time.perf_counter() - started)
+
+        def log_message(self, format, *args):
+            pass
+
+    return PredictionHandler
+
+
+def load_predict_fn(runtime="compiled", model_path=MODEL_PATH, features_path=FEATURES_PATH):
+    """
+    Prediction function over a list of listing dicts
+
+    Args:
+        runtime (str): "pipeline" for the joblib sklearn pipeline, "compiled" for
+            the frozen artifacts of compiled_model.py (no pandas/sklearn per call)
+    """
+    if runtime == "compiled":
+        compiled = get_registry().get(FROZEN_PATH, CompiledModel.load)
+        return compiled.predict
+    model, model_features = load_model(model_path, features_path)
+    # Batches are small; XGBoost's thread pool costs more than it saves here
+    model.named_steps['regressor'].set_params(n_jobs=1)
+    return lambda listings: predict_prices(model, model_features, pd.DataFrame(listings))
+
+
+def start_server(host="127.0.0.1", port=8000, model_path=MODEL_PATH, features_path=FEATURES_PATH,
+                 max_batch=64, max_wait_ms=2.0, runtime="compiled"):
+    """
+    Load the model and start serving on a background thread
+
+    Returns:
+        tuple: (server, base_url); call `server.shutdown()` when done
+    """
+    batcher = MicroBatcher(load_predict_fn(runtime, model_path, features_path),
+                           max_batch=max_batch, max_wait=max_wait_ms / 1000.0)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher, LatencyStats()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve price predictions over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch", type=int, default=64, help="Most listings per predict call")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="How long a batch waits for more requests")
+    parser.add_argument("--runtime", choices=["pipeline", "compiled"], default="compiled",
+                        help="sklearn pipeline (joblib) or the frozen compiled_model.py artifacts")
+    parser.add_argument("--model", default=MODEL_PATH, help="Joblib pipeline (with --runtime pipeline)")
+    parser.add_argument("--features", default=FEATURES_PATH, help="Feature description (with --runtime pipeline)")
+    args = parser.parse_args()
+
+    server, url = start_server(args.host, args.port, args.model, args.features, args.max_batch, args.max_wait_ms,
+                               args.runtime)
+    print(f"Serving predictions at {url}/predict (metrics at {url}/metrics)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
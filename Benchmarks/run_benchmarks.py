@@ -0,0 +1,465 @@
+"""
+Benchmark suite for the pipeline's hot paths, with a result history.
+
+Every benchmark runs on the repo's own data, scaled to `--rows` listings:
+
+    crawl_parse         crawl_alonhadat_page over saved alonhadat pages, served in-process
+                        (HTTP decoding and HTML parsing, no network)
+    merge_alonhadat     alonhadat.com/merge.py    \\
+    merge_nhatot        nhatot.com/merge.py        > crawl records written as page files, merged to CSV
+    merge_batdongsan    batdongsan.com/merge.py   /
+    parse_alonhadat     parsing.py on raw alonhadat fields (address, price, area, floors, bedrooms)
+    parse_nhatot        parsing.py on nhatot.csv (price, price per m², space, description, location)
+    export_features     export_model.py's feature derivation (feature_store definitions, IQR outlier filter)
+    export_fit          export_model.py's preprocessing + XGBoost fit on those features
+    predict_single      xgboost_model.joblib, one `predict` call per listing (as app.py does)
+    predict_batch       xgboost_model.joblib, one `predict` call for all listings (as batch_predict.py does)
+
+Inputs larger than the data are scaled up synthetically: the extra rows are
+resampled from the real ones, with the numbers in their prices and areas
+jittered by up to ±10% and a house number added to their addresses, so the
+distinct values (which the vectorized parsers work on) grow as they would
+in a larger crawl. Setup is not timed; each benchmark reports the best and
+median of `--repeat` runs.
+
+Results are appended to `history.jsonl` (commit, machine, library versions
+and per-benchmark timings) and compared with the latest earlier run at the
+same `--rows` on the same machine, or with the run of `--baseline <commit>`.
+`--max-regression 0.2` exits with status 1 when any benchmark got more than
+20% slower than the baseline, to block regressions in CI.
+
+Usage:
+    python run_benchmarks.py                                 # 20,000 rows, all benchmarks
+    python run_benchmarks.py --only merge parse --repeat 5
+    python run_benchmarks.py --rows 1000000 --repeat 1 --skip crawl_parse predict_single
+    python run_benchmarks.py --baseline 3746fc7 --max-regression 0.2 --no-save
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from importlib import util
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import requests
+import sklearn
+import xgboost as xgb
+from sklearn.pipeline import Pipeline
+
+ROOT = Path(__file__).resolve().parent.parent
+CRAWLER_DIR = ROOT / "Data Collection" / "Crawler"
+DATASETS_DIR = ROOT / "Data Collection" / "Datasets"
+for path in (CRAWLER_DIR, DATASETS_DIR, ROOT / "Data Preprocessing", ROOT / "Modeling" / "Alonhatot",
+             ROOT / "Application"):
+    sys.path.insert(0, str(path))
+import parsing
+from alonhadat_parsers import PARSERS
+from alonhadatcrawl import crawl_alonhadat_page
+from batch_predict import load_model, prepare_features
+from benchmark_parsers import load_pages
+from dataset_store import load_processed
+from export_model import build_preprocessor, load_xgb_params, train_test_data
+from feature_store import OUTLIER_COLUMNS, add_derived_features, district_price_categories
+from instrumentation import add_arguments, instrumented
+from outliers import IQRFilter
+from segment_store import crawl_files
+from stream_merge import iter_records
+
+HISTORY_PATH = Path(__file__).resolve().parent / "history.jsonl"
+# Above every source's size, so a default run covers all the real data plus a synthetic share
+DEFAULT_ROWS = 20_000
+PAGE_SIZE = 20  # listings per alonhadat/nhatot search page
+BATDONGSAN_FILE_SIZE = 500  # listings per batdongsan crawl file
+VN_NUMBER_RE = re.compile(r"\d[\d.]*(?:,\d+)?")
+
+
+# --- Synthetic scale-up -------------------------------------------------------
+
+def jitter_number(text, factor):
+    """Multiply the first Vietnamese-formatted number of `text` ("7,5 tỷ", "1.111 m²") by `factor`"""
+    if not isinstance(text, str):
+        return text
+
+    def scale(match):
+        value = float(match.group(0).replace(".", "").replace(",", ".")) * factor
+        return f"{value:.2f}".rstrip("0").rstrip(".").replace(".", ",")
+    return VN_NUMBER_RE.sub(scale, text, count=1)
+
+
+def scale_frame(df, rows, seed=42, numeric=(), text_numbers=(), addresses=()):
+    """
+    `rows` rows drawn from `df`: a sample when smaller, otherwise `df` plus jittered resampled rows
+
+    Args:
+        df (pd.DataFrame): Real rows
+        rows (int): Rows to return
+        numeric (tuple): Numeric columns jittered by up to ±10% in the extra rows
+        text_numbers (tuple): Text columns whose first number is jittered in the extra rows
+        addresses (tuple): Address columns given a house number ("Số 12, ...") in the extra rows
+    """
+    df = df.reset_index(drop=True)
+    if rows <= len(df):
+        return df.sample(rows, random_state=seed).sort_index().reset_index(drop=True)
+    rng = np.random.default_rng(seed)
+    extra = df.iloc[rng.integers(0, len(df), rows - len(df))].reset_index(drop=True)
+    factors = rng.uniform(0.9, 1.1, len(extra))
+    for column in numeric:
+        extra[column] = (extra[column].astype("float64") * factors).round(1)
+    for column in text_numbers:
+        extra[column] = [jitter_number(value, factor) for value, factor in zip(extra[column], factors)]
+    for column in addresses:
+        numbers = rng.integers(1, 500, len(extra))
+        extra[column] = [f"Số {n}, {value}" if isinstance(value, str) else value
+                         for n, value in zip(numbers, extra[column].astype(object))]
+    return pd.concat([df.astype({c: object for c in addresses}), extra], ignore_index=True)
+
+
+def crawl_records(directory, pattern):
+    return [record for path in crawl_files(directory, pattern) for record in iter_records(path)]
+
+
+def cycled(records, rows):
+    return [records[i % len(records)] for i in range(rows)]
+
+
+def write_pages(records, directory, name, size, as_list=False):
+    """Write `records` as crawl output files of `size` records each (page_N.jsonl, or JSON lists)"""
+    directory.mkdir(parents=True, exist_ok=True)
+    for start in range(0, len(records), size):
+        page = records[start:start + size]
+        path = directory / name.format(n=start // size + 1)
+        with open(path, "w", encoding="utf-8") as f:
+            if as_list:
+                json.dump(page, f, ensure_ascii=False)
+            else:
+                f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in page)
+
+
+# --- Benchmarks ---------------------------------------------------------------
+# Each one prepares its input (untimed) and returns (run, items): `run()` is
+# the timed call and `items` the number of listings it processes (None when
+# `run()` returns that number itself).
+
+class PageSession:
+    """Stand-in for requests.Session answering every search-page request with a saved page"""
+
+    def __init__(self, pages):
+        self.pages = [html.encode("utf-8") for html in pages]
+
+    def get(self, url, headers=None, timeout=None):
+        page_num = int(re.search(r"trang--(\d+)\.html$", url).group(1))
+        response = requests.Response()
+        response.status_code = 200
+        response._content = self.pages[(page_num - 1) % len(self.pages)]
+        return response
+
+
+def bench_crawl_parse(rows, seed, args, workdir):
+    n_pages = math.ceil(rows / PAGE_SIZE)
+    with redirect_stdout(io.StringIO()):
+        session = PageSession(load_pages(str(DATASETS_DIR / "alonhadat.com" / "json"), n_pages))
+
+    def run():
+        with redirect_stdout(io.StringIO()):
+            return sum(len(crawl_alonhadat_page(page_num, session=session, interactive=False, parser=args.parser))
+                       for page_num in range(1, n_pages + 1))
+    # Pages hold 20 listings but a few saved ones fewer: the runs count what they parse
+    return run, None
+
+
+def load_merge_script(site):
+    spec = util.spec_from_file_location(f"merge_{site.split('.')[0]}", DATASETS_DIR / site / "merge.py")
+    module = util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_merge_alonhadat(rows, seed, args, workdir):
+    records = cycled(crawl_records(DATASETS_DIR / "alonhadat.com" / "json", "*.jsonl"), rows)
+    write_pages(records, workdir / "json", "page_{n}.jsonl", PAGE_SIZE)
+    merge = load_merge_script("alonhadat.com")
+    merge.jsonl_dir, merge.output_dir = workdir / "json", workdir / "raw"
+    return merge.main, rows
+
+
+def bench_merge_nhatot(rows, seed, args, workdir):
+    records = cycled(crawl_records(DATASETS_DIR / "nhatot.com" / "json", "*.json"), rows)
+    write_pages(records, workdir / "json", "page_{n}.json", PAGE_SIZE, as_list=True)
+    merge = load_merge_script("nhatot.com")
+    merge.json_dir, merge.output_dir = str(workdir / "json"), str(workdir / "raw")
+    return merge.main, rows
+
+
+def bench_merge_batdongsan(rows, seed, args, workdir):
+    records = cycled(crawl_records(DATASETS_DIR / "batdongsan.com" / "json", "*.jsonl"), rows)
+    write_pages(records, workdir / "json", "crawl_{n}.jsonl", BATDONGSAN_FILE_SIZE)
+    merge = load_merge_script("batdongsan.com")
+    return lambda: merge.merge_jsonl_to_csv(str(workdir / "json"), str(workdir / "raw"), "batdongsan.csv"), rows
+
+
+def bench_parse_alonhadat(rows, seed, args, workdir):
+    df = pd.DataFrame(crawl_records(DATASETS_DIR / "alonhadat.com" / "json", "*.jsonl"))
+    df = scale_frame(df, rows, seed, text_numbers=("price", "area"), addresses=("address",))
+
+    def run():
+        parsing.extract_address_components(df["address"])
+        parsing.parse_price(df["price"])
+        parsing.is_price_per_m2(df["price"])
+        parsing.parse_area(df["area"])
+        parsing.parse_count(df["floors"])
+        parsing.parse_count(df["bedrooms"])
+    return run, rows
+
+
+def bench_parse_nhatot(rows, seed, args, workdir):
+    df = pd.read_csv(DATASETS_DIR / "nhatot.com" / "raw" / "nhatot.csv", dtype=str)
+    df = scale_frame(df, rows, seed, text_numbers=("Price", "Price per m²", "Space"))
+
+    def run():
+        parsing.parse_nhatot_price(df["Price"])
+        parsing.parse_nhatot_price_per_m2(df["Price per m²"])
+        parsing.parse_nhatot_space(df["Space"])
+        parsing.split_nhatot_description(df["Description"])
+        parsing.split_nhatot_location(df["Location"])
+    return run, rows
+
+
+def processed_listings(rows, seed):
+    """Processed alonhadat listings scaled to `rows` (areas and addresses varied in the extra rows)"""
+    df = load_processed("alonhadat")
+    df = df.astype({column: object for column in df.select_dtypes("category").columns})
+    df = scale_frame(df, rows, seed, numeric=("area",), addresses=("address",))
+    df["price_per_m2"] = df["price_converted"] / df["area"]
+    return df
+
+
+def derive_features(df):
+    """The model's feature definitions as feature_store.build_features applies them (no spatial features)"""
+    df = add_derived_features(df.copy())
+    district_to_price_category = district_price_categories(df)
+    df["district_price_category"] = df["district"].map(district_to_price_category)
+    df["price_converted_log"] = np.log1p(df["price_converted"])
+    outlier_filter = IQRFilter(OUTLIER_COLUMNS).fit(df)
+    df["is_outlier"] = ~outlier_filter.inside(df)
+    return df
+
+
+def bench_export_features(rows, seed, args, workdir):
+    df = processed_listings(rows, seed)
+    return lambda: derive_features(df), rows
+
+
+def bench_export_fit(rows, seed, args, workdir):
+    df = derive_features(processed_listings(rows, seed))
+    df = df[~df["is_outlier"]]
+    X_train, _, y_train_log, _ = train_test_data(df)
+    with redirect_stdout(io.StringIO()):
+        xgb_params = load_xgb_params()
+
+    def run():
+        model = Pipeline([("preprocessor", build_preprocessor()), ("regressor", xgb.XGBRegressor(**xgb_params))])
+        model.fit(X_train, y_train_log)
+    return run, len(X_train)
+
+
+def model_inputs(rows, seed):
+    model, model_features = load_model()
+    features = prepare_features(processed_listings(rows, seed), model_features)
+    return model, features
+
+
+def bench_predict_single(rows, seed, args, workdir):
+    model, features = model_inputs(min(rows, args.single_rows), seed)
+    singles = [features.iloc[[i]] for i in range(len(features))]
+
+    def run():
+        for row in singles:
+            model.predict(row)
+    return run, len(singles)
+
+
+def bench_predict_batch(rows, seed, args, workdir):
+    model, features = model_inputs(rows, seed)
+    return lambda: model.predict(features), rows
+
+
+BENCHMARKS = {
+    "crawl_parse": bench_crawl_parse,
+    "merge_alonhadat": bench_merge_alonhadat,
+    "merge_nhatot": bench_merge_nhatot,
+    "merge_batdongsan": bench_merge_batdongsan,
+    "parse_alonhadat": bench_parse_alonhadat,
+    "parse_nhatot": bench_parse_nhatot,
+    "export_features": bench_export_features,
+    "export_fit": bench_export_fit,
+    "predict_single": bench_predict_single,
+    "predict_batch": bench_predict_batch,
+}
+
+
+# --- Runner and history -------------------------------------------------------
+
+def run_benchmark(name, rows, seed, args, metrics):
+    """Prepare one benchmark, then time `args.repeat` runs of it"""
+    with tempfile.TemporaryDirectory() as workdir:
+        run, items = BENCHMARKS[name](rows, seed, args, Path(workdir))
+        timings = []
+        for _ in range(args.repeat):
+            with redirect_stdout(io.StringIO()), metrics.stage(name):
+                started = time.perf_counter()
+                counted = run()
+                timings.append(time.perf_counter() - started)
+            items = counted if items is None else items
+            metrics.count("items", items)
+    best = min(timings)
+    return {"items": items, "best_seconds": round(best, 6), "median_seconds": round(float(np.median(timings)), 6),
+            "items_per_second": round(items / best, 1) if best else None}
+
+
+def git_commit():
+    """Short hash of HEAD, with "-dirty" when the tree has uncommitted changes (None outside a checkout)"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def machine():
+    """What results are only comparable on"""
+    return {"system": platform.system(), "machine": platform.machine(), "cpus": os.cpu_count(),
+            "python": platform.python_version()}
+
+
+def load_history(path=HISTORY_PATH):
+    if not Path(path).exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_baseline(history, rows, commit=None):
+    """Latest run of `commit` (any machine), or the latest run at `rows` rows on this machine"""
+    for entry in reversed(history):
+        if commit is not None:
+            if (entry.get("commit") or "").startswith(commit):
+                return entry
+        elif entry["rows"] == rows and entry["machine"] == machine():
+            return entry
+    return None
+
+
+def report(results, baseline=None):
+    """Print the results next to the baseline's; returns {name: relative change of the best time}"""
+    changes = {}
+    header = f"{'benchmark':<18}{'items':>10}{'best s':>10}{'median s':>10}{'items/s':>13}"
+    if baseline is not None:
+        print(f"Baseline: {baseline.get('commit')} ({baseline['timestamp']})\n")
+        header += f"{'baseline s':>12}{'change':>9}"
+    print(header)
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name:<18}failed: {result['error']}")
+            continue
+        line = (f"{name:<18}{result['items']:>10,}{result['best_seconds']:>10.3f}{result['median_seconds']:>10.3f}"
+                f"{result['items_per_second'] or 0:>13,.0f}")
+        previous = (baseline or {}).get("results", {}).get(name)
+        if previous is not None and previous.get("items") == result["items"]:
+            changes[name] = result["best_seconds"] / previous["best_seconds"] - 1
+            line += f"{previous['best_seconds']:>12.3f}{changes[name]:>+9.1%}"
+        elif baseline is not None:
+            line += f"{'-':>12}{'new':>9}"
+        print(line)
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing, merging, training and prediction")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="Listings per benchmark (up to 1M and beyond)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark (best and median reported)")
+    parser.add_argument("--only", nargs="+", help="Benchmarks to run, by name or prefix (e.g. merge)")
+    parser.add_argument("--skip", nargs="+", default=[], help="Benchmarks to leave out, by name or prefix")
+    parser.add_argument("--single-rows", type=int, default=1000, help="Listings predicted one at a time")
+    parser.add_argument("--parser", default="bs4", choices=["auto"] + sorted(PARSERS),
+                        help="HTML parser backend of crawl_parse (the crawler's default is bs4)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the synthetic scale-up")
+    parser.add_argument("--history", default=str(HISTORY_PATH), help="JSON lines file of past results")
+    parser.add_argument("--no-save", action="store_true", help="Do not append this run to the history")
+    parser.add_argument("--baseline", metavar="COMMIT", help="Compare with this commit's run instead of the last one")
+    parser.add_argument("--max-regression", type=float,
+                        help="Exit with status 1 if a benchmark is slower than the baseline by more than this "
+                             "fraction (e.g. 0.2)")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    selected = lambda name, prefixes: any(name.startswith(prefix) for prefix in prefixes)
+    names = [name for name in BENCHMARKS if (not args.only or selected(name, args.only))
+             and not selected(name, args.skip)]
+    if not names:
+        parser.error(f"no benchmark selected; available: {', '.join(BENCHMARKS)}")
+
+    print(f"{len(names)} benchmarks, {args.rows:,} rows, {args.repeat} runs each\n")
+    results = {}
+    with instrumented("benchmarks", args.metrics, args.trace_memory, args.profile) as metrics:
+        for name in names:
+            started = time.perf_counter()
+            try:
+                results[name] = run_benchmark(name, args.rows, args.seed, args, metrics)
+            except Exception as e:
+                results[name] = {"error": f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"}
+                print(f"{name:<18} failed: {results[name]['error']}")
+                continue
+            print(f"{name:<18} done in {time.perf_counter() - started:.1f}s")
+    print()
+
+    history = load_history(args.history)
+    baseline = find_baseline(history, args.rows, args.baseline)
+    if args.baseline and baseline is None:
+        print(f"No run of commit {args.baseline} in {args.history}")
+    changes = report(results, baseline)
+
+    if not args.no_save:
+        entry = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "machine": machine(),
+            "versions": {"pandas": pd.__version__, "numpy": np.__version__, "scikit-learn": sklearn.__version__,
+                         "xgboost": xgb.__version__},
+            "rows": args.rows,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "parser": args.parser,
+            "results": results,
+        }
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        print(f"\nResults appended to {args.history}")
+
+    failed = [name for name, result in results.items() if "error" in result]
+    if failed:
+        print(f"\nFailed: {', '.join(failed)}")
+        sys.exit(1)
+    if args.max_regression is not None:
+        regressions = {name: change for name, change in changes.items() if change > args.max_regression}
+        if regressions:
+            print(f"\nSlower than the baseline by more than {args.max_regression:.0%}: "
+                  + ", ".join(f"{name} ({change:+.1%})" for name, change in regressions.items()))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
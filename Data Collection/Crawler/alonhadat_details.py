@@ -0,0 +1,319 @@
+"""
+Detail-page enrichment for the alonhadat crawl.
+
+The search-result cards carry only a truncated summary, so `road_width`,
+`car_parking`, `orientation` and `dimension` are mostly empty. This stage
+reads the listing URLs from the crawl output (page files and segments) and
+fetches each listing's detail page once. Fetching uses a bounded pool of
+keep-alive sessions behind the per-host rate limiter, and `--max-requests`
+caps the number of requests per run. Listings are taken in crawl order, so
+the newest pages come first.
+
+Every response is cached gzip-compressed under
+`<details-dir>/cache/<sha1[:2]>/<sha1(url)>.html.gz`; removed listings
+(404/410) leave an empty `.gone` marker. Parsing reads only the cache, so a
+parser change is re-applied with `--max-requests 0` without any request.
+
+The parsed attributes (spec table, full description, address) are merged
+back into the crawl records by URL, with non-empty detail values taking
+precedence over the card's. The result is written to
+`<details-dir>/listings_enriched.jsonl` and `alonhadat.com/raw/alonhadat_enriched.csv`.
+
+The stage runs unchanged against the local fixture server, which serves a
+detail page for every saved listing:
+
+    python fixture_server.py --port 8765
+    python alonhadat_details.py --max-requests 500 --rate 100 --base-url http://127.0.0.1:8765 \\
+        --details-dir /tmp/details --csv /tmp/details/enriched.csv
+
+Usage:
+    python alonhadat_details.py                        # fetch up to 500 new detail pages, then merge
+    python alonhadat_details.py --max-requests 0       # re-parse the cache only
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from alonhadat_parsers import DETAIL_FIELDS, DETAIL_PARSERS, get_detail_parser, listing_url
+from alonhadatcrawl import HostRateLimiter, make_session
+
+DATASETS_DIR = Path(__file__).resolve().parent.parent / "Datasets"
+sys.path.insert(0, str(DATASETS_DIR))
+from segment_store import crawl_files
+from stream_merge import iter_records, merge_files_to_csv
+
+DEFAULT_CRAWL_DIR = DATASETS_DIR / "alonhadat.com" / "json"
+DEFAULT_DETAILS_DIR = DATASETS_DIR / "alonhadat.com" / "details"
+DEFAULT_CSV_PATH = DATASETS_DIR / "alonhadat.com" / "raw" / "alonhadat_enriched.csv"
+MAX_REQUESTS = 500
+GONE_STATUSES = (404, 410)
+# Columns of the enriched CSV: the search-result card fields, then every detail field. Fixed, so the
+# CSV has the same schema whichever fields this run's detail pages filled
+CARD_FIELDS = ["title", "url", "date", "area", "price", "floors", "bedrooms", "address",
+               "road_width", "car_parking", "description", "orientation", "dimension"]
+ENRICHED_FIELDS = list(dict.fromkeys(CARD_FIELDS + list(DETAIL_FIELDS.values())))
+
+
+class DetailCache:
+    """
+    Raw detail-page responses on disk, keyed by the SHA-1 of the listing URL
+
+    Args:
+        directory (str): Cache root; files go to `<sha1[:2]>/<sha1>.html.gz`
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, url, suffix=".html.gz"):
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return self.directory / digest[:2] / (digest + suffix)
+
+    def status(self, url):
+        """"cached", "gone" or None when the URL was never fetched successfully"""
+        if self.path(url).exists():
+            return "cached"
+        if self.path(url, ".gone").exists():
+            return "gone"
+        return None
+
+    def get(self, url):
+        """Cached HTML of `url`, or None"""
+        try:
+            with gzip.open(self.path(url), "rt", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path, payload):
+        # Write then rename, so an interrupted run never leaves a truncated page behind
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + f".{threading.get_ident()}.tmp")
+        tmp.write_bytes(payload)
+        os.replace(tmp, path)
+
+    def put(self, url, html):
+        self._write(self.path(url), gzip.compress(html.encode("utf-8"), compresslevel=6))
+
+    def mark_gone(self, url):
+        self._write(self.path(url, ".gone"), b"")
+
+
+def load_listings(crawl_dir=DEFAULT_CRAWL_DIR, pattern="*.jsonl"):
+    """
+    Latest crawl record of every listing, keyed by its URL
+
+    Returns:
+        dict: URL -> record, in the order the listings were first crawled
+    """
+    listings = {}
+    for path in crawl_files(crawl_dir, pattern):
+        for record in iter_records(path):
+            if record.get("url"):
+                url = listing_url(record["url"])
+                listings[url] = {**record, "url": url}
+    return listings
+
+
+def fetch_detail(url, session, base_url=None, rate_limiter=None, parse=None, max_retries=3, retry_delay=5):
+    """
+    Fetch one detail page
+
+    Args:
+        url (str): Listing URL (also the cache key)
+        session (requests.Session): Keep-alive session
+        base_url (str): Scheme and host to fetch from instead of the URL's own, e.g. a local fixture server
+        rate_limiter (HostRateLimiter): Politeness limiter consulted before every request
+        parse (callable): Detail parser used to recognise CAPTCHA pages
+
+    Returns:
+        tuple: (status, html) with status "ok", "gone", "captcha" or "error"
+    """
+    parse = parse or get_detail_parser()
+    if base_url:
+        parts = urlsplit(url)
+        url = base_url + parts.path + (f"?{parts.query}" if parts.query else "")
+    for attempt in range(max_retries):
+        try:
+            if rate_limiter is not None:
+                rate_limiter.wait(url)
+            response = session.get(url, timeout=30)
+            if response.status_code in GONE_STATUSES:
+                return "gone", None
+            response.raise_for_status()
+            response.encoding = "utf-8"
+            if parse(response.text)[0]:
+                return "captcha", None
+            return "ok", response.text
+        except Exception as e:
+            print(f"Error fetching {url} (attempt {attempt + 1}/{max_retries}): {e}")
+            if attempt < max_retries - 1:
+                time.sleep(retry_delay * (2 ** attempt))
+    return "error", None
+
+
+def fetch_details(urls, cache, workers=8, rate=2.0, burst=4, max_requests=MAX_REQUESTS, base_url=None,
+                  parser="auto", retry_delay=5):
+    """
+    Fetch the detail pages of `urls` missing from the cache, with bounded concurrency
+
+    Args:
+        urls (iterable): Listing URLs, in the order they should be fetched
+        cache (DetailCache): Response cache; cached and gone URLs are skipped
+        workers (int): Concurrent requests (one keep-alive session per worker thread)
+        rate (float): Requests per second allowed to the host; unlimited if None
+        burst (int): Requests allowed back to back before the rate applies
+        max_requests (int): Pages to fetch in this run; all missing pages if None
+        base_url (str): Scheme and host to fetch from, e.g. a local fixture server
+        parser (str): Detail parser backend ("bs4", "selectolax" or "auto")
+
+    Returns:
+        Counter: Number of URLs per status ("ok", "gone", "captcha", "error", "skipped")
+    """
+    pending = [url for url in urls if cache.status(url) is None]
+    if max_requests is not None:
+        pending = pending[:max_requests]
+    limiter = HostRateLimiter(rate, burst) if rate else None
+    parse = get_detail_parser(parser)
+    local = threading.local()
+    blocked = threading.Event()
+
+    def fetch(url):
+        # A CAPTCHA answers every later request too: stop spending the budget on it
+        if blocked.is_set():
+            return "skipped"
+        if not hasattr(local, "session"):
+            local.session = make_session()
+        status, html = fetch_detail(url, local.session, base_url, limiter, parse, retry_delay=retry_delay)
+        if status == "ok":
+            cache.put(url, html)
+        elif status == "gone":
+            cache.mark_gone(url)
+        elif status == "captcha":
+            blocked.set()
+        return status
+
+    counts = Counter()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(fetch, url) for url in pending]
+        for i, future in enumerate(as_completed(futures), 1):
+            counts[future.result()] += 1
+            if i % 100 == 0:
+                print(f"Fetched {i}/{len(pending)} detail pages")
+
+    elapsed = time.perf_counter() - started
+    requested = len(pending) - counts["skipped"]
+    print(f"Requested {requested} detail pages in {elapsed:.1f}s ({requested / max(elapsed, 1e-9):.2f} pages/s): "
+          + ", ".join(f"{status} {n}" for status, n in sorted(counts.items())))
+    if counts["captcha"]:
+        print("CAPTCHA page received: stopped early, the remaining pages will be fetched on the next run")
+    return counts
+
+
+def parse_details(urls, cache, parser="auto"):
+    """
+    Parse the cached detail pages of `urls`
+
+    Returns:
+        dict: URL -> detail record (alonhadat_parsers.build_detail_record fields)
+    """
+    parse = get_detail_parser(parser)
+    details = {}
+    for url in urls:
+        html = cache.get(url)
+        if html is None:
+            continue
+        is_captcha, record = parse(html)
+        if not is_captcha and record is not None:
+            details[url] = record
+    return details
+
+
+def merge_details(listings, details):
+    """
+    Crawl records with their detail attributes merged in by URL
+
+    Non-empty detail values replace the card's (the detail description is the
+    full text the card truncates); listings without a detail page keep their
+    card fields only.
+
+    Args:
+        listings (dict): URL -> crawl record, as returned by `load_listings`
+        details (dict): URL -> detail record, as returned by `parse_details`
+
+    Returns:
+        list: Enriched records, in the order of `listings`
+    """
+    merged = []
+    for url, record in listings.items():
+        detail = details.get(url)
+        if detail is not None:
+            record = {**record, **{field: value for field, value in detail.items() if value}}
+        merged.append(record)
+    return merged
+
+
+def enrich(crawl_dir=DEFAULT_CRAWL_DIR, details_dir=DEFAULT_DETAILS_DIR, csv_path=DEFAULT_CSV_PATH, workers=8,
+           rate=2.0, burst=4, max_requests=MAX_REQUESTS, base_url=None, parser="auto"):
+    """
+    Fetch missing detail pages, then merge every cached one into the crawl records
+
+    Returns:
+        list: Enriched records
+    """
+    details_dir = Path(details_dir)
+    cache = DetailCache(details_dir / "cache")
+    listings = load_listings(crawl_dir)
+    print(f"{len(listings)} listings in {crawl_dir}")
+    if max_requests != 0:
+        fetch_details(listings, cache, workers=workers, rate=rate, burst=burst, max_requests=max_requests,
+                      base_url=base_url, parser=parser)
+
+    started = time.perf_counter()
+    details = parse_details(listings, cache, parser)
+    merged = merge_details(listings, details)
+    print(f"Parsed {len(details)} cached detail pages in {time.perf_counter() - started:.2f}s "
+          f"({len(details) / max(len(listings), 1):.1%} of listings enriched)")
+
+    output = details_dir / "listings_enriched.jsonl"
+    details_dir.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        for record in merged:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    if csv_path:
+        merge_files_to_csv([output], csv_path, fieldnames=ENRICHED_FIELDS, workers=1)
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch alonhadat listing detail pages and merge them into the crawl")
+    parser.add_argument("--crawl-dir", default=str(DEFAULT_CRAWL_DIR), help="Crawl output (page files or segments)")
+    parser.add_argument("--details-dir", default=str(DEFAULT_DETAILS_DIR),
+                        help="Response cache and enriched JSONL output")
+    parser.add_argument("--csv", default=str(DEFAULT_CSV_PATH), help="Enriched CSV to write ('' to skip)")
+    parser.add_argument("--max-requests", type=int, default=MAX_REQUESTS,
+                        help="Detail pages to fetch in this run (0: re-parse the cache only)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent requests")
+    parser.add_argument("--rate", type=float, default=2.0, help="Max requests per second to the host")
+    parser.add_argument("--burst", type=int, default=4, help="Requests allowed back to back before the rate applies")
+    parser.add_argument("--base-url", help="Fetch from this scheme and host instead, e.g. a local fixture server")
+    parser.add_argument("--parser", default="auto", choices=["auto"] + sorted(DETAIL_PARSERS),
+                        help="Detail parser backend")
+    args = parser.parse_args()
+
+    enrich(args.crawl_dir, args.details_dir, args.csv or None, workers=args.workers, rate=args.rate,
+           burst=args.burst, max_requests=args.max_requests, base_url=args.base_url, parser=args.parser)
+
+
+if __name__ == "__main__":
+    main()
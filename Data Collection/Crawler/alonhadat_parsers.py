@@ -0,0 +1,417 @@
+"""
+Parser backends for alonhadat.com.vn search-result pages.
+
+Every backend takes the raw HTML of a page and returns `(is_captcha, records)`,
+where `records` are field-for-field identical to the original BeautifulSoup
+implementation. Selectors and regexes are compiled once at import time.
+
+    bs4         BeautifulSoup + html.parser (reference implementation)
+    lxml        lxml.html with precompiled XPath expressions
+    selectolax  selectolax's lexbor engine with CSS selectors
+
+Listing detail pages have their own parsers (`DETAIL_PARSERS`, bs4 and
+selectolax) returning `(is_captcha, record)` with the attributes of the
+page's spec table, full description and address.
+"""
+import re
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:
+    lxml_html = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+SITE_URL = "https://alonhadat.com.vn"
+CAPTCHA_STRINGS = ("Vui lòng xác minh không phải Robot", "THÔNG BÁO")
+ORIENTATION_RE = re.compile(r"Hướng[:：]\s*([^\s,]+)")
+DIMENSION_RE = re.compile(r"KT[:：]\s*([\d\.x]+)")
+
+# Text inside these tags is not part of BeautifulSoup's get_text() output
+SKIP_TEXT_TAGS = frozenset(("script", "style", "template"))
+
+
+def warn_no_items(page_num):
+    print(f"Warning: No content items found on page {page_num}. The page might be empty or have a different structure.")
+
+
+def join_text(strings, separator=""):
+    """Mirror BeautifulSoup's get_text(separator, strip=True) over an iterable of text nodes"""
+    return separator.join(s for s in (s.strip() for s in strings) if s)
+
+
+def build_record(title, href, date, area, price, floors, bedrooms, address, description, span_titles):
+    """Assemble a listing record from raw field strings, shared by every backend"""
+    road_width = car_parking = orientation = dimension = ""
+    # Parse orientation and dimension from description
+    if description:
+        orient_m = ORIENTATION_RE.search(description)
+        if orient_m:
+            orientation = orient_m.group(1)
+        dim_m = DIMENSION_RE.search(description)
+        if dim_m:
+            dimension = dim_m.group(1)
+    # Extract additional span titles
+    for t in span_titles:
+        if "Đường trước nhà" in t:
+            road_width = t.split(":", 1)[1].strip()
+        if "Chỗ để xe" in t:
+            car_parking = t.split(":", 1)[1].strip()
+
+    return {
+        # Primary info
+        "title": title,
+        "url": urljoin(SITE_URL, href),
+        "date": date,
+        "area": area.replace("Diện tích:", ""),
+        "price": price.replace("Giá:", ""),
+        "floors": floors,
+        "bedrooms": bedrooms,
+        "address": address,
+        # Optional fields
+        "road_width": road_width,
+        "car_parking": car_parking,
+        "description": description,
+        "orientation": orientation,
+        "dimension": dimension,
+    }
+
+
+def listing_url(url):
+    """Listing URL of a saved record; crawls before the urljoin fix stored SITE_URL + the absolute href"""
+    start = max(url.rfind("http://"), url.rfind("https://"))
+    return url[start:] if start > 0 else url
+
+
+# --- BeautifulSoup -----------------------------------------------------------
+
+def is_captcha_page(soup):
+    """Check if the current page is a CAPTCHA verification page"""
+    captcha_text = soup.find(string=CAPTCHA_STRINGS[0])
+    thong_bao = soup.find(string=CAPTCHA_STRINGS[1])
+    return captcha_text is not None or thong_bao is not None
+
+
+def parse_alonhadat_items(soup, page_num=None):
+    """Extract listing records from every `content-item` of a parsed search-result page"""
+    items = soup.find_all("div", class_="content-item")
+
+    # If we don't find any content items but also no CAPTCHA, the page might be empty
+    if not items:
+        warn_no_items(page_num)
+
+    results = []
+    for item in items:
+        try:
+            # Ensure title and link exist
+            title_div = item.find("div", class_="ct_title")
+            if not title_div:
+                continue
+            anchor = title_div.find("a")
+            if not anchor or not anchor.get("href"):
+                continue
+
+            date_div = item.find("div", class_="ct_date")
+            area_div = item.find("div", class_="ct_dt")
+            price_div = item.find("div", class_="ct_price")
+            floors_span = item.find("span", class_="floors")
+            bed_span = item.find("span", class_="bedroom")
+            addr_div = item.find("div", class_="ct_dis")
+            desc_div = item.find("div", class_="ct_content")
+
+            results.append(build_record(
+                title=anchor.get_text(strip=True),
+                href=anchor["href"],
+                date=date_div.get_text(strip=True) if date_div else "",
+                area=area_div.get_text(strip=True) if area_div else "",
+                price=price_div.get_text(strip=True) if price_div else "",
+                floors=floors_span.get("title", "") if floors_span else "",
+                bedrooms=bed_span.get("title", "") if bed_span else "",
+                address=addr_div.get_text(separator=", ", strip=True) if addr_div else "",
+                description=desc_div.get_text(separator=" ", strip=True) if desc_div else "",
+                span_titles=[span["title"] for span in item.find_all("span", title=True)],
+            ))
+        except Exception as e:
+            print(f"Error parsing item: {e}")
+
+    return results
+
+
+def parse_with_bs4(html, page_num=None):
+    soup = BeautifulSoup(html, "html.parser")
+    if is_captcha_page(soup):
+        return True, []
+    return False, parse_alonhadat_items(soup, page_num)
+
+
+# --- lxml --------------------------------------------------------------------
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+if lxml_html is not None:
+    LXML_CAPTCHA = etree.XPath(" | ".join(f'//text()[. = "{s}"]' for s in CAPTCHA_STRINGS))
+    LXML_ITEMS = etree.XPath(f"//div[{_has_class('content-item')}]")
+    LXML_TITLE_DIV = etree.XPath(f"(.//div[{_has_class('ct_title')}])[1]")
+    LXML_FIRST_ANCHOR = etree.XPath("(.//a)[1]")
+    LXML_FIELDS = {
+        name: etree.XPath(f"(.//{tag}[{_has_class(cls)}])[1]")
+        for name, tag, cls in (
+            ("date", "div", "ct_date"),
+            ("area", "div", "ct_dt"),
+            ("price", "div", "ct_price"),
+            ("floors", "span", "floors"),
+            ("bedrooms", "span", "bedroom"),
+            ("address", "div", "ct_dis"),
+            ("description", "div", "ct_content"),
+        )
+    }
+    LXML_TITLED_SPANS = etree.XPath(".//span[@title]/@title")
+
+
+def _lxml_strings(el):
+    """Yield the text nodes under `el` the way BeautifulSoup would see them"""
+    if el.text and el.tag not in SKIP_TEXT_TAGS:
+        yield el.text
+    for child in el:
+        if isinstance(child.tag, str) and child.tag not in SKIP_TEXT_TAGS:
+            yield from _lxml_strings(child)
+        if child.tail:
+            yield child.tail
+
+
+def parse_with_lxml(html, page_num=None):
+    if not html.strip():
+        warn_no_items(page_num)
+        return False, []
+    tree = lxml_html.fromstring(html)
+    if LXML_CAPTCHA(tree):
+        return True, []
+
+    items = LXML_ITEMS(tree)
+    if not items:
+        warn_no_items(page_num)
+
+    results = []
+    for item in items:
+        try:
+            title_div = LXML_TITLE_DIV(item)
+            if not title_div:
+                continue
+            anchor = LXML_FIRST_ANCHOR(title_div[0])
+            if not anchor or not anchor[0].get("href"):
+                continue
+            anchor = anchor[0]
+            fields = {name: xpath(item) for name, xpath in LXML_FIELDS.items()}
+            text = lambda name, sep="": join_text(_lxml_strings(fields[name][0]), sep) if fields[name] else ""
+            attr = lambda name: fields[name][0].get("title", "") if fields[name] else ""
+
+            results.append(build_record(
+                title=join_text(_lxml_strings(anchor)),
+                href=anchor.get("href"),
+                date=text("date"),
+                area=text("area"),
+                price=text("price"),
+                floors=attr("floors"),
+                bedrooms=attr("bedrooms"),
+                address=text("address", ", "),
+                description=text("description", " "),
+                span_titles=[str(t) for t in LXML_TITLED_SPANS(item)],
+            ))
+        except Exception as e:
+            print(f"Error parsing item: {e}")
+
+    return False, results
+
+
+# --- selectolax --------------------------------------------------------------
+
+SELECTOLAX_FIELDS = (
+    ("date", "div.ct_date"),
+    ("area", "div.ct_dt"),
+    ("price", "div.ct_price"),
+    ("floors", "span.floors"),
+    ("bedrooms", "span.bedroom"),
+    ("address", "div.ct_dis"),
+    ("description", "div.ct_content"),
+)
+
+
+def _selectolax_strings(node):
+    """Yield the text nodes under `node`, skipping script/style content like BeautifulSoup"""
+    for child in node.traverse(include_text=True):
+        if child.tag == "-text" and child.parent.tag not in SKIP_TEXT_TAGS:
+            yield child.text_content
+
+
+def parse_with_selectolax(html, page_num=None):
+    tree = LexborHTMLParser(html)
+    if any(s in html for s in CAPTCHA_STRINGS):
+        # Only pay for a full text scan when a CAPTCHA marker appears somewhere in the markup
+        if any(t in CAPTCHA_STRINGS for t in _selectolax_strings(tree.root)):
+            return True, []
+
+    items = tree.css("div.content-item")
+    if not items:
+        warn_no_items(page_num)
+
+    results = []
+    for item in items:
+        try:
+            title_div = item.css_first("div.ct_title")
+            if title_div is None:
+                continue
+            anchor = title_div.css_first("a")
+            if anchor is None or not anchor.attributes.get("href"):
+                continue
+            fields = {name: item.css_first(selector) for name, selector in SELECTOLAX_FIELDS}
+            text = lambda name, sep="": join_text(_selectolax_strings(fields[name]), sep) if fields[name] is not None else ""
+            attr = lambda name: (fields[name].attributes.get("title") or "") if fields[name] is not None else ""
+
+            results.append(build_record(
+                title=join_text(_selectolax_strings(anchor)),
+                href=anchor.attributes["href"],
+                date=text("date"),
+                area=text("area"),
+                price=text("price"),
+                floors=attr("floors"),
+                bedrooms=attr("bedrooms"),
+                address=text("address", ", "),
+                description=text("description", " "),
+                span_titles=[span.attributes.get("title") or "" for span in item.css("span[title]")],
+            ))
+        except Exception as e:
+            print(f"Error parsing item: {e}")
+
+    return False, results
+
+
+PARSERS = {"bs4": parse_with_bs4}
+if lxml_html is not None:
+    PARSERS["lxml"] = parse_with_lxml
+if LexborHTMLParser is not None:
+    PARSERS["selectolax"] = parse_with_selectolax
+
+
+# --- Detail pages ------------------------------------------------------------
+
+# Spec table label -> record field (the site spells "Chỗ" both ways)
+DETAIL_FIELDS = {
+    "Mã tin": "listing_code",
+    "Loại tin": "listing_type",
+    "Loại BDS": "property_type",
+    "Hướng": "orientation",
+    "Đường trước nhà": "road_width",
+    "Pháp lý": "legal_status",
+    "Chiều ngang": "width",
+    "Chiều dài": "length",
+    "Số lầu": "floors",
+    "Số phòng ngủ": "bedrooms",
+    "Phòng ăn": "dining_room",
+    "Nhà bếp": "kitchen",
+    "Sân thượng": "terrace",
+    "Chỗ để xe hơi": "car_parking",
+    "Chổ để xe hơi": "car_parking",
+    "Chính chủ": "owner_listing",
+}
+EMPTY_DETAIL_VALUES = frozenset(("", "---", "--", "-", "_"))
+CHECKED_VALUE = "có"  # yes/no specs show a check-mark image instead of text
+METERS_RE = re.compile(r"\s*m$")
+
+
+def build_detail_record(cells, description, address):
+    """
+    Assemble a detail record from the spec table cells, shared by every detail backend
+
+    Args:
+        cells (list): (text, has_image) of every table cell in order; labels and values alternate
+        description (str): Full listing description
+        address (str): Property address
+    """
+    record = {field: "" for field in dict.fromkeys(DETAIL_FIELDS.values())}
+    for (label, _), (value, checked) in zip(cells[::2], cells[1::2]):
+        field = DETAIL_FIELDS.get(label.rstrip(":").strip())
+        if field is None:
+            continue
+        value = value.strip()
+        record[field] = CHECKED_VALUE if checked and not value else ("" if value in EMPTY_DETAIL_VALUES else value)
+    if record["width"] and record["length"]:
+        record["dimension"] = f'{METERS_RE.sub("", record["width"])}x{METERS_RE.sub("", record["length"])}'
+    else:
+        record["dimension"] = ""
+    record["description"] = description
+    record["address"] = address
+    return record
+
+
+def parse_detail_with_bs4(html):
+    soup = BeautifulSoup(html, "html.parser")
+    if is_captcha_page(soup):
+        return True, None
+    table = soup.select_one("div.moreinfor1")
+    description = soup.select_one("div.detail")
+    if table is None and description is None:
+        return False, None
+    address = soup.select_one("div.address .value") or soup.select_one("div.address")
+    cells = [(td.get_text(" ", strip=True), td.find("img") is not None)
+             for td in (table.find_all("td") if table is not None else [])]
+    return False, build_detail_record(
+        cells,
+        description.get_text(separator=" ", strip=True) if description else "",
+        address.get_text(separator=" ", strip=True) if address else "",
+    )
+
+
+def parse_detail_with_selectolax(html):
+    tree = LexborHTMLParser(html)
+    if any(s in html for s in CAPTCHA_STRINGS):
+        if any(t in CAPTCHA_STRINGS for t in _selectolax_strings(tree.root)):
+            return True, None
+    table = tree.css_first("div.moreinfor1")
+    description = tree.css_first("div.detail")
+    if table is None and description is None:
+        return False, None
+    address = tree.css_first("div.address .value") or tree.css_first("div.address")
+    cells = [(join_text(_selectolax_strings(td), " "), td.css_first("img") is not None)
+             for td in (table.css("td") if table is not None else [])]
+    return False, build_detail_record(
+        cells,
+        join_text(_selectolax_strings(description), " ") if description is not None else "",
+        join_text(_selectolax_strings(address), " ") if address is not None else "",
+    )
+
+
+DETAIL_PARSERS = {"bs4": parse_detail_with_bs4}
+if LexborHTMLParser is not None:
+    DETAIL_PARSERS["selectolax"] = parse_detail_with_selectolax
+
+
+def get_parser(name="auto"):
+    """
+    Return the parse function for a backend name
+
+    "auto" picks the fastest installed backend (selectolax, then lxml, then bs4).
+    """
+    if name == "auto":
+        for candidate in ("selectolax", "lxml", "bs4"):
+            if candidate in PARSERS:
+                return PARSERS[candidate]
+    if name not in PARSERS:
+        raise ValueError(f"Unknown or unavailable parser backend '{name}'. Available: {sorted(PARSERS)}")
+    return PARSERS[name]
+
+
+def get_detail_parser(name="auto"):
+    """Return the detail-page parse function for a backend name ("auto": selectolax if installed, else bs4)"""
+    if name == "auto":
+        return DETAIL_PARSERS.get("selectolax", DETAIL_PARSERS["bs4"])
+    if name not in DETAIL_PARSERS:
+        raise ValueError(f"Unknown or unavailable detail parser '{name}'. Available: {sorted(DETAIL_PARSERS)}")
+    return DETAIL_PARSERS[name]
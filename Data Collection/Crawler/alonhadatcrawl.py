@@ -1,18 +1,29 @@
+import argparse
 import json
 import requests
 import os
 import time
 import sys
-from bs4 import BeautifulSoup
-import pickle
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from alonhadat_parsers import PARSERS, get_parser
+from crawl_index import DEFAULT_INDEX_PATH, CrawlIndex
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Datasets"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / "Data Preprocessing"))
+from segment_store import SegmentStore
+from instrumentation import NO_METRICS, add_arguments, instrumented
 
-def is_captcha_page(soup):
-    """Check if the current page is a CAPTCHA verification page"""
-    captcha_text = soup.find(string="Vui lòng xác minh không phải Robot")
-    thong_bao = soup.find(string="THÔNG BÁO")
-    return captcha_text is not None or thong_bao is not None
+
+SITE_URL = "https://alonhadat.com.vn"
+PAGE_PATH = "/nha-dat/can-ban/nha-dat/1/ha-noi/trang--{page_num}.html"
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+NOT_MODIFIED = "not-modified"  # returned instead of records when the server answers 304
 
 
 def save_progress(last_completed_page):
@@ -29,21 +40,102 @@ def load_progress():
     return None
 
 
-def crawl_alonhadat_page(page_num=1, max_retries=3, retry_delay=5):
-    url = f"https://alonhadat.com.vn/nha-dat/can-ban/nha-dat/1/ha-noi/trang--{page_num}.html"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per second with bursts of up to `burst`"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then consume it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """One token bucket per host so every site keeps its own politeness budget"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.rate, self.burst)
+        bucket.acquire()
+
+
+def make_session(pool_size=1):
+    """Create a keep-alive session whose connection pool fits `pool_size` concurrent requests"""
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def crawl_alonhadat_page(page_num=1, max_retries=3, retry_delay=5, session=None,
+                         base_url=SITE_URL, interactive=True, rate_limiter=None, parser="bs4",
+                         extra_headers=None, validators=None, metrics=NO_METRICS):
+    """
+    Crawl one search-result page and return its listing records
+
+    Args:
+        page_num (int): Search-result page number
+        max_retries (int): Attempts before giving up on the page
+        retry_delay (float): Initial backoff in seconds, doubled after every failure
+        session (requests.Session): Keep-alive session to reuse; a one-off request is made if None
+        base_url (str): Scheme and host to fetch from, e.g. a local fixture server
+        interactive (bool): Prompt for manual CAPTCHA solving; otherwise return None on CAPTCHA
+        rate_limiter (HostRateLimiter): Politeness limiter consulted before every request
+        parser (str): Parser backend name from alonhadat_parsers ("bs4", "lxml", "selectolax" or "auto")
+        extra_headers (dict): Additional request headers, e.g. If-None-Match for a conditional GET
+        validators (dict): Filled with the response's ETag / Last-Modified when given
+        metrics (Metrics): Receives the "request" and "parse" stage timings
+    """
+    url = base_url + PAGE_PATH.format(page_num=page_num)
+    headers = {**HEADERS, **(extra_headers or {})}
+    get = session.get if session is not None else requests.get
+    parse = get_parser(parser)
     
     for attempt in range(max_retries):
         try:
-            response = requests.get(url, headers=headers, timeout=30)
+            if rate_limiter is not None:
+                rate_limiter.wait(url)
+            with metrics.stage("request"):
+                response = get(url, headers=headers, timeout=30)
+            if response.status_code == 304:
+                return NOT_MODIFIED
+            if validators is not None:
+                validators["etag"] = response.headers.get("ETag")
+                validators["last_modified"] = response.headers.get("Last-Modified")
             response.encoding = "utf-8"
-            soup = BeautifulSoup(response.text, "html.parser")
+            with metrics.stage("parse"):
+                is_captcha, results = parse(response.text, page_num)
             
             # Check if we've hit a CAPTCHA page
-            if is_captcha_page(soup):
+            if is_captcha:
                 print(f"\n\033[91mCAPTCHA detected on page {page_num}!\033[0m")
+                if not interactive:
+                    return None
                 print("The website requires human verification.")
                 print(f"Please manually visit: {url}")
                 print("Complete the CAPTCHA verification in your browser.")
@@ -57,91 +149,6 @@ def crawl_alonhadat_page(page_num=1, max_retries=3, retry_delay=5):
                     return []
                 continue  # Retry the request
             
-            items = soup.find_all("div", class_="content-item")
-            
-            # If we don't find any content items but also no CAPTCHA, the page might be empty
-            if not items:
-                print(f"Warning: No content items found on page {page_num}. The page might be empty or have a different structure.")
-            
-            results = []
-            for item in items:
-                try:
-                    # Ensure title and link exist
-                    title_div = item.find("div", class_="ct_title")
-                    if not title_div:
-                        continue
-                    anchor = title_div.find("a")
-                    if not anchor or not anchor.get("href"):
-                        continue
-                    title = anchor.get_text(strip=True)
-                    link = "https://alonhadat.com.vn" + anchor["href"]
-
-                    # Extract date
-                    date_div = item.find("div", class_="ct_date")
-                    date = date_div.get_text(strip=True) if date_div else ""
-
-                    # Extract area
-                    area_div = item.find("div", class_="ct_dt")
-                    area = area_div.get_text(strip=True).replace("Diện tích:", "") if area_div else ""
-
-                    # Extract price
-                    price_div = item.find("div", class_="ct_price")
-                    price = price_div.get_text(strip=True).replace("Giá:", "") if price_div else ""
-
-                    # Extract floors
-                    floors_span = item.find("span", class_="floors")
-                    floors = floors_span.get("title", "") if floors_span else ""
-
-                    # Extract bedrooms
-                    bed_span = item.find("span", class_="bedroom")
-                    bedrooms = bed_span.get("title", "") if bed_span else ""
-
-                    # Extract address
-                    addr_div = item.find("div", class_="ct_dis")
-                    address = addr_div.get_text(separator=", ", strip=True) if addr_div else ""
-
-                    # Initialize optional fields
-                    road_width = car_parking = description = orientation = dimension = ""
-                    # Extract description summary
-                    desc_div = item.find("div", class_="ct_content")
-                    if desc_div:
-                        description = desc_div.get_text(separator=" ", strip=True)
-                    # Parse orientation and dimension from description
-                    if description:
-                        orient_m = re.search(r"Hướng[:：]\s*([^\s,]+)", description)
-                        if orient_m:
-                            orientation = orient_m.group(1)
-                        dim_m = re.search(r"KT[:：]\s*([\d\.x]+)", description)
-                        if dim_m:
-                            dimension = dim_m.group(1)
-                    # Extract additional span titles
-                    for span in item.find_all("span", title=True):
-                        t = span["title"]
-                        if "Đường trước nhà" in t:
-                            road_width = t.split(":", 1)[1].strip()
-                        if "Chỗ để xe" in t:
-                            car_parking = t.split(":", 1)[1].strip()
-
-                    results.append({
-                        # Primary info
-                        "title": title,
-                        "url": link,
-                        "date": date,
-                        "area": area,
-                        "price": price,
-                        "floors": floors,
-                        "bedrooms": bedrooms,
-                        "address": address,
-                        # Optional fields
-                        "road_width": road_width,
-                        "car_parking": car_parking,
-                        "description": description,
-                        "orientation": orientation,
-                        "dimension": dimension,
-                    })
-                except Exception as e:
-                    print(f"Error parsing item: {e}")
-            
             return results
             
         except requests.RequestException as e:
@@ -155,43 +162,216 @@ def crawl_alonhadat_page(page_num=1, max_retries=3, retry_delay=5):
     return []
 
 
+def save_page(output_dir, page_num, data, store=None):
+    """
+    Write one page of records and return where it went
+
+    With a `SegmentStore` the page is appended to it as frame `page_N`;
+    otherwise it is written to `page_N.jsonl`.
+    """
+    if store is not None:
+        store.append(f"page_{page_num}", data)
+        return f"{store.directory} (page_{page_num})"
+    output_file = os.path.join(output_dir, f"page_{page_num}.jsonl")
+    with open(output_file, "w", encoding="utf-8") as file:
+        for d in data:
+            file.write(json.dumps(d, ensure_ascii=False) + "\n")
+    return output_file
+
+
+def page_saved(output_dir, page_num, store=None):
+    """Whether a previous crawl of the page is on disk (page file or segment frame)"""
+    return (store is not None and f"page_{page_num}" in store) or \
+        os.path.exists(os.path.join(output_dir, f"page_{page_num}.jsonl"))
+
+
+def crawl_and_save_page(page_num, output_dir, index=None, base_url=SITE_URL, store=None, metrics=NO_METRICS,
+                        **crawl_kwargs):
+    """
+    Crawl one page and save it, consulting the crawl index when given
+
+    With an index the request is a conditional GET, and the page is only
+    rewritten when its listings differ from the indexed version.
+
+    Returns:
+        str: "saved", "unchanged" or "empty"
+    """
+    url = base_url + PAGE_PATH.format(page_num=page_num)
+    validators = {}
+    extra_headers = None
+    if index is not None and page_saved(output_dir, page_num, store):
+        extra_headers = index.conditional_headers(url)
+
+    data = crawl_alonhadat_page(page_num, base_url=base_url, extra_headers=extra_headers,
+                                validators=validators, metrics=metrics, **crawl_kwargs)
+    if data == NOT_MODIFIED:
+        index.mark_not_modified(url)
+        print(f"Page {page_num} not modified since last crawl")
+        metrics.count("pages_unchanged")
+        return "unchanged"
+    if not data:
+        print(f"No data retrieved for page {page_num}")
+        metrics.count("pages_empty")
+        return "empty"
+
+    if index is not None and not index.is_changed(url, data) and page_saved(output_dir, page_num, store):
+        index.update(url, "alonhadat", page_num, data, **validators)
+        print(f"Listings on page {page_num} unchanged, keeping the saved copy")
+        metrics.count("pages_unchanged")
+        return "unchanged"
+    with metrics.stage("save"):
+        output = save_page(output_dir, page_num, data, store)
+    # Indexed only once saved, so a failed save is fetched and saved again next time
+    if index is not None:
+        index.update(url, "alonhadat", page_num, data, **validators)
+    metrics.count("pages_saved")
+    metrics.count("records", len(data))
+    print(f"Successfully saved {len(data)} items to {output}")
+    return "saved"
+
+
+def crawl_pages_concurrently(pages, output_dir, workers=8, rate=2.0, burst=4, base_url=SITE_URL, parser="bs4",
+                             index=None, store=None, metrics=NO_METRICS):
+    """
+    Crawl `pages` with a bounded pool of workers sharing one per-host token bucket
+
+    Each worker thread keeps its own keep-alive session. CAPTCHA pages are not
+    prompted for, and a page whose fetch or save raises does not stop the
+    others; both are returned so they can be re-crawled later.
+
+    Args:
+        pages (iterable): Page numbers to crawl
+        output_dir (str): Directory receiving the `page_N.jsonl` files
+        workers (int): Maximum number of requests in flight
+        rate (float): Requests per second allowed per host
+        burst (int): Requests allowed back to back before the rate applies
+        base_url (str): Scheme and host to fetch from
+        parser (str): Parser backend name
+        index (CrawlIndex): Crawl index enabling conditional GETs and change detection
+        store (SegmentStore): Segment store receiving the pages instead of `page_N.jsonl` files
+        metrics (Metrics): Receives the request/parse/save timings and page counts
+
+    Returns:
+        tuple: (page numbers crawled successfully, page numbers that hit a CAPTCHA, returned nothing or raised)
+    """
+    pages = sorted(pages)
+    limiter = HostRateLimiter(rate, burst)
+    local = threading.local()
+
+    def worker(page_num):
+        if not hasattr(local, "session"):
+            local.session = make_session()
+        return crawl_and_save_page(page_num, output_dir, index=index, session=local.session, base_url=base_url,
+                                   store=store, metrics=metrics, interactive=False, rate_limiter=limiter,
+                                   parser=parser)
+
+    saved, failed = [], []
+    done = set()
+    next_contiguous = 0  # index into `pages` of the first page not yet finished
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(worker, page_num): page_num for page_num in pages}
+        for future in as_completed(futures):
+            page_num = futures[future]
+            try:
+                status = future.result()
+            except Exception as e:
+                print(f"Page {page_num} failed: {e}")
+                status = "error"
+            if status in ("empty", "error"):
+                failed.append(page_num)
+            else:
+                saved.append(page_num)
+
+            # Progress only moves past pages that finished, so a resume never skips a hole
+            done.add(page_num)
+            while next_contiguous < len(pages) and pages[next_contiguous] in done:
+                if pages[next_contiguous] in failed:
+                    break
+                next_contiguous += 1
+            if next_contiguous:
+                save_progress(pages[next_contiguous - 1])
+
+    elapsed = time.perf_counter() - started
+    print(f"\nFinished {len(pages)} pages in {elapsed:.1f}s ({len(pages) / max(elapsed, 1e-9):.2f} pages/s): "
+          f"{len(saved)} saved or unchanged, {len(failed)} failed")
+    if failed:
+        print(f"Pages to re-crawl: {sorted(failed)}")
+    return sorted(saved), sorted(failed)
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Crawl alonhadat.com.vn search-result pages")
+    parser.add_argument("start_page", nargs="?", type=int, help="First page to crawl (default: 2)")
+    parser.add_argument("end_page", nargs="?", type=int, help="Last page to crawl (default: 200)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Concurrent fetches; 1 keeps the sequential, interactive crawl")
+    parser.add_argument("--rate", type=float, default=2.0, help="Max requests per second per host")
+    parser.add_argument("--burst", type=int, default=4, help="Requests allowed back to back")
+    parser.add_argument("--base-url", default=SITE_URL, help="Site to crawl, e.g. a local fixture server")
+    parser.add_argument("--output-dir", help="Crawl output directory")
+    parser.add_argument("--format", default="segments", choices=["segments", "files"],
+                        help="Append pages to the directory's zstd segment store, or write page_N.jsonl files")
+    parser.add_argument("--parser", default="bs4", choices=["auto"] + sorted(PARSERS),
+                        help="HTML parser backend")
+    parser.add_argument("--index", nargs="?", const=DEFAULT_INDEX_PATH,
+                        help="SQLite crawl index enabling conditional re-fetch and non-interactive resume")
+    parser.add_argument("--max-age", type=float, default=24,
+                        help="With --index, skip pages fetched within this many hours")
+    add_arguments(parser)
+    args = parser.parse_args()
+    with instrumented("crawl_alonhadat", args.metrics, args.trace_memory, args.profile) as metrics:
+        run(args, metrics)
+
+
+def run(args, metrics):
+    """The crawl `main` runs for its parsed command line"""
+    index = CrawlIndex(args.index) if args.index else None
+
     # Default page range
     start_page = 2
     end_page = 200
 
     # Set up output directory relative to project root
     root_dir = os.getcwd()
-    output_dir = os.path.join(root_dir, 'Data Collection', 'Datasets', 'alonhadat.com', 'json')
+    output_dir = args.output_dir or os.path.join(root_dir, 'Data Collection', 'Datasets', 'alonhadat.com', 'json')
     os.makedirs(output_dir, exist_ok=True)
+    store = SegmentStore(output_dir) if args.format == "segments" else None
     
     # Check if resuming from a previous run
     last_completed = load_progress()
-    if last_completed is not None:
+    if last_completed is not None and args.workers == 1 and index is None:
         resume = input(f"Previous crawl stopped at page {last_completed}. Resume from page {last_completed + 1}? (y/n): ")
         if resume.lower() == 'y':
             start_page = last_completed + 1
     
     # Allow command-line arguments to override defaults
-    if len(sys.argv) >= 3:
-        start_page = int(sys.argv[1])
-        end_page = int(sys.argv[2])
+    if args.start_page is not None and args.end_page is not None:
+        start_page = args.start_page
+        end_page = args.end_page
     
     print(f"Starting crawl from page {start_page} to {end_page}...")
+    pages = range(start_page, end_page + 1)
+    if index is not None:
+        # Resume without prompting: pages fetched recently are already up to date
+        fresh = index.fresh_pages("alonhadat", max_age=args.max_age * 3600)
+        pages = [page_num for page_num in pages if page_num not in fresh]
+        print(f"Skipping {end_page - start_page + 1 - len(pages)} pages fetched in the last {args.max_age:g} hours")
+
+    if args.workers > 1:
+        crawl_pages_concurrently(pages, output_dir, workers=args.workers, rate=args.rate, burst=args.burst,
+                                 base_url=args.base_url, parser=args.parser, index=index, store=store,
+                                 metrics=metrics)
+        return
     
-    for page_num in range(start_page, end_page + 1):
+    session = make_session()
+    limiter = HostRateLimiter(args.rate, args.burst)
+    for page_num in pages:
         print(f"\nCrawling page {page_num}...")
-        data = crawl_alonhadat_page(page_num)
-        
-        if data:  # Only write file if we got data
-            output_file = os.path.join(output_dir, f"page_{page_num}.jsonl")
-            with open(output_file, "w", encoding="utf-8") as file:
-                for d in data:
-                    file.write(json.dumps(d, ensure_ascii=False) + "\n")
-            print(f"Successfully saved {len(data)} items to {output_file}")
+        status = crawl_and_save_page(page_num, output_dir, index=index, session=session, base_url=args.base_url,
+                                     store=store, metrics=metrics, rate_limiter=limiter, parser=args.parser)
+        if status != "empty":
             save_progress(page_num)  # Update progress after successful save
-        else:
-            print(f"No data retrieved for page {page_num}")
 
 
 if __name__ == "__main__":
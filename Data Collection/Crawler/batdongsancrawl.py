@@ -0,0 +1,262 @@
+"""
+batdongsan.com.vn listing crawler driven by a persistent crawl frontier (crawl_frontier.py).
+
+Search-result pages (/nha-dat-ban/pN) seed the frontier. Every fetched page
+queues the listing links it shows, including the search cards and the
+"similar listings" block. The Bloom filter drops any URL already
+discovered, so each listing is fetched once across runs. A pool of browser
+workers takes URLs breadth-first from the shared queue. Each worker
+writes every listing it fetches as one flat record
+({"title", "url", <spec label>: <value>, ...}) to its own
+`crawl_<timestamp>_w<N>.jsonl`. No flatten or dedupe pass follows.
+
+The crawler runs unchanged against the local fixture server:
+
+    python fixture_server.py --site batdongsan --port 8767
+    python batdongsancrawl.py --search-pages 5 --max-listings 500 --delay 0 0 \\
+        --base-url http://127.0.0.1:8767 --frontier /tmp/frontier.sqlite --output-dir /tmp/out
+
+Usage:
+    python batdongsancrawl.py                          # 200 new listings, 2 browsers
+    python batdongsancrawl.py --workers 4 --max-listings 1000 --search-pages 20
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from crawl_frontier import DEFAULT_FRONTIER_PATH, DEFAULT_MAX_ATTEMPTS, CrawlFrontier
+from nhatotcrawl import VISIBLE_TEXT_SCRIPT, load_page_with_retries, make_driver, random_sleep
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / "Data Preprocessing"))
+from instrumentation import NO_METRICS, add_arguments, instrumented
+
+SITE_URL = "https://batdongsan.com.vn"
+SEARCH_PATH = "/nha-dat-ban/p{page_num}"
+MAX_CRAWL = 200
+# Listing detail URLs end with their ID: ".../ban-nha-rieng-...-pr42812670"
+LISTING_RE = re.compile(r"-pr\d+$")
+SELECTORS = {
+    "title": ".re__pr-title",
+    "spec": ".re__pr-specs-content-item",
+    "spec_label": ".re__pr-specs-content-item-title",
+    "spec_value": ".re__pr-specs-content-item-value",
+    "card": ".re__card-info-content",
+}
+# Title, spec (label, value) pairs and every link of the page in one round trip
+EXTRACT_SCRIPT = VISIBLE_TEXT_SCRIPT + """
+const selectors = arguments[0];
+const text = (root, selector) => {
+    const element = root.querySelector(selector);
+    return element ? visibleText(element) : null;
+};
+return JSON.stringify({
+    title: text(document, selectors.title),
+    specs: Array.from(document.querySelectorAll(selectors.spec),
+                      item => [text(item, selectors.spec_label), text(item, selectors.spec_value)]),
+    links: Array.from(new Set(Array.from(document.querySelectorAll('a[href]'), a => a.href))),
+});
+"""
+READY_SCRIPT = "return Boolean(document.querySelector(arguments[0].title) || document.querySelector(arguments[0].card));"
+
+
+def is_listing(url):
+    return bool(LISTING_RE.search(urlsplit(url).path.rstrip("/")))
+
+
+def search_urls(n_pages, base_url=SITE_URL):
+    """URLs of the first `n_pages` search-result pages"""
+    return [base_url + "/nha-dat-ban"] + [base_url + SEARCH_PATH.format(page_num=n) for n in range(2, n_pages + 1)]
+
+
+def fetch_page(driver, url, timeout=10, poll=0.25):
+    """
+    Load `url` and read its title, specs and links
+
+    Returns:
+        dict: title, specs ([label, value] pairs), links; None if the page did not load or has no content
+    """
+    if not load_page_with_retries(driver, url):
+        return None
+    deadline = time.monotonic() + timeout
+    while not driver.execute_script(READY_SCRIPT, SELECTORS):
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(poll)
+    return json.loads(driver.execute_script(EXTRACT_SCRIPT, SELECTORS))
+
+
+def flat_record(url, page):
+    """One flat listing record in the schema of the saved crawl files"""
+    record = {"title": page["title"], "url": url}
+    for label, value in page["specs"]:
+        if label and value:
+            record[label] = value
+    return record
+
+
+class ListingBudget:
+    """Number of listings the workers may still write, shared across threads"""
+
+    def __init__(self, limit):
+        self.remaining = limit
+        self.lock = threading.Lock()
+
+    def exhausted(self):
+        with self.lock:
+            return self.remaining <= 0
+
+    def spend(self):
+        with self.lock:
+            self.remaining -= 1
+
+
+def crawl_worker(worker_id, frontier, output_path, budget, max_depth=3, delay=(1, 2), headless=False,
+                 chrome_version=None, driver_factory=None, idle_wait=0.5, metrics=NO_METRICS):
+    """
+    One browser: fetch frontier URLs until the budget is spent or the frontier runs dry
+
+    Returns:
+        tuple: (listings written, pages fetched)
+    """
+    driver = driver_factory() if driver_factory is not None else make_driver(headless, chrome_version)
+    written = fetched = 0
+    try:
+        with open(output_path, "a", encoding="utf-8") as out:
+            while not budget.exhausted():
+                claimed = frontier.claim(1)
+                if not claimed:
+                    # Other workers may still be about to queue links
+                    if not frontier.counts().get("in_progress"):
+                        break
+                    time.sleep(idle_wait)
+                    continue
+                url, depth, kind = claimed[0]
+                if fetched:
+                    random_sleep(*delay)
+                try:
+                    with metrics.stage("fetch"):
+                        page = fetch_page(driver, url)
+                except Exception as e:
+                    print(f"[w{worker_id}] Error on {url}: {e}")
+                    page = None
+                fetched += 1
+                if page is None:
+                    frontier.finish(url, ok=False)
+                    metrics.count("pages_failed")
+                    continue
+                metrics.count(f"{kind}_pages")
+
+                if depth < max_depth:
+                    frontier.add([link for link in page["links"] if is_listing(link)], depth + 1, "listing")
+                if kind == "listing" and not (page["title"] and page["specs"]):
+                    # Loaded without its details (e.g. a blocked page): retried on a later run
+                    frontier.finish(url, ok=False)
+                    metrics.count("listings_empty")
+                    continue
+                if kind == "listing":
+                    out.write(json.dumps(flat_record(url, page), ensure_ascii=False) + "\n")
+                    out.flush()
+                    written += 1
+                    metrics.count("listings_written")
+                    budget.spend()
+                frontier.finish(url)
+    finally:
+        driver.quit()
+    return written, fetched
+
+
+def crawl(output_dir, workers=2, max_listings=MAX_CRAWL, search_pages=5, max_depth=3, delay=(1, 2),
+          base_url=SITE_URL, frontier_path=DEFAULT_FRONTIER_PATH, headless=False, chrome_version=None,
+          driver_factory=None, max_attempts=DEFAULT_MAX_ATTEMPTS, metrics=NO_METRICS):
+    """
+    Crawl up to `max_listings` new listings with a pool of browsers sharing one frontier
+
+    URLs that failed or loaded without listing details on earlier runs are
+    fetched again, until they have failed `max_attempts` times.
+
+    Args:
+        output_dir (str): Directory receiving the `crawl_<timestamp>_w<N>.jsonl` files
+        workers (int): Number of browsers
+        max_listings (int): Listings to write before stopping (workers in flight may add a few)
+        search_pages (int): Search-result pages queued as seeds (fetched again on every run)
+        max_depth (int): Link distance from the seeds beyond which links are not followed
+        delay (tuple): (min, max) seconds each browser waits between two of its pages
+        base_url (str): Scheme and host to crawl, e.g. a local fixture server
+        frontier_path (str): SQLite frontier shared across runs
+        headless (bool): Run the browsers without a window
+        chrome_version (int): Major Chrome version for undetected-chromedriver; auto-detected if None
+        driver_factory (callable): Builds one WebDriver per worker instead of `make_driver`
+        max_attempts (int): Failed fetches of a URL after which it is no longer retried
+        metrics (Metrics): Receives the fetch timings and page/listing counts
+
+    Returns:
+        int: Number of listings written
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    frontier = CrawlFrontier(frontier_path)
+    frontier.add(search_urls(search_pages, base_url), depth=0, kind="search", revisit=True)
+    retried = frontier.retry_failed(max_attempts)
+    if retried:
+        print(f"Retrying {retried} URLs that failed on earlier runs")
+    budget = ListingBudget(max_listings)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    paths = [os.path.join(output_dir, f"crawl_{timestamp}_w{i}.jsonl") for i in range(workers)]
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(crawl_worker, i, frontier, paths[i], budget, max_depth, delay, headless,
+                                       chrome_version, driver_factory, metrics=metrics) for i in range(workers)]
+            results = [future.result() for future in futures]
+    finally:
+        frontier.close()
+    elapsed = time.perf_counter() - started
+
+    for path in paths:
+        if os.path.exists(path) and os.path.getsize(path) == 0:
+            os.remove(path)
+    written = sum(w for w, _ in results)
+    fetched = sum(f for _, f in results)
+    browser_hours = workers * elapsed / 3600
+    print(f"\nWrote {written} listings from {fetched} pages with {workers} browsers in {elapsed:.1f}s "
+          f"({written / max(browser_hours, 1e-9):.0f} listings per browser-hour)")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl batdongsan.com.vn listings from a persistent frontier")
+    parser.add_argument("--workers", type=int, default=2, help="Number of browsers")
+    parser.add_argument("--max-listings", type=int, default=MAX_CRAWL, help="New listings to write")
+    parser.add_argument("--search-pages", type=int, default=5, help="Search-result pages used as seeds")
+    parser.add_argument("--max-depth", type=int, default=3, help="Links followed from the seeds")
+    parser.add_argument("--delay", type=float, nargs=2, default=[1, 2], metavar=("MIN", "MAX"),
+                        help="Seconds each browser waits between its pages")
+    parser.add_argument("--base-url", default=SITE_URL, help="Site to crawl, e.g. a local fixture server")
+    parser.add_argument("--frontier", default=DEFAULT_FRONTIER_PATH, help="SQLite crawl frontier")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help="Failed fetches of a URL after which later runs stop retrying it")
+    parser.add_argument("--output-dir", help="Where to write crawl_*.jsonl files")
+    parser.add_argument("--headless", action="store_true",
+                        help="Run without browser windows (the site sometimes hides listing details from headless Chrome)")
+    parser.add_argument("--chrome-version", type=int, help="Major version of the installed Chrome")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or os.path.join(os.getcwd(), 'Data Collection', 'Datasets', 'batdongsan.com', 'json')
+    with instrumented("crawl_batdongsan", args.metrics, args.trace_memory, args.profile) as metrics:
+        crawl(output_dir, workers=args.workers, max_listings=args.max_listings, search_pages=args.search_pages,
+              max_depth=args.max_depth, delay=tuple(args.delay), base_url=args.base_url,
+              frontier_path=args.frontier, headless=args.headless, chrome_version=args.chrome_version,
+              max_attempts=args.max_attempts, metrics=metrics)
+
+
+if __name__ == "__main__":
+    main()
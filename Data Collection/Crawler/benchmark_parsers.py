@@ -0,0 +1,90 @@
+"""
+Micro-benchmark for the alonhadat parser backends.
+
+Pages come from raw `page_N.html` fixtures when present, otherwise they are
+rendered from the saved `page_N.jsonl` files (or the directory's segment
+store) with the fixture server's markup.
+Every backend is checked against the bs4 reference before it is timed.
+
+Usage:
+    python benchmark_parsers.py --pages 500 --repeat 3
+"""
+import argparse
+import glob
+import io
+import os
+import time
+from contextlib import redirect_stdout
+
+from alonhadat_parsers import PARSERS
+from fixture_server import load_fixture_page
+from segment_store import SegmentStore, page_sort_key
+
+DEFAULT_DIR = os.path.join(os.path.dirname(__file__), "..", "Datasets", "alonhadat.com", "json")
+
+
+def load_pages(fixture_dir, limit=None):
+    """Return the HTML of up to `limit` fixture pages, ordered by page number"""
+    page_nums = set()
+    for path in glob.glob(os.path.join(fixture_dir, "page_*.*")):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if stem[5:].isdigit():
+            page_nums.add(int(stem[5:]))
+    if SegmentStore.exists(fixture_dir):
+        page_nums.update(page_sort_key(key)[1] for key in SegmentStore(fixture_dir, read_only=True).keys()
+                         if page_sort_key(key)[0] == 0)
+    page_nums = sorted(page_nums)[:limit]
+    return [load_fixture_page(fixture_dir, n) for n in page_nums]
+
+
+def check_parity(pages, backend):
+    """Count pages whose records differ from the bs4 reference"""
+    reference, candidate = PARSERS["bs4"], PARSERS[backend]
+    mismatches = 0
+    with redirect_stdout(io.StringIO()):
+        for html in pages:
+            if reference(html) != candidate(html):
+                mismatches += 1
+    return mismatches
+
+
+def benchmark(pages, backend, repeat=3):
+    """Return (best seconds, items parsed) for one pass over `pages`"""
+    parse = PARSERS[backend]
+    best, items = float("inf"), 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            items = sum(len(parse(html)[1]) for html in pages)
+        best = min(best, time.perf_counter() - started)
+    return best, items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark alonhadat HTML parser backends")
+    parser.add_argument("--fixture-dir", default=DEFAULT_DIR, help="Directory of page_N.html / page_N.jsonl files")
+    parser.add_argument("--pages", type=int, default=None, help="Limit the number of pages")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes per backend (best is reported)")
+    parser.add_argument("--backends", nargs="+", default=sorted(PARSERS), choices=sorted(PARSERS))
+    args = parser.parse_args()
+
+    pages = load_pages(args.fixture_dir, args.pages)
+    if not pages:
+        print(f"No fixture pages found in {args.fixture_dir}")
+        return
+    print(f"Loaded {len(pages)} pages ({sum(map(len, pages)) / 1e6:.1f} MB of HTML)\n")
+
+    print(f"{'backend':<12}{'items':>8}{'seconds':>10}{'items/s':>12}{'speedup':>9}  parity")
+    baseline = None
+    for backend in args.backends:
+        mismatches = check_parity(pages, backend) if backend != "bs4" else 0
+        seconds, items = benchmark(pages, backend, args.repeat)
+        rate = items / seconds if seconds else float("inf")
+        baseline = baseline or (rate if backend == "bs4" else None)
+        speedup = f"{rate / baseline:.1f}x" if baseline else "-"
+        parity = "ok" if not mismatches else f"{mismatches} pages differ"
+        print(f"{backend:<12}{items:>8}{seconds:>10.3f}{rate:>12,.0f}{speedup:>9}  {parity}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Persistent crawl frontier: a queue of discovered URLs plus a Bloom filter of every URL ever seen.
+
+The queue is a SQLite table (`crawl_frontier.sqlite` next to this script).
+URLs are handed out breadth-first, in discovery order, so two runs over the
+same site schedule the same pages. A URL in flight when a run stops is
+queued again on the next start, and a URL that failed is queued again by
+`retry_failed` until it has failed `max_attempts` times.
+
+Discovered links are checked against an in-memory Bloom filter before they
+touch the database. Link-heavy pages (search results, "similar listings"
+blocks) mostly repeat URLs that are already known. The filter is saved with
+the queue. At the default error rate, about one new URL in 10,000 is wrongly
+taken for a known one and skipped.
+"""
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_FRONTIER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crawl_frontier.sqlite")
+# Failed fetches of a URL after which later runs stop retrying it
+DEFAULT_MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frontier (
+    seq           INTEGER PRIMARY KEY AUTOINCREMENT,
+    url           TEXT UNIQUE NOT NULL,
+    kind          TEXT,
+    depth         INTEGER,
+    state         TEXT NOT NULL DEFAULT 'queued',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    discovered_at REAL,
+    fetched_at    REAL
+);
+CREATE INDEX IF NOT EXISTS frontier_queue ON frontier (state, depth, seq);
+CREATE TABLE IF NOT EXISTS meta (
+    name  TEXT PRIMARY KEY,
+    value BLOB
+);
+"""
+
+
+def canonical_url(url):
+    """URL without query string, fragment or trailing slash, host in lowercase"""
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/") or "/", "", ""))
+
+
+class BloomFilter:
+    """
+    Set membership in a fixed bit array: no false negatives, false positives at about `error_rate`
+
+    Args:
+        capacity (int): Number of items the filter is sized for
+        error_rate (float): False-positive rate once `capacity` items are added
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=1e-4):
+        self.capacity = int(capacity)
+        self.error_rate = float(error_rate)
+        self.n_bits = max(8, int(math.ceil(-self.capacity * math.log(self.error_rate) / math.log(2) ** 2)))
+        self.n_hashes = max(1, int(round(self.n_bits / self.capacity * math.log(2))))
+        self.bits = bytearray((self.n_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one 128-bit digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def __contains__(self, item):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+    def add(self, item):
+        """Add `item`; returns False if it was (probably) already present"""
+        positions = self._positions(item)
+        if all(self.bits[p >> 3] & (1 << (p & 7)) for p in positions):
+            return False
+        for p in positions:
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+        return True
+
+    def params(self):
+        return f"{self.capacity}:{self.error_rate!r}"
+
+
+class CrawlFrontier:
+    """
+    Thread-safe URL queue with a persisted seen-set
+
+    Args:
+        path (str): SQLite file; created if missing
+        capacity (int): Expected number of distinct URLs (sizes the Bloom filter)
+        error_rate (float): Bloom filter false-positive rate at `capacity`
+    """
+
+    def __init__(self, path=DEFAULT_FRONTIER_PATH, capacity=1_000_000, error_rate=1e-4):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(frontier)")}
+        if "attempts" not in columns:
+            # Frontiers created before failed URLs were retried
+            self.conn.execute("ALTER TABLE frontier ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self.seen = BloomFilter(capacity, error_rate)
+        stored = dict(self.conn.execute("SELECT name, value FROM meta WHERE name IN ('bloom', 'bloom_params')"))
+        if stored.get("bloom_params") == self.seen.params() and stored.get("bloom") is not None:
+            self.seen.bits = bytearray(stored["bloom"])
+            self.seen.count = self.conn.execute("SELECT COUNT(*) FROM frontier").fetchone()[0]
+        else:
+            # New frontier or resized filter: rebuild it from the queue
+            for (url,) in self.conn.execute("SELECT url FROM frontier"):
+                self.seen.add(url)
+        # Pages in flight when the last run stopped are fetched again
+        self.conn.execute("UPDATE frontier SET state = 'queued' WHERE state = 'in_progress'")
+        self.conn.commit()
+
+    def add(self, urls, depth=0, kind=None, revisit=False):
+        """
+        Queue the URLs never seen before
+
+        Args:
+            urls (iterable): Discovered URLs
+            depth (int): Link distance from the seeds
+            kind (str): Page type recorded with the URL, e.g. "search" or "listing"
+            revisit (bool): Queue the URLs again even if already fetched (e.g. search pages of a new run)
+
+        Returns:
+            int: Number of URLs added to the queue
+        """
+        now = time.time()
+        with self.lock:
+            new, known = [], []
+            for url in urls:
+                url = canonical_url(url)
+                if self.seen.add(url):
+                    new.append((url, kind, depth, now))
+                elif revisit:
+                    known.append((depth, url))
+            if new:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO frontier (url, kind, depth, discovered_at) VALUES (?, ?, ?, ?)", new)
+            if known:
+                self.conn.executemany(
+                    "UPDATE frontier SET state = 'queued', depth = ? WHERE url = ? AND state != 'in_progress'", known)
+                # A Bloom false positive has no row yet
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO frontier (url, kind, depth, discovered_at) VALUES (?, ?, ?, ?)",
+                    [(url, kind, depth, now) for depth, url in known])
+            self.conn.commit()
+        return len(new) + len(known)
+
+    def claim(self, n=1):
+        """
+        Take the next `n` queued URLs (shallowest first, then in discovery order)
+
+        Returns:
+            list: (url, depth, kind) tuples, marked in progress
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, url, depth, kind FROM frontier WHERE state = 'queued' ORDER BY depth, seq LIMIT ?", (n,)
+            ).fetchall()
+            self.conn.executemany("UPDATE frontier SET state = 'in_progress' WHERE seq = ?", [(r[0],) for r in rows])
+            self.conn.commit()
+        return [(url, depth, kind) for _, url, depth, kind in rows]
+
+    def finish(self, url, ok=True):
+        """Mark a claimed URL as fetched ('done') or failed for this run ('failed', one more attempt counted)"""
+        with self.lock:
+            self.conn.execute("UPDATE frontier SET state = ?, fetched_at = ?, attempts = attempts + ? WHERE url = ?",
+                              ("done" if ok else "failed", time.time(), int(not ok), canonical_url(url)))
+            self.conn.commit()
+
+    def retry_failed(self, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Queue the failed URLs again, except those that already failed `max_attempts` times
+
+        Returns:
+            int: Number of URLs queued again
+        """
+        with self.lock:
+            cursor = self.conn.execute("UPDATE frontier SET state = 'queued' WHERE state = 'failed' AND attempts < ?",
+                                       (max_attempts,))
+            self.conn.commit()
+        return cursor.rowcount
+
+    def requeue(self, url):
+        """Put a claimed URL back in the queue, e.g. when its worker stops early"""
+        with self.lock:
+            self.conn.execute("UPDATE frontier SET state = 'queued' WHERE url = ?", (canonical_url(url),))
+            self.conn.commit()
+
+    def counts(self):
+        """Number of URLs per state"""
+        with self.lock:
+            return dict(self.conn.execute("SELECT state, COUNT(*) FROM frontier GROUP BY state"))
+
+    def save(self):
+        """Persist the Bloom filter next to the queue"""
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                  [("bloom", bytes(self.seen.bits)), ("bloom_params", self.seen.params())])
+            self.conn.commit()
+
+    def close(self):
+        self.save()
+        self.conn.close()
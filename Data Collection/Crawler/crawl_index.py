@@ -0,0 +1,159 @@
+"""
+Local SQLite index of crawled pages.
+
+For every page URL the index remembers the validators the server sent
+(ETag / Last-Modified), a content hash of the extracted listings and their
+record IDs. Crawlers use it to send conditional GETs, to rewrite `page_N`
+files only when the listings actually changed, and to resume without prompts.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crawl_index.sqlite")
+LISTING_ID_RE = re.compile(r"-(\d+)\.html?$")
+# Fields that change without the listing changing (alonhadat's relative "Hôm nay" / "Hôm qua" dates)
+VOLATILE_FIELDS = ("date",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url           TEXT PRIMARY KEY,
+    source        TEXT NOT NULL,
+    page_num      INTEGER,
+    etag          TEXT,
+    last_modified TEXT,
+    content_hash  TEXT,
+    record_ids    TEXT,
+    fetched_at    REAL,
+    changed_at    REAL
+);
+CREATE INDEX IF NOT EXISTS pages_source_page ON pages (source, page_num);
+"""
+
+
+def stable_fields(record):
+    """`record` without its VOLATILE_FIELDS"""
+    return {key: value for key, value in record.items() if key not in VOLATILE_FIELDS}
+
+
+def record_id(record):
+    """Stable ID of one listing: the numeric ID in its URL, or a hash of its content"""
+    url = record.get("url") or ""
+    match = LISTING_ID_RE.search(url)
+    if match:
+        return match.group(1)
+    if url:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+    payload = json.dumps(stable_fields(record), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def content_hash(records):
+    """Hash of a page's listings, insensitive to dict key order and to VOLATILE_FIELDS"""
+    payload = json.dumps([stable_fields(record) for record in records], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CrawlIndex:
+    """Thread-safe wrapper around the SQLite crawl index"""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified, content_hash, record_ids, fetched_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "etag": row[0],
+            "last_modified": row[1],
+            "content_hash": row[2],
+            "record_ids": json.loads(row[3]) if row[3] else [],
+            "fetched_at": row[4],
+        }
+
+    def conditional_headers(self, url):
+        """Headers turning the next request for `url` into a conditional GET"""
+        entry = self.get(url)
+        headers = {}
+        if entry and entry["content_hash"]:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def mark_not_modified(self, url):
+        """Record that the server answered 304 for `url`"""
+        with self.lock:
+            self.conn.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self.conn.commit()
+
+    def is_changed(self, url, records):
+        """Whether `records` differ from the last stored version of `url` (or it is new), without storing them"""
+        with self.lock:
+            row = self.conn.execute("SELECT content_hash FROM pages WHERE url = ?", (url,)).fetchone()
+        return row is None or row[0] != content_hash(records)
+
+    def update(self, url, source, page_num, records, etag=None, last_modified=None):
+        """
+        Store the latest fetch of `url` and report whether its listings changed
+
+        Call it once the page is saved: a stored hash the saved copy does not
+        match would make later crawls skip the page as unchanged.
+
+        Returns:
+            bool: True if the listings differ from the last stored version (or are new)
+        """
+        new_hash = content_hash(records)
+        ids = json.dumps([record_id(r) for r in records])
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT content_hash, changed_at FROM pages WHERE url = ?", (url,)).fetchone()
+            changed = row is None or row[0] != new_hash
+            changed_at = now if changed else row[1]
+            self.conn.execute(
+                """
+                INSERT INTO pages (url, source, page_num, etag, last_modified, content_hash, record_ids, fetched_at, changed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    etag = excluded.etag, last_modified = excluded.last_modified,
+                    content_hash = excluded.content_hash, record_ids = excluded.record_ids,
+                    fetched_at = excluded.fetched_at, changed_at = excluded.changed_at
+                """,
+                (url, source, page_num, etag, last_modified, new_hash, ids, now, changed_at),
+            )
+            self.conn.commit()
+        return changed
+
+    def fresh_pages(self, source, max_age=24 * 3600):
+        """Page numbers of `source` fetched within the last `max_age` seconds"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT page_num FROM pages WHERE source = ? AND fetched_at >= ?", (source, time.time() - max_age)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def known_record_ids(self, source):
+        """All record IDs currently indexed for `source`"""
+        with self.lock:
+            rows = self.conn.execute("SELECT record_ids FROM pages WHERE source = ?", (source,)).fetchall()
+        ids = set()
+        for (raw,) in rows:
+            if raw:
+                ids.update(json.loads(raw))
+        return ids
@@ -0,0 +1,356 @@
+"""
+Local stand-in for alonhadat.com.vn, nhatot.com and batdongsan.com.vn that
+serves pages rendered from saved `page_N.jsonl` / `page_N.json` files or
+segment stores (or raw `page_N.html` fixtures when present). Every saved
+alonhadat listing also gets a detail page at its URL path, with a spec table
+built from the record; specs the saved cards lack (orientation, road width,
+dimensions, parking, ...) get synthetic values derived from the listing URL,
+the same on every run. For batdongsan, every saved listing gets its own
+detail page linking to a few "similar" listings, and `/nha-dat-ban/pN`
+lists them 20 per page.
+
+Usage:
+    python fixture_server.py --json-dir "../Datasets/alonhadat.com/json" --port 8765
+    python alonhadatcrawl.py 1 50 --workers 8 --rate 50 --base-url http://127.0.0.1:8765 --output-dir /tmp/out
+
+    python alonhadat_details.py --max-requests 200 --base-url http://127.0.0.1:8765 --details-dir /tmp/details
+
+    python fixture_server.py --site nhatot --json-dir "../Datasets/nhatot.com/json" --port 8766
+    python nhatotcrawl.py 1 50 --workers 4 --base-url http://127.0.0.1:8766 --output-dir /tmp/out
+
+    python fixture_server.py --site batdongsan --port 8767
+    python batdongsancrawl.py --search-pages 5 --base-url http://127.0.0.1:8767 --output-dir /tmp/out
+"""
+import argparse
+import functools
+import hashlib
+import html
+import json
+import os
+import re
+import sys
+import threading
+from pathlib import Path
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Datasets"))
+from segment_store import SegmentStore, crawl_files
+from stream_merge import iter_records
+from alonhadat_parsers import listing_url
+
+SITE_URL = "https://alonhadat.com.vn"
+PAGE_RE = re.compile(r"/trang--(\d+)\.html$")
+NHATOT_PAGE_RE = re.compile(r"/mua-ban-bat-dong-san-ha-noi\?(?:.*&)?page=(\d+)")
+BATDONGSAN_SEARCH_RE = re.compile(r"^/nha-dat-ban(?:/p(\d+))?/?$")
+BATDONGSAN_PAGE_SIZE = 20
+BATDONGSAN_SIMILAR = 4
+# Choices of the synthetic detail specs, picked by a hash of the listing URL
+ORIENTATIONS = ["Đông", "Tây", "Nam", "Bắc", "Đông Nam", "Đông Bắc", "Tây Nam", "Tây Bắc"]
+LEGAL_STATUSES = ["Sổ hồng/ Sổ đỏ", "Giấy tờ hợp lệ", "Đang chờ sổ"]
+PROPERTY_TYPES = ["Nhà mặt tiền", "Nhà trong hẻm", "Biệt thự, nhà liền kề"]
+
+
+def load_records(jsonl_path):
+    """Read the records of one saved `page_N.jsonl` file (or `page_N.json` list)"""
+    records = []
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        if jsonl_path.endswith(".json"):
+            return json.load(f)
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def render_item(record):
+    """Render one listing record as a `content-item` block using the site's markup"""
+    e = lambda value: html.escape(str(value or ""), quote=True)
+    url = record.get("url", "")
+    href = url[len(SITE_URL):] if url.startswith(SITE_URL) else url
+    address_parts = "".join(
+        f"<span>{e(part)}</span>" for part in str(record.get("address") or "").split(", ") if part
+    )
+    spans = [
+        f'<span class="floors" title="{e(record.get("floors"))}"></span>',
+        f'<span class="bedroom" title="{e(record.get("bedrooms"))}"></span>',
+    ]
+    if record.get("road_width"):
+        spans.append(f'<span class="road-width" title="Đường trước nhà: {e(record["road_width"])}"></span>')
+    if record.get("car_parking"):
+        spans.append(f'<span class="parking" title="Chỗ để xe: {e(record["car_parking"])}"></span>')
+    return (
+        '<div class="content-item">'
+        f'<div class="ct_title"><a href="{e(href)}">{e(record.get("title"))}</a></div>'
+        f'<div class="ct_date">{e(record.get("date"))}</div>'
+        f'<div class="ct_content">{e(record.get("description"))}</div>'
+        f'<div class="ct_dt"><label>Diện tích:</label>{e(record.get("area"))}</div>'
+        f'<div class="ct_price"><label>Giá:</label>{e(record.get("price"))}</div>'
+        f'<div class="ct_dis">{address_parts}</div>'
+        f'<div class="ct_more">{"".join(spans)}</div>'
+        '</div>'
+    )
+
+
+def render_page(records):
+    """Render a full search-result page for a list of records"""
+    items = "\n".join(render_item(record) for record in records)
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>alonhadat fixture</title></head>'
+        f'<body><div class="content-items">\n{items}\n</div></body></html>'
+    )
+
+
+def synthetic_specs(url):
+    """Detail specs for a listing whose saved card lacks them, derived from its URL (stable across runs)"""
+    digest = hashlib.sha1(url.encode("utf-8")).digest()
+    return {
+        "orientation": ORIENTATIONS[digest[0] % len(ORIENTATIONS)],
+        "road_width": f"{3 + digest[1] % 10}m",
+        "dimension": f"{3 + digest[2] % 6}x{8 + digest[3] % 13}",
+        "car_parking": digest[4] % 2 == 0,
+        "legal_status": LEGAL_STATUSES[digest[5] % len(LEGAL_STATUSES)],
+        "property_type": PROPERTY_TYPES[digest[6] % len(PROPERTY_TYPES)],
+    }
+
+
+def render_detail_page(record):
+    """Render an alonhadat listing detail page: description, address and the spec table"""
+    e = lambda value: html.escape(str(value or ""), quote=True)
+    number = lambda value: (re.findall(r"\d+", str(value or "")) or ["---"])[0]
+    code = re.search(r"-(\d+)\.html?$", record.get("url", ""))
+    synthetic = synthetic_specs(record.get("url", ""))
+    spec = lambda field: record.get(field) or synthetic[field]
+    width, _, length = str(spec("dimension")).partition("x")
+    specs = [
+        ("Mã tin", code.group(1) if code else "---"),
+        ("Loại tin", "Cần bán"),
+        ("Loại BDS", synthetic["property_type"]),
+        ("Hướng", spec("orientation")),
+        ("Đường trước nhà", spec("road_width")),
+        ("Pháp lý", synthetic["legal_status"]),
+        ("Chiều ngang", f"{width}m" if width else "---"),
+        ("Chiều dài", f"{length}m" if length else "---"),
+        ("Số lầu", number(record.get("floors"))),
+        ("Số phòng ngủ", number(record.get("bedrooms"))),
+        ("Chổ để xe hơi", '<img src="/publish/img/check.gif">' if spec("car_parking") else "---"),
+    ]
+    rows = "".join(
+        f"<tr><td>{e(label)}</td><td>{value if value.startswith('<img') else e(value)}</td></tr>"
+        for label, value in specs
+    )
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>alonhadat fixture</title></head>'
+        f'<body><div class="property"><div class="title"><h1>{e(record.get("title"))}</h1></div>'
+        f'<div class="detail text-content">{e(record.get("description") or record.get("title"))}</div>'
+        f'<div class="address"><span class="label">Địa chỉ tài sản:</span>'
+        f'<span class="value">{e(record.get("address"))}</span></div>'
+        f'<div class="moreinfor1"><div class="infor"><table>{rows}</table></div></div>'
+        '</div></body></html>'
+    )
+
+
+class AlonhadatDetails:
+    """Detail pages of every saved alonhadat listing, by URL path"""
+
+    def __init__(self, fixture_dir):
+        self.records = {}
+        for path in crawl_files(fixture_dir, "*.jsonl"):
+            for record in iter_records(path):
+                if record.get("url"):
+                    self.records[urlsplit(listing_url(record["url"])).path] = record
+
+    def page(self, path):
+        record = self.records.get(path.split("?", 1)[0])
+        return render_detail_page(record) if record is not None else None
+
+
+def render_nhatot_card(record):
+    """Render one nhatot record as a listing card with the class names nhatotcrawl.py selects"""
+    e = lambda value: html.escape(str(value or ""), quote=True)
+    link = f'<a href="{e(record["url"])}">' if record.get("url") else "<a>"
+    return (
+        f'<li class="crd7gu7">{link}'
+        f'<h3 class="a15fd2pn">{e(record.get("Title"))}</h3>'
+        f'<div class="tle2ik0">{e(record.get("Description"))}</div>'
+        '<div class="szp40s8 r9vw5if">'
+        f'<span>{e(record.get("Price"))}</span><span>{e(record.get("Price per m²"))}</span>'
+        f'<span>{e(record.get("Space"))}</span>'
+        '</div>'
+        f'<div class="tx5yyjc">{e(record.get("Location"))}</div>'
+        '</a></li>'
+    )
+
+
+def render_nhatot_page(records):
+    """Render a full nhatot search-result page for a list of records"""
+    items = "\n".join(render_nhatot_card(record) for record in records)
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>nhatot fixture</title></head>'
+        f'<body><ul>\n{items}\n</ul></body></html>'
+    )
+
+
+# site -> (saved page extension, renderer, page number regex over the request path)
+SITES = {
+    "alonhadat": (".jsonl", render_page, PAGE_RE),
+    "nhatot": (".json", render_nhatot_page, NHATOT_PAGE_RE),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def fixture_store(fixture_dir):
+    """Segment store of a fixture directory, opened once (fixtures do not change while served)"""
+    return SegmentStore(fixture_dir, read_only=True)
+
+
+def load_fixture_page(fixture_dir, page_num, site="alonhadat"):
+    """Return the HTML for `page_num`, preferring a raw `.html` fixture over a rendered saved page"""
+    html_path = os.path.join(fixture_dir, f"page_{page_num}.html")
+    if os.path.exists(html_path):
+        with open(html_path, "r", encoding="utf-8") as f:
+            return f.read()
+    extension, render, _ = SITES[site]
+    records_path = os.path.join(fixture_dir, f"page_{page_num}{extension}")
+    if os.path.exists(records_path):
+        return render(load_records(records_path))
+    if SegmentStore.exists(fixture_dir):
+        records = fixture_store(fixture_dir).read(f"page_{page_num}")
+        if records is not None:
+            return render(records)
+    return None
+
+
+class BatdongsanFixture:
+    """Search and detail pages of batdongsan built from saved flat listing records (one per URL)"""
+
+    def __init__(self, fixture_dir):
+        records = {}
+        for path in crawl_files(fixture_dir, "*.jsonl"):
+            for record in iter_records(path):
+                if record.get("url"):
+                    records.setdefault(urlsplit(record["url"]).path, record)
+        self.paths = list(records)
+        self.records = records
+        self.position = {path: i for i, path in enumerate(self.paths)}
+
+    def similar(self, i):
+        """Paths of the listings linked from listing `i`: its successors plus a far jump"""
+        n = len(self.paths)
+        picks = [(i + step) % n for step in range(1, BATDONGSAN_SIMILAR)] + [(i * 7 + 3) % n]
+        return [self.paths[j] for j in picks]
+
+    def card(self, path):
+        e = lambda value: html.escape(str(value or ""), quote=True)
+        return (f'<div class="re__card-info"><a class="re__card-info-content" href="{e(path)}">'
+                f'{e(self.records[path].get("title"))}</a></div>')
+
+    def search_page(self, page_num):
+        start = (page_num - 1) * BATDONGSAN_PAGE_SIZE
+        paths = self.paths[start:start + BATDONGSAN_PAGE_SIZE]
+        if not paths:
+            return None
+        cards = "\n".join(self.card(path) for path in paths)
+        return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>batdongsan fixture</title></head>'
+                f'<body><div class="re__srp-list">\n{cards}\n</div></body></html>')
+
+    def listing_page(self, path):
+        e = lambda value: html.escape(str(value or ""), quote=True)
+        record = self.records[path]
+        specs = "".join(
+            '<div class="re__pr-specs-content-item">'
+            f'<span class="re__pr-specs-content-item-title">{e(label)}</span>'
+            f'<span class="re__pr-specs-content-item-value">{e(value)}</span></div>'
+            for label, value in record.items() if label not in ("title", "url")
+        )
+        similar = "".join(self.card(other) for other in self.similar(self.position[path]))
+        return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>batdongsan fixture</title></head>'
+                f'<body><h1 class="re__pr-title">{e(record.get("title"))}</h1>'
+                f'<div class="re__pr-specs-content">{specs}</div>'
+                f'<div class="re__similar-listings">{similar}</div></body></html>')
+
+    def page(self, path):
+        path = path.split("?", 1)[0]
+        match = BATDONGSAN_SEARCH_RE.match(path)
+        if match:
+            return self.search_page(int(match.group(1) or 1))
+        return self.listing_page(path) if path in self.records else None
+
+
+def page_loader(fixture_dir, site="alonhadat"):
+    """Function returning the HTML served for a request path (None for a 404)"""
+    if site == "batdongsan":
+        return BatdongsanFixture(fixture_dir).page
+    page_re = SITES[site][2]
+    details = AlonhadatDetails(fixture_dir) if site == "alonhadat" else None
+
+    def load(path):
+        match = page_re.search(path if site == "nhatot" else path.split("?", 1)[0])
+        if match:
+            return load_fixture_page(fixture_dir, int(match.group(1)), site)
+        return details.page(path) if details is not None else None
+    return load
+
+
+def make_handler(fixture_dir, site="alonhadat"):
+    load_page = page_loader(fixture_dir, site)
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real site
+
+        def do_GET(self):
+            body = load_page(self.path)
+            if body is None:
+                self.send_error(404)
+                return
+            payload = body.encode("utf-8")
+            # Validators let crawlers exercise conditional GETs against the fixtures
+            etag = '"' + hashlib.sha1(payload).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FixtureHandler
+
+
+def start_fixture_server(fixture_dir, host="127.0.0.1", port=0, site="alonhadat"):
+    """
+    Start the fixture server on a background thread
+
+    Returns:
+        tuple: (server, base_url); call `server.shutdown()` when done
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(fixture_dir, site))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve saved alonhadat, nhatot or batdongsan pages as HTML")
+    parser.add_argument("--site", default="alonhadat", choices=sorted(list(SITES) + ["batdongsan"]))
+    parser.add_argument("--json-dir", help="Saved pages to serve (default: the site's crawl output)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    json_dir = args.json_dir or os.path.join(os.path.dirname(__file__), "..", "Datasets", f"{args.site}.com", "json")
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(json_dir, args.site))
+    print(f"Serving {json_dir} at http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,372 @@
+"""
+nhatot.com search-result crawler driving a pool of headless browsers.
+
+Each worker owns one Chrome instance (undetected-chromedriver) and crawls its
+own contiguous range of pages. On every page the cards are read with a single
+in-page script that returns all of their fields as JSON, instead of one
+WebDriver round trip per field. Politeness delays apply once per page (plus an
+optional per-host rate shared by all browsers), not once per card.
+
+The crawler runs unchanged against the local fixture server:
+
+    python fixture_server.py --site nhatot --port 8766
+    python nhatotcrawl.py 1 50 --workers 4 --delay 0 0 --base-url http://127.0.0.1:8766 --output-dir /tmp/out
+
+Usage:
+    python nhatotcrawl.py                  # pages 1-200, 4 browsers
+    python nhatotcrawl.py 1 50 --workers 2 --index
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from alonhadatcrawl import HostRateLimiter
+from crawl_index import DEFAULT_INDEX_PATH, CrawlIndex
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Datasets"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / "Data Preprocessing"))
+from segment_store import SegmentStore
+from instrumentation import NO_METRICS, add_arguments, instrumented
+
+SITE_URL = "https://www.nhatot.com"
+PAGE_PATH = "/mua-ban-bat-dong-san-ha-noi?page={page_num}"
+MAX_PAGE = 200
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+]
+# Class names of the listing cards (see nhatotcrawl.ipynb); the price block is looked up inside each card
+SELECTORS = {
+    "card": ".crd7gu7",
+    "title": ".a15fd2pn",
+    "description": ".tle2ik0",
+    "location": ".tx5yyjc",
+    "price_block": "div.szp40s8.r9vw5if",
+}
+# Text of an element as Selenium's `.text` returns it: the rendered text (innerText) with
+# non-breaking spaces as spaces, runs of spaces collapsed, each line trimmed and blank lines dropped
+VISIBLE_TEXT_SCRIPT = r"""
+const visibleText = element => element.innerText.replace(/\u00a0/g, ' ').split('\n')
+    .map(line => line.replace(/[ \t\r\f\v]+/g, ' ').trim())
+    .filter(line => line).join('\n');
+"""
+# All cards of the page in one round trip: [{Title, Description, Price, Price per m², Space, Location, url}]
+EXTRACT_SCRIPT = VISIBLE_TEXT_SCRIPT + """
+const selectors = arguments[0];
+const text = (root, selector) => {
+    const element = root.querySelector(selector);
+    return element ? visibleText(element) : null;
+};
+return JSON.stringify(Array.from(document.querySelectorAll(selectors.card), card => {
+    const block = card.querySelector(selectors.price_block);
+    const spans = block ? Array.from(block.querySelectorAll('span'), visibleText) : [];
+    const link = card.matches('a[href]') ? card : card.querySelector('a[href]');
+    return {
+        'Title': text(card, selectors.title),
+        'Description': text(card, selectors.description),
+        'Price': spans.length >= 3 ? spans[0] : null,
+        'Price per m²': spans.length >= 3 ? spans[1] : null,
+        'Space': spans.length >= 3 ? spans[2] : null,
+        'Location': text(card, selectors.location),
+        'url': link ? link.href : null,
+    };
+}));
+"""
+COUNT_SCRIPT = "window.scrollTo(0, document.body.scrollHeight); return document.querySelectorAll(arguments[0]).length;"
+
+# undetected-chromedriver patches its driver binary on start-up: start browsers one at a time
+_driver_lock = threading.Lock()
+
+
+def random_sleep(min_seconds, max_seconds):
+    """Sleep for a random number of seconds between min and max."""
+    if max_seconds > 0:
+        time.sleep(random.uniform(min_seconds, max_seconds))
+
+
+def make_driver(headless=True, chrome_version=None):
+    """Start one Chrome instance with the crawler's options"""
+    import undetected_chromedriver as uc
+
+    options = uc.ChromeOptions()
+    options.add_argument("--incognito")
+    options.add_argument("--ignore-ssl-errors")
+    options.add_argument("--ignore-certificate-errors")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument(f"--user-agent={random.choice(USER_AGENTS)}")
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
+    else:
+        options.add_argument("--start-maximized")
+    with _driver_lock:
+        return uc.Chrome(options=options, version_main=chrome_version)
+
+
+def load_page_with_retries(driver, url, retries=3, delay=5):
+    for attempt in range(retries):
+        try:
+            driver.get(url)
+            return True
+        except Exception as e:
+            print(f"Failed to load page {url} (attempt {attempt + 1}/{retries}): {e}")
+            time.sleep(delay)
+    return False
+
+
+def wait_for_cards(driver, timeout=10, max_scrolls=3, scroll_pause=0.5):
+    """
+    Scroll until the number of cards stops growing (lazy-loaded listings)
+
+    Returns:
+        int: Number of cards on the page; 0 if none showed up within `timeout`
+    """
+    deadline = time.monotonic() + timeout
+    count = driver.execute_script(COUNT_SCRIPT, SELECTORS["card"])
+    while count == 0 and time.monotonic() < deadline:
+        time.sleep(scroll_pause)
+        count = driver.execute_script(COUNT_SCRIPT, SELECTORS["card"])
+    for _ in range(max_scrolls - 1):
+        if count == 0:
+            break
+        time.sleep(scroll_pause)
+        loaded = driver.execute_script(COUNT_SCRIPT, SELECTORS["card"])
+        if loaded == count:
+            break
+        count = loaded
+    return count
+
+
+def extract_cards(driver):
+    """Fields of every listing card on the current page, read with one script call"""
+    records = json.loads(driver.execute_script(EXTRACT_SCRIPT, SELECTORS))
+    # Fixtures and old crawls have no link: keep the historical schema for those cards
+    return [{key: value for key, value in record.items() if key != "url" or value} for record in records]
+
+
+def crawl_nhatot_page(driver, page_num, base_url=SITE_URL, rate_limiter=None, timeout=10):
+    """
+    Load one search-result page and return its listing records
+
+    Args:
+        driver: WebDriver owned by the calling worker
+        page_num (int): Search-result page number
+        base_url (str): Scheme and host to fetch from, e.g. a local fixture server
+        rate_limiter (HostRateLimiter): Politeness limiter shared by all browsers
+        timeout (float): Seconds to wait for the first card
+
+    Returns:
+        list: Records of the page; empty if the page failed to load or has no cards
+    """
+    url = base_url + PAGE_PATH.format(page_num=page_num)
+    if rate_limiter is not None:
+        rate_limiter.wait(url)
+    if not load_page_with_retries(driver, url):
+        print(f"Skipping page {page_num} after multiple failed attempts")
+        return []
+    if not wait_for_cards(driver, timeout=timeout):
+        print(f"No listings found on page {page_num}")
+        return []
+    return extract_cards(driver)
+
+
+def save_page(output_dir, page_num, data, store=None):
+    """
+    Write one page of records and return where it went
+
+    With a `SegmentStore` the page is appended to it as frame `page_N`;
+    otherwise it is written to `page_N.json`.
+    """
+    if store is not None:
+        store.append(f"page_{page_num}", data)
+        return f"{store.directory} (page_{page_num})"
+    output_file = os.path.join(output_dir, f"page_{page_num}.json")
+    with open(output_file, mode="w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False, indent=4)
+    return output_file
+
+
+def page_saved(output_dir, page_num, store=None):
+    """Whether a previous crawl of the page is on disk (page file or segment frame)"""
+    return (store is not None and f"page_{page_num}" in store) or \
+        os.path.exists(os.path.join(output_dir, f"page_{page_num}.json"))
+
+
+def crawl_and_save_page(driver, page_num, output_dir, index=None, base_url=SITE_URL, store=None, metrics=NO_METRICS,
+                        **crawl_kwargs):
+    """
+    Crawl one page and save it, skipping the write when the index has the same listings
+
+    Returns:
+        str: "saved", "unchanged" or "empty"
+    """
+    with metrics.stage("load"):
+        data = crawl_nhatot_page(driver, page_num, base_url=base_url, **crawl_kwargs)
+    if not data:
+        metrics.count("pages_empty")
+        return "empty"
+    url = base_url + PAGE_PATH.format(page_num=page_num)
+    if index is not None and not index.is_changed(url, data) and page_saved(output_dir, page_num, store):
+        index.update(url, "nhatot", page_num, data)
+        print(f"Listings on page {page_num} unchanged, keeping the saved copy")
+        metrics.count("pages_unchanged")
+        return "unchanged"
+    with metrics.stage("save"):
+        output = save_page(output_dir, page_num, data, store)
+    # Indexed only once saved, so a failed save is fetched and saved again next time
+    if index is not None:
+        index.update(url, "nhatot", page_num, data)
+    metrics.count("pages_saved")
+    metrics.count("records", len(data))
+    print(f"Saved {len(data)} listings of page {page_num} to {output}")
+    return "saved"
+
+
+def page_ranges(pages, workers):
+    """Split sorted `pages` into at most `workers` contiguous ranges of near-equal size"""
+    pages = sorted(pages)
+    workers = max(1, min(workers, len(pages)))
+    size, extra = divmod(len(pages), workers)
+    ranges, start = [], 0
+    for i in range(workers):
+        end = start + size + (i < extra)
+        ranges.append(pages[start:end])
+        start = end
+    return [r for r in ranges if r]
+
+
+def crawl_page_range(pages, output_dir, delay=(2, 4), headless=True, chrome_version=None, driver_factory=None,
+                     **crawl_kwargs):
+    """
+    One browser worker: crawl `pages` in order with its own driver
+
+    A page whose load, extraction or save raises is counted as failed and
+    the worker moves on to its next page.
+
+    Returns:
+        tuple: (page numbers crawled successfully, page numbers that returned nothing or raised)
+    """
+    driver = driver_factory() if driver_factory is not None else make_driver(headless, chrome_version)
+    saved, failed = [], []
+    try:
+        for i, page_num in enumerate(pages):
+            if i:
+                random_sleep(*delay)
+            try:
+                status = crawl_and_save_page(driver, page_num, output_dir, **crawl_kwargs)
+            except Exception as e:
+                print(f"Page {page_num} failed: {e}")
+                status = "error"
+            (failed if status in ("empty", "error") else saved).append(page_num)
+    finally:
+        driver.quit()
+    return saved, failed
+
+
+def crawl_pages_in_pool(pages, output_dir, workers=4, delay=(2, 4), rate=None, burst=1, base_url=SITE_URL,
+                        index=None, store=None, headless=True, chrome_version=None, driver_factory=None,
+                        metrics=NO_METRICS):
+    """
+    Crawl `pages` with a pool of browsers, each working through its own page range
+
+    Args:
+        pages (iterable): Page numbers to crawl
+        output_dir (str): Directory receiving the `page_N.json` files
+        workers (int): Number of browsers
+        delay (tuple): (min, max) seconds each browser waits between two of its pages
+        rate (float): Page loads per second allowed across all browsers; unlimited if None
+        burst (int): Page loads allowed back to back before the rate applies
+        base_url (str): Scheme and host to fetch from
+        index (CrawlIndex): Crawl index enabling change detection
+        store (SegmentStore): Segment store receiving the pages instead of `page_N.json` files
+        headless (bool): Run the browsers without a window
+        chrome_version (int): Major Chrome version for undetected-chromedriver; auto-detected if None
+        driver_factory (callable): Builds one WebDriver per worker instead of `make_driver`
+        metrics (Metrics): Receives the load/save timings and page counts
+
+    Returns:
+        tuple: (page numbers crawled successfully, page numbers that returned nothing or failed)
+    """
+    ranges = page_ranges(pages, workers)
+    limiter = HostRateLimiter(rate, burst) if rate else None
+    saved, failed = [], []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(ranges) or 1) as executor:
+        futures = {executor.submit(crawl_page_range, page_range, output_dir, delay, headless, chrome_version,
+                                   driver_factory, index=index, store=store, base_url=base_url,
+                                   rate_limiter=limiter, metrics=metrics): page_range
+                   for page_range in ranges}
+        for future in as_completed(futures):
+            try:
+                range_saved, range_failed = future.result()
+            except Exception as e:
+                # The browser itself failed (e.g. it did not start): its whole range is to re-crawl
+                print(f"Browser for pages {futures[future][0]}-{futures[future][-1]} failed: {e}")
+                range_saved, range_failed = [], futures[future]
+            saved.extend(range_saved)
+            failed.extend(range_failed)
+
+    elapsed = time.perf_counter() - started
+    crawled = len(saved) + len(failed)
+    print(f"\nFinished {crawled} pages with {len(ranges)} browsers in {elapsed:.1f}s "
+          f"({crawled / max(elapsed, 1e-9):.2f} pages/s): {len(saved)} saved or unchanged, {len(failed)} failed")
+    if failed:
+        print(f"Pages to re-crawl: {sorted(failed)}")
+    return sorted(saved), sorted(failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl nhatot.com search-result pages with a pool of browsers")
+    parser.add_argument("start_page", nargs="?", type=int, default=1, help="First page to crawl (default: 1)")
+    parser.add_argument("end_page", nargs="?", type=int, default=MAX_PAGE, help=f"Last page (default: {MAX_PAGE})")
+    parser.add_argument("--workers", type=int, default=4, help="Number of browsers")
+    parser.add_argument("--delay", type=float, nargs=2, default=[2, 4], metavar=("MIN", "MAX"),
+                        help="Seconds each browser waits between its pages")
+    parser.add_argument("--rate", type=float, help="Max page loads per second across all browsers")
+    parser.add_argument("--base-url", default=SITE_URL, help="Site to crawl, e.g. a local fixture server")
+    parser.add_argument("--output-dir", help="Crawl output directory")
+    parser.add_argument("--format", default="segments", choices=["segments", "files"],
+                        help="Append pages to the directory's zstd segment store, or write page_N.json files")
+    parser.add_argument("--show-browser", action="store_true", help="Open browser windows instead of headless")
+    parser.add_argument("--chrome-version", type=int, help="Major version of the installed Chrome")
+    parser.add_argument("--index", nargs="?", const=DEFAULT_INDEX_PATH,
+                        help="SQLite crawl index enabling change detection and resume")
+    parser.add_argument("--max-age", type=float, default=24,
+                        help="With --index, skip pages fetched within this many hours")
+    add_arguments(parser)
+    args = parser.parse_args()
+    with instrumented("crawl_nhatot", args.metrics, args.trace_memory, args.profile) as metrics:
+        run(args, metrics)
+
+
+def run(args, metrics):
+    """The crawl `main` runs for its parsed command line"""
+    index = CrawlIndex(args.index) if args.index else None
+
+    output_dir = args.output_dir or os.path.join(os.getcwd(), 'Data Collection', 'Datasets', 'nhatot.com', 'json')
+    os.makedirs(output_dir, exist_ok=True)
+    store = SegmentStore(output_dir) if args.format == "segments" else None
+
+    pages = range(args.start_page, args.end_page + 1)
+    if index is not None:
+        # Resume without prompting: pages fetched recently are already up to date
+        fresh = index.fresh_pages("nhatot", max_age=args.max_age * 3600)
+        pages = [page_num for page_num in pages if page_num not in fresh]
+        print(f"Skipping {args.end_page - args.start_page + 1 - len(pages)} pages fetched "
+              f"in the last {args.max_age:g} hours")
+
+    print(f"Crawling {len(pages)} pages with {args.workers} browsers...")
+    crawl_pages_in_pool(pages, output_dir, workers=args.workers, delay=tuple(args.delay), rate=args.rate,
+                        base_url=args.base_url, index=index, store=store, headless=not args.show_browser,
+                        chrome_version=args.chrome_version, metrics=metrics)
+
+
+if __name__ == "__main__":
+    main()
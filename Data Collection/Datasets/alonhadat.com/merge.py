@@ -1,52 +1,30 @@
-import os
-import json
-import csv
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from segment_store import crawl_files
+from stream_merge import merge_files_to_csv
+from instrumentation import instrumented
+
 # Adjust paths if needed
 jsonl_dir = Path(__file__).parent.parent / "alonhadat.com" / "json_new"
 output_dir = Path(__file__).parent.parent / "alonhadat.com" / "raw"
 output_filename = "merged_alonhadat_new.csv"
 
-output_dir.mkdir(parents=True, exist_ok=True)
-
-jsonl_files = list(jsonl_dir.glob("*.jsonl"))
-if not jsonl_files:
-    print(f"No .jsonl files found in {jsonl_dir}")
-    exit(1)
-
-all_records = []
-for jsonl_file in jsonl_files:
-    print(f"Processing {jsonl_file}")
-    try:
-        with jsonl_file.open('r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('//'):
-                    continue
-                try:
-                    record = json.loads(line)
-                    all_records.append(record)
-                except json.JSONDecodeError as de:
-                    print(f"Skipping invalid JSON in {jsonl_file}: {de}")
-    except Exception as e:
-        print(f"Error reading {jsonl_file}: {e}")
 
-if not all_records:
-    print("No records to write")
-    exit(1)
+def main():
+    jsonl_files = crawl_files(jsonl_dir, "*.jsonl")
+    if not jsonl_files:
+        print(f"No .jsonl files or segments found in {jsonl_dir}")
+        exit(1)
 
-# collect all field names
-fieldnames = set()
-for rec in all_records:
-    fieldnames.update(rec.keys())
-fieldnames = sorted(fieldnames)
+    print(f"Found {len(jsonl_files)} JSONL files and segments to process")
+    # Stage timings are written when PIPELINE_METRICS is set (see instrumentation.py)
+    with instrumented("merge_alonhadat") as metrics:
+        total = merge_files_to_csv(jsonl_files, output_dir / output_filename, metrics=metrics)
+    if not total:
+        exit(1)
 
-out_path = output_dir / output_filename
-with out_path.open('w', newline='', encoding='utf-8-sig') as csvfile:
-    writer = csv.DictWriter(csvfile, fieldnames=fieldnames, quoting=csv.QUOTE_NONNUMERIC)
-    writer.writeheader()
-    writer.writerows(all_records)
 
-print(f"Merged {len(all_records)} records into {out_path}")
-print("Columns:", fieldnames)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
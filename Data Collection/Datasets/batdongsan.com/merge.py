@@ -1,72 +1,40 @@
 import os
-import json
-import csv
+import sys
 from pathlib import Path
 
-def merge_jsonl_to_csv(json_dir, output_dir, output_filename="merged_data.csv"):
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from segment_store import crawl_files
+from stream_merge import merge_files_to_csv
+from instrumentation import instrumented
+
+def merge_jsonl_to_csv(json_dir, output_dir, output_filename="merged_data.csv", workers=None):
     """
-    Merge all JSONL files from json_dir to a single CSV file in output_dir
-    without using pandas
+    Merge all JSONL files (and zstd segments) from json_dir to a single CSV
+    file in output_dir without using pandas
     
     Args:
         json_dir (str): Directory containing JSONL files
         output_dir (str): Directory to save the merged CSV file
         output_filename (str): Name of the output CSV file
+        workers (int): Processes used for parsing (default: up to 4)
     """
     # Create output directory if it doesn't exist
     Path(output_dir).mkdir(parents=True, exist_ok=True)
     
-    # List all JSONL files in the json_dir
-    jsonl_files = [f for f in os.listdir(json_dir) if f.endswith('.jsonl')]
+    # List all JSONL files and segments in the json_dir
+    jsonl_files = crawl_files(json_dir, "*.jsonl")
     
     if not jsonl_files:
-        print(f"No JSONL files found in {json_dir}")
-        return
-    
-    print(f"Found {len(jsonl_files)} JSONL files to process")
-    
-    # Initialize an empty list to store all records
-    all_records = []
-    
-    # Read and merge all JSONL files
-    for jsonl_file in jsonl_files:
-        file_path = os.path.join(json_dir, jsonl_file)
-        print(f"Processing {file_path}")
-        
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                for line in file:
-                    try:
-                        # Parse each line as JSON
-                        record = json.loads(line)
-                        all_records.append(record)
-                    except json.JSONDecodeError as e:
-                        print(f"Error decoding JSON in file {jsonl_file}, line: {line[:50]}...: {e}")
-        except Exception as e:
-            print(f"Error reading file {jsonl_file}: {e}")
-    
-    if not all_records:
-        print("No data found in JSONL files")
+        print(f"No JSONL files or segments found in {json_dir}")
         return
     
-    print(f"Total records collected: {len(all_records)}")
+    print(f"Found {len(jsonl_files)} JSONL files and segments to process")
     
-    # Get all unique field names across all records
-    fieldnames = set()
-    for record in all_records:
-        fieldnames.update(record.keys())
-    fieldnames = sorted(list(fieldnames))
-    
-    # Write to CSV
+    # Stream the files into the CSV, holding only a few files' records at a time
     output_path = os.path.join(output_dir, output_filename)
-    with open(output_path, 'w', newline='', encoding='utf-8-sig') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, quoting=csv.QUOTE_NONNUMERIC)
-        writer.writeheader()
-        writer.writerows(all_records)
-    
-    print(f"Successfully merged data and saved to {output_path}")
-    print(f"Total records: {len(all_records)}")
-    print("Column names:", fieldnames)
+    # Stage timings are written when PIPELINE_METRICS is set (see instrumentation.py)
+    with instrumented("merge_batdongsan") as metrics:
+        merge_files_to_csv(jsonl_files, output_path, workers=workers, metrics=metrics)
 
 if __name__ == "__main__":
     # Set base directory to script location
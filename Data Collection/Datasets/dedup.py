@@ -0,0 +1,386 @@
+"""
+Near-duplicate listing index across alonhadat, batdongsan and nhatot.
+
+Every listing gets a MinHash signature of its normalized (lowercase,
+diacritic-free) title character 5-grams plus its address words. The
+signature is split into LSH bands, and listings sharing a band bucket
+become candidate pairs. A pair is a duplicate when its estimated Jaccard
+similarity reaches `threshold` and its area and price agree within
+`tolerance` (where both are known). Duplicates share a `canonical_id`:
+the key of the earliest indexed listing of their group.
+
+The index is a SQLite file next to this script. New crawl files are
+indexed incrementally (`update` skips files whose size and mtime it has
+already seen). Each batch is probed against the stored buckets with one
+indexed join, never against every stored listing.
+
+Usage:
+    python dedup.py update                  # index new/changed crawl files
+    python dedup.py export canonical_ids.csv
+    python dedup.py stats
+"""
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import sys
+import time
+import unicodedata
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DATASETS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(DATASETS_DIR))
+sys.path.insert(0, str(DATASETS_DIR.parent / "Crawler"))
+sys.path.insert(0, str(DATASETS_DIR.parent.parent / "Data Preprocessing"))
+from corpus import SOURCES
+from crawl_index import record_id
+from segment_store import crawl_files
+from stream_merge import iter_records
+
+DEFAULT_INDEX_PATH = DATASETS_DIR / "dedup_index.sqlite"
+NUM_PERM = 128
+BANDS = 32  # 4 rows per band: pairs above ~0.45 Jaccard are likely to share a bucket
+SHINGLE_SIZE = 5
+MERSENNE_PRIME = (1 << 31) - 1
+# Signatures are computed for at most this many shingles at once (NUM_PERM x 8 bytes each)
+SHINGLES_PER_CHUNK = 50_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    id           INTEGER PRIMARY KEY,
+    key          TEXT NOT NULL UNIQUE,
+    source       TEXT NOT NULL,
+    canonical_id TEXT NOT NULL,
+    title        TEXT,
+    area         REAL,
+    price        REAL,
+    signature    BLOB NOT NULL,
+    added_at     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS listings_canonical ON listings (canonical_id);
+CREATE TABLE IF NOT EXISTS buckets (
+    band    INTEGER NOT NULL,
+    bucket  INTEGER NOT NULL,
+    listing INTEGER NOT NULL,
+    PRIMARY KEY (band, bucket, listing)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS files (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    records  INTEGER NOT NULL
+);
+"""
+
+
+def normalize_text(text):
+    """Lowercase, strip Vietnamese diacritics (đ -> d) and collapse punctuation to spaces"""
+    text = unicodedata.normalize("NFD", str(text).lower().replace("đ", "d"))
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def shingle_hashes(title, address):
+    """32-bit hashes of the title's character shingles and the address words"""
+    title = normalize_text(title or "")
+    shingles = {title[i:i + SHINGLE_SIZE] for i in range(max(1, len(title) - SHINGLE_SIZE + 1))}
+    shingles.update("@" + word for word in normalize_text(address or "").split())
+    shingles.discard("")
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def listing_shingles(title, address, key):
+    """Shingle hashes of a listing; the hash of its key when title and address leave none (e.g. emoji-only titles)"""
+    hashes = shingle_hashes(title, address)
+    if len(hashes):
+        return hashes
+    return np.array([zlib.crc32(key.encode("utf-8"))], dtype=np.uint64)
+
+
+# Hash family h(x) = (a * x + b) mod p, fixed so signatures stay comparable across runs
+_rng = np.random.default_rng(20250520)
+_A = _rng.integers(1, MERSENNE_PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, MERSENNE_PRIME, NUM_PERM, dtype=np.uint64)
+_BAND_MIX = _rng.integers(1, 1 << 63, NUM_PERM // BANDS, dtype=np.uint64) | np.uint64(1)
+
+
+def minhash_signatures(shingle_sets):
+    """
+    MinHash signatures of many shingle sets, computed a chunk of sets at a time
+
+    Returns:
+        np.ndarray: (len(shingle_sets), NUM_PERM) uint32
+    """
+    signatures = np.empty((len(shingle_sets), NUM_PERM), dtype=np.uint32)
+    start = 0
+    while start < len(shingle_sets):
+        end, total = start, 0
+        while end < len(shingle_sets) and (end == start or total + len(shingle_sets[end]) <= SHINGLES_PER_CHUNK):
+            total += len(shingle_sets[end])
+            end += 1
+        chunk = shingle_sets[start:end]
+        lengths = np.array([len(s) for s in chunk])
+        values = np.concatenate(chunk)
+        hashed = (_A[:, None] * values[None, :] + _B[:, None]) % np.uint64(MERSENNE_PRIME)
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        signatures[start:end] = np.minimum.reduceat(hashed, offsets, axis=1).T
+        start = end
+    return signatures
+
+
+def band_buckets(signatures):
+    """(n, BANDS) int64 bucket hashes, one per band of `NUM_PERM // BANDS` signature rows"""
+    rows = signatures.astype(np.uint64).reshape(len(signatures), BANDS, NUM_PERM // BANDS)
+    return (rows * _BAND_MIX).sum(axis=2).view(np.int64)
+
+
+def _close(a, b, tolerance):
+    """Relative agreement of two numbers; unknown values do not count against a match"""
+    known = ~(np.isnan(a) | np.isnan(b))
+    return ~known | (np.abs(a - b) <= tolerance * np.maximum(np.abs(a), np.abs(b)))
+
+
+def load_batch(source, files):
+    """Normalized listings of some crawl files: key, source, title, address, area, price"""
+    raw = [record for path in files for record in iter_records(path)]
+    if not raw:
+        return pd.DataFrame(columns=['key', 'source', 'title', 'address', 'area', 'price'])
+    records = pd.DataFrame(raw)
+    # The canonical listing of corpus.py; its rental and negotiable prices are unknown (NaN)
+    listings = SOURCES[source][2](records)[['title', 'address', 'area', 'price_converted']]
+    listings = listings.rename(columns={'price_converted': 'price'})
+    listings.insert(0, 'source', source)
+    listings.insert(0, 'key', [f"{source}:{record_id(record)}" for record in raw])
+    listings[['area', 'price']] = listings[['area', 'price']].astype('float64')
+    return listings
+
+
+class DedupIndex:
+    """
+    Persistent MinHash LSH index of listings
+
+    Args:
+        path (str): SQLite file; created if missing
+        threshold (float): Minimum estimated Jaccard similarity of duplicates
+        tolerance (float): Maximum relative difference of area and of price
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, threshold=0.6, tolerance=0.05):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.threshold = threshold
+        self.tolerance = tolerance
+
+    def close(self):
+        self.conn.close()
+
+    def known_keys(self, keys):
+        found = set()
+        keys = list(keys)
+        for i in range(0, len(keys), 900):
+            chunk = keys[i:i + 900]
+            found.update(row[0] for row in self.conn.execute(
+                f"SELECT key FROM listings WHERE key IN ({','.join('?' * len(chunk))})", chunk))
+        return found
+
+    def _stored(self, ids):
+        """id -> (canonical_id, area, price, signature) of stored listings, oldest first"""
+        stored, ids = {}, sorted(ids)
+        for i in range(0, len(ids), 900):
+            chunk = ids[i:i + 900]
+            for listing, canonical, area, price, signature in self.conn.execute(
+                    f"SELECT id, canonical_id, area, price, signature FROM listings "
+                    f"WHERE id IN ({','.join('?' * len(chunk))})", chunk):
+                stored[listing] = (canonical, np.nan if area is None else area, np.nan if price is None else price,
+                                   np.frombuffer(signature, dtype=np.uint32))
+        return stored
+
+    def add(self, listings):
+        """
+        Index a batch of normalized listings and assign their canonical IDs
+
+        Listings whose key is already indexed are skipped (exact duplicates).
+
+        Returns:
+            pd.DataFrame: The newly indexed listings with a `canonical_id` column
+        """
+        listings = listings.drop_duplicates('key')
+        listings = listings[~listings['key'].isin(self.known_keys(listings['key']))].reset_index(drop=True)
+        if listings.empty:
+            return listings.assign(canonical_id=pd.Series(dtype=object))
+
+        titles = listings['title'].where(listings['title'].notna(), None)
+        addresses = listings['address'].where(listings['address'].notna(), None)
+        signatures = minhash_signatures([listing_shingles(t, a, k)
+                                         for t, a, k in zip(titles, addresses, listings['key'])])
+        buckets = band_buckets(signatures)
+        n = len(listings)
+        probe = pd.DataFrame({'band': np.tile(np.arange(BANDS), n), 'bucket': buckets.ravel(),
+                              'idx': np.repeat(np.arange(n), BANDS)})
+
+        # Candidates among already indexed listings: one join on the (band, bucket) index
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS probe (band INTEGER, bucket INTEGER, idx INTEGER)")
+        self.conn.execute("DELETE FROM probe")
+        self.conn.executemany("INSERT INTO probe VALUES (?, ?, ?)",
+                              zip(probe['band'].tolist(), probe['bucket'].tolist(), probe['idx'].tolist()))
+        history = self.conn.execute("SELECT DISTINCT p.idx, b.listing FROM probe p "
+                                    "JOIN buckets b ON b.band = p.band AND b.bucket = p.bucket").fetchall()
+        stored = self._stored({listing for _, listing in history})
+
+        # Candidates within the batch: listings sharing a bucket
+        pairs = probe.merge(probe, on=['band', 'bucket'])
+        pairs = pairs[pairs['idx_x'] < pairs['idx_y']][['idx_x', 'idx_y']].drop_duplicates().to_numpy()
+
+        areas, prices = listings['area'].to_numpy(), listings['price'].to_numpy()
+        parent = list(range(n)) + [None] * len(stored)
+        stored_ids = list(stored)
+        stored_node = {listing: n + i for i, listing in enumerate(stored_ids)}
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        def union(a, b):
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+
+        if len(pairs):
+            a, b = pairs[:, 0], pairs[:, 1]
+            similar = (signatures[a] == signatures[b]).mean(axis=1) >= self.threshold
+            similar &= _close(areas[a], areas[b], self.tolerance) & _close(prices[a], prices[b], self.tolerance)
+            for i, j in pairs[similar]:
+                union(i, j)
+        if history:
+            idx = np.array([i for i, _ in history])
+            other = [stored[listing] for _, listing in history]
+            similarity = (signatures[idx] == np.stack([s[3] for s in other])).mean(axis=1)
+            similar = (similarity >= self.threshold) & \
+                _close(areas[idx], np.array([s[1] for s in other]), self.tolerance) & \
+                _close(prices[idx], np.array([s[2] for s in other]), self.tolerance)
+            for i, listing in zip(idx[similar], np.array([listing for _, listing in history])[similar]):
+                node = stored_node[int(listing)]
+                if parent[node] is None:
+                    parent[node] = node
+                union(int(i), node)
+
+        # A group keeps the canonical ID of its oldest indexed member; otherwise its first new listing's key
+        groups = {}
+        for node in range(n + len(stored)):
+            if parent[node] is not None:
+                groups.setdefault(find(node), []).append(node)
+        canonical = listings['key'].tolist()
+        merges = []
+        for members in groups.values():
+            old = sorted((stored_ids[m - n], stored[stored_ids[m - n]][0]) for m in members if m >= n)
+            chosen = old[0][1] if old else listings['key'].iat[min(members)]
+            merges.extend((chosen, c) for _, c in old[1:] if c != chosen)
+            for m in members:
+                if m < n:
+                    canonical[m] = chosen
+
+        now = datetime.now().isoformat(timespec='seconds')
+        first_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM listings").fetchone()[0]
+        ids = np.arange(first_id, first_id + n)
+        with self.conn:
+            for chosen, old_canonical in set(merges):
+                self.conn.execute("UPDATE listings SET canonical_id = ? WHERE canonical_id = ?", (chosen, old_canonical))
+            self.conn.executemany(
+                "INSERT INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(listing, key, source, canon, title, None if np.isnan(area) else float(area),
+                  None if np.isnan(price) else float(price), signature.tobytes(), now)
+                 for listing, key, source, canon, title, area, price, signature in zip(
+                     ids.tolist(), listings['key'], listings['source'], canonical, listings['title'].astype(object),
+                     areas, prices, signatures)])
+            self.conn.executemany("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)",
+                                  zip(probe['band'].tolist(), probe['bucket'].tolist(), ids[probe['idx']].tolist()))
+        return listings.assign(canonical_id=canonical)
+
+    def pending_files(self, files):
+        """Files not indexed yet, or changed since"""
+        pending = []
+        for path in files:
+            stat = path.stat()
+            row = self.conn.execute("SELECT size, mtime_ns FROM files WHERE path = ?", (str(path),)).fetchone()
+            if row != (stat.st_size, stat.st_mtime_ns):
+                pending.append(path)
+        return pending
+
+    def mark_files(self, files, records):
+        with self.conn:
+            for path in files:
+                stat = path.stat()
+                self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                  (str(path), stat.st_size, stat.st_mtime_ns, records))
+
+    def update(self, sources=SOURCES, files_per_batch=200):
+        """
+        Index every new or changed crawl file of `sources`
+
+        Returns:
+            int: Number of newly indexed listings
+        """
+        total = 0
+        for source in sources:
+            directory, pattern, _ = SOURCES[source]
+            pending = self.pending_files(crawl_files(directory, pattern))
+            for i in range(0, len(pending), files_per_batch):
+                files = pending[i:i + files_per_batch]
+                started = time.perf_counter()
+                batch = load_batch(source, files)
+                added = self.add(batch)
+                self.mark_files(files, len(batch))
+                duplicates = int((added['canonical_id'] != added['key']).sum())
+                total += len(added)
+                print(f"{source}: {len(files)} files, {len(batch)} records, {len(added)} new listings, "
+                      f"{duplicates} near-duplicates ({time.perf_counter() - started:.2f}s)")
+        return total
+
+    def canonical_ids(self):
+        return pd.read_sql_query("SELECT key, source, canonical_id FROM listings ORDER BY id", self.conn)
+
+    def stats(self):
+        listings, groups = self.conn.execute("SELECT COUNT(*), COUNT(DISTINCT canonical_id) FROM listings").fetchone()
+        cross = self.conn.execute("SELECT COUNT(*) FROM (SELECT canonical_id FROM listings GROUP BY canonical_id "
+                                  "HAVING COUNT(DISTINCT source) > 1)").fetchone()[0]
+        return {'listings': listings, 'canonical_listings': groups, 'cross_source_groups': cross}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Near-duplicate listing index (MinHash LSH)")
+    parser.add_argument("command", choices=["update", "export", "stats"])
+    parser.add_argument("output", nargs="?", help="CSV to write for `export`")
+    parser.add_argument("--index", default=str(DEFAULT_INDEX_PATH), help="SQLite index file")
+    parser.add_argument("--sources", nargs="+", choices=list(SOURCES), default=list(SOURCES))
+    parser.add_argument("--threshold", type=float, default=0.6, help="Minimum estimated Jaccard similarity")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="Maximum relative area/price difference")
+    parser.add_argument("--rebuild", action="store_true", help="Delete the index and re-index everything")
+    args = parser.parse_args()
+
+    if args.rebuild and os.path.exists(args.index):
+        os.remove(args.index)
+    index = DedupIndex(args.index, args.threshold, args.tolerance)
+    try:
+        if args.command == "update":
+            started = time.perf_counter()
+            added = index.update(args.sources)
+            print(f"Indexed {added} listings in {time.perf_counter() - started:.2f}s")
+            print(index.stats())
+        elif args.command == "export":
+            ids = index.canonical_ids()
+            ids.to_csv(args.output or "canonical_ids.csv", index=False, quoting=csv.QUOTE_NONNUMERIC)
+            print(f"Wrote {len(ids)} canonical IDs to {args.output or 'canonical_ids.csv'}")
+        else:
+            print(index.stats())
+    finally:
+        index.close()
@@ -1,50 +1,29 @@
 # Merge all .json files (list of dicts) to a single CSV
 import os
-import json
-import csv
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from segment_store import crawl_files
+from stream_merge import merge_files_to_csv
+from instrumentation import instrumented
+
 json_dir = "./Data Collection/Datasets/nhatot.com/json"  # Adjust path if running from notebook
 output_dir = "./Data Collection/Datasets/nhatot.com/raw"
 output_filename = "nhatot.csv"
 
-Path(output_dir).mkdir(parents=True, exist_ok=True)
 
-json_files = [f for f in os.listdir(json_dir) if f.endswith('.json')]
-if not json_files:
-    print(f"No JSON files found in {json_dir}")
-else:
-    print(f"Found {len(json_files)} JSON files to process")
+def main():
+    json_files = crawl_files(json_dir, "*.json")
+    if not json_files:
+        print(f"No JSON files or segments found in {json_dir}")
+        return
 
-all_records = []
-for json_file in json_files:
-    file_path = os.path.join(json_dir, json_file)
-    print(f"Processing {file_path}")
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            records = json.load(file)
-            if isinstance(records, list):
-                all_records.extend(records)
-            else:
-                print(f"File {json_file} does not contain a list, skipping.")
-    except Exception as e:
-        print(f"Error reading file {json_file}: {e}")
+    print(f"Found {len(json_files)} JSON files and segments to process")
+    # Stage timings are written when PIPELINE_METRICS is set (see instrumentation.py)
+    with instrumented("merge_nhatot") as metrics:
+        merge_files_to_csv(json_files, os.path.join(output_dir, output_filename), metrics=metrics)
 
-if not all_records:
-    print("No data found in JSON files")
-else:
-    print(f"Total records collected: {len(all_records)}")
-    # Get all unique field names
-    fieldnames = set()
-    for record in all_records:
-        fieldnames.update(record.keys())
-    fieldnames = sorted(list(fieldnames))
 
-    output_path = os.path.join(output_dir, output_filename)
-    with open(output_path, 'w', newline='', encoding='utf-8-sig') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, quoting=csv.QUOTE_NONNUMERIC)
-        writer.writeheader()
-        writer.writerows(all_records)
-    print(f"Successfully merged data and saved to {output_path}")
-    print(f"Total records: {len(all_records)}")
-    print("Column names:", fieldnames)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+Append-only, zstd-compressed segment store for crawl output.
+
+Instead of one `page_N.jsonl` / `page_N.json` file per crawled page, a
+crawl output directory keeps its pages in a few large segment files:
+
+    <site>/json/segments/segment-00000.jsonl.zst
+    <site>/json/segments/index.jsonl
+
+Every page is appended as one frame: a zstd skippable frame holding the
+page key (e.g. "page_12"), record count, sizes and write time, followed by a regular
+zstd frame with the page's records as JSONL. A segment is therefore a
+valid zstd stream (`zstd -dc segment-00000.jsonl.zst` prints all its
+records) and can be re-indexed by scanning it alone. A new segment starts
+once the current one reaches `max_segment_bytes`.
+
+`index.jsonl` records the offset and sizes of every frame. A re-crawled
+page is appended again, and readers only return the latest frame of each
+key, just as the old page file would have been overwritten. Only writers
+(the crawlers, `convert`) write the index; readers open the store with
+`read_only=True` and rebuild a stale index in memory, so they never race a
+crawl that is appending to it.
+
+Readers map each segment into memory once and decode its frames in file
+order. `crawl_files` lists a crawl directory's segments plus its page files
+not migrated yet or saved after the page's latest frame (the newer copy
+wins, and the segment readers skip that frame); `stream_merge.iter_records`
+reads both kinds.
+
+Compression uses pyarrow's zstd codec (pyarrow is already required by
+the Parquet dataset).
+
+Usage:
+    python segment_store.py convert alonhadat.com/json            # migrate page files (kept)
+    python segment_store.py convert nhatot.com/json --delete       # ... and remove them
+    python segment_store.py stats alonhadat.com/json
+"""
+import argparse
+import json
+import mmap
+import re
+import struct
+import threading
+import time
+from pathlib import Path
+
+import pyarrow as pa
+
+from stream_merge import iter_records
+
+SEGMENTS_DIRNAME = "segments"
+SEGMENT_SUFFIX = ".jsonl.zst"
+INDEX_FILENAME = "index.jsonl"
+DEFAULT_MAX_SEGMENT_BYTES = 64 << 20
+DEFAULT_LEVEL = 9
+# Raw bytes of records per work unit when a merge splits a segment (`segment_chunks`)
+DEFAULT_CHUNK_BYTES = 1 << 20
+# zstd skippable frame (magic 0x184D2A5B, little endian) carrying the frame header
+SKIPPABLE_MAGIC = struct.pack("<I", 0x184D2A5B)
+SKIPPABLE = struct.Struct("<4sI")
+HEADER = struct.Struct("<III")  # raw size, compressed size, number of records
+WRITTEN = struct.Struct("<d")  # write time (Unix seconds), after the key and a NUL byte
+PAGE_FILE_RE = re.compile(r"^page_(\d+)$")
+PAGE_PATTERNS = ("*.jsonl", "*.json")
+
+
+def page_sort_key(key):
+    """Page keys in numeric order ("page_2" before "page_10"), other keys after them by name"""
+    match = PAGE_FILE_RE.match(key)
+    return (0, int(match.group(1)), "") if match else (1, 0, key)
+
+
+def encode_records(records):
+    return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+
+
+def decode_records(payload):
+    return [json.loads(line) for line in payload.decode("utf-8").splitlines() if line]
+
+
+def scan_segment(path):
+    """
+    Index entries of every frame of one segment, read from the frame headers alone
+
+    A truncated frame at the end of the file (interrupted write) is ignored.
+    Frames written before write times were recorded get `written` None.
+    """
+    entries = []
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + SKIPPABLE.size + HEADER.size <= len(data):
+        magic, header_size = SKIPPABLE.unpack_from(data, offset)
+        if magic != SKIPPABLE_MAGIC:
+            break
+        raw_size, size, n_records = HEADER.unpack_from(data, offset + SKIPPABLE.size)
+        key_field = data[offset + SKIPPABLE.size + HEADER.size:offset + SKIPPABLE.size + header_size]
+        key, _, written = key_field.partition(b"\0")
+        payload = offset + SKIPPABLE.size + header_size
+        if payload + size > len(data):
+            break
+        entries.append({"key": key.decode("utf-8"), "segment": Path(path).name, "offset": payload, "size": size,
+                        "raw_size": raw_size, "records": n_records,
+                        "written": WRITTEN.unpack(written)[0] if len(written) == WRITTEN.size else None})
+        offset = payload + size
+    return entries
+
+
+def read_segment_frames(path, entries):
+    """Yield (key, records) of `entries` of one segment file in file order, mapping the file into memory once"""
+    codec = pa.Codec("zstd")
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for entry in sorted(entries, key=lambda e: e["offset"]):
+            payload = codec.decompress(data[entry["offset"]:entry["offset"] + entry["size"]],
+                                       decompressed_size=entry["raw_size"], asbytes=True)
+            yield entry["key"], decode_records(payload)
+
+
+class SegmentStore:
+    """
+    Pages of crawl records in rotating zstd segments, with an offset index
+
+    Args:
+        directory (str): Crawl output directory; segments go to its `segments/` subdirectory
+        max_segment_bytes (int): Size at which the next frame starts a new segment
+        level (int): zstd compression level
+        read_only (bool): Open for reading only: a stale index is rebuilt in memory, never
+            written, and `append` is refused
+    """
+
+    def __init__(self, directory, max_segment_bytes=DEFAULT_MAX_SEGMENT_BYTES, level=DEFAULT_LEVEL,
+                 read_only=False):
+        self.directory = Path(directory) / SEGMENTS_DIRNAME
+        self.read_only = read_only
+        self.max_segment_bytes = max_segment_bytes
+        self.codec = pa.Codec("zstd", compression_level=level)
+        self.lock = threading.Lock()
+        self.entries = []
+        index_path = self.directory / INDEX_FILENAME
+        if index_path.exists():
+            with open(index_path, encoding="utf-8") as f:
+                # A line still being appended by a writer has no newline yet
+                self.entries = [json.loads(line) for line in f if line.endswith("\n") and line.strip()]
+        if not self._index_matches_segments():
+            self.rebuild_index()
+
+    @classmethod
+    def exists(cls, directory):
+        return (Path(directory) / SEGMENTS_DIRNAME).is_dir()
+
+    def segment_paths(self):
+        return sorted(self.directory.glob(f"segment-*{SEGMENT_SUFFIX}"))
+
+    def _index_matches_segments(self):
+        """The index covers every byte of every segment (no frame written after its last update)"""
+        ends = {}
+        for entry in self.entries:
+            ends[entry["segment"]] = max(ends.get(entry["segment"], 0), entry["offset"] + entry["size"])
+        return all(ends.get(path.name, 0) == path.stat().st_size for path in self.segment_paths())
+
+    def rebuild_index(self):
+        """Re-index the segments by scanning their frame headers; a writable store also re-creates index.jsonl"""
+        self.entries = [entry for path in self.segment_paths() for entry in scan_segment(path)]
+        if not self.read_only and self.directory.exists():
+            with open(self.directory / INDEX_FILENAME, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in self.entries)
+
+    def append(self, key, records):
+        """
+        Append one page of records as a new frame
+
+        Args:
+            key (str): Page key, e.g. "page_12"; a later frame with the same key replaces this one
+            records (list): JSON-serializable dicts
+        """
+        if self.read_only:
+            raise ValueError(f"{self.directory} is opened read-only")
+        raw = encode_records(records)
+        payload = self.codec.compress(raw, asbytes=True)
+        written = time.time()
+        key_bytes = key.encode("utf-8") + b"\0" + WRITTEN.pack(written)
+        header = SKIPPABLE.pack(SKIPPABLE_MAGIC, HEADER.size + len(key_bytes)) \
+            + HEADER.pack(len(raw), len(payload), len(records)) + key_bytes
+        with self.lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            segments = self.segment_paths()
+            path = segments[-1] if segments else self.directory / f"segment-00000{SEGMENT_SUFFIX}"
+            if path.exists() and path.stat().st_size + len(header) + len(payload) > self.max_segment_bytes:
+                path = self.directory / f"segment-{int(path.name[8:13]) + 1:05d}{SEGMENT_SUFFIX}"
+            with open(path, "ab") as f:
+                offset = f.tell() + len(header)
+                f.write(header)
+                f.write(payload)
+            entry = {"key": key, "segment": path.name, "offset": offset, "size": len(payload),
+                     "raw_size": len(raw), "records": len(records), "written": written}
+            with open(self.directory / INDEX_FILENAME, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.entries.append(entry)
+
+    def latest_entries(self):
+        """The last frame of every key, in segment/offset order"""
+        latest = {}
+        for entry in self.entries:
+            latest[entry["key"]] = entry
+        return sorted(latest.values(), key=lambda e: (e["segment"], e["offset"]))
+
+    def frame_times(self):
+        """Write time of the latest frame of every key; its segment's mtime for frames stored without one"""
+        mtimes = {path.name: path.stat().st_mtime for path in self.segment_paths()}
+        return {e["key"]: e.get("written") or mtimes.get(e["segment"], 0.0) for e in self.latest_entries()}
+
+    def keys(self):
+        return {entry["key"] for entry in self.entries}
+
+    def __contains__(self, key):
+        return any(entry["key"] == key for entry in reversed(self.entries))
+
+    def read_frames(self, entries):
+        """Yield (key, records) of `entries`, mapping each segment into memory once"""
+        by_segment = {}
+        for entry in entries:
+            by_segment.setdefault(entry["segment"], []).append(entry)
+        for segment, segment_entries in sorted(by_segment.items()):
+            yield from read_segment_frames(self.directory / segment, segment_entries)
+
+    def read(self, key):
+        """Records of the latest frame of `key` (None if the store does not have it)"""
+        entry = next((e for e in reversed(self.entries) if e["key"] == key), None)
+        return None if entry is None else next(self.read_frames([entry]))[1]
+
+    def stats(self):
+        segments = self.segment_paths()
+        latest = self.latest_entries()
+        return {
+            "segments": len(segments),
+            "frames": len(self.entries),
+            "pages": len(latest),
+            "records": sum(e["records"] for e in latest),
+            "bytes": sum(path.stat().st_size for path in segments),
+            "raw_bytes": sum(e["raw_size"] for e in latest),
+        }
+
+
+def newer_page_files(store, directory, patterns=PAGE_PATTERNS):
+    """Page files of `directory` saved after the latest frame of their page in `store`"""
+    times = store.frame_times()
+    return {path for p in patterns for path in Path(directory).glob(p)
+            if path.name.split(".")[0] in times and path.stat().st_mtime > times[path.name.split(".")[0]]}
+
+
+def segment_chunks(path, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    The frames to read from one segment file, in runs of about `chunk_bytes` raw bytes
+
+    Only the latest frame of each key, and none of the pages that have a
+    newer page file next to the store (`crawl_files` lists that file instead).
+    A merge reads each chunk as its own bounded work unit.
+
+    Returns:
+        list: (segment path, index entries) pairs for `read_segment_frames`, in file order
+    """
+    path = Path(path)
+    directory = path.parent.parent
+    store = SegmentStore(directory, read_only=True)
+    superseded = {file.name.split(".")[0] for file in newer_page_files(store, directory)}
+    chunks, chunk, size = [], [], 0
+    for entry in store.latest_entries():
+        if entry["segment"] != path.name or entry["key"] in superseded:
+            continue
+        if chunk and size + entry["raw_size"] > chunk_bytes:
+            chunks.append((path, chunk))
+            chunk, size = [], 0
+        chunk.append(entry)
+        size += entry["raw_size"]
+    if chunk:
+        chunks.append((path, chunk))
+    return chunks
+
+
+def iter_segment_records(path):
+    """Records of one segment file (see `segment_chunks`), as `stream_merge.iter_records` yields them"""
+    for chunk in segment_chunks(path):
+        for _, records in read_segment_frames(*chunk):
+            yield from records
+
+
+def crawl_files(directory, pattern):
+    """
+    Everything to read from a crawl output directory, in page order
+
+    Page files matching `pattern` whose page is not in the segment store
+    yet or was saved after the page's latest frame, followed by the
+    store's segment files.
+    """
+    directory = Path(directory)
+    store = SegmentStore(directory, read_only=True) if SegmentStore.exists(directory) else None
+    stored = store.keys() if store is not None else set()
+    newer = newer_page_files(store, directory) if store is not None else set()
+    files = [path for path in directory.glob(pattern) if path.name.split(".")[0] not in stored or path in newer]
+    files.sort(key=lambda path: page_sort_key(path.name.split(".")[0]))
+    return files + (store.segment_paths() if store is not None else [])
+
+
+def convert_directory(directory, pattern=None, delete=False, max_segment_bytes=DEFAULT_MAX_SEGMENT_BYTES,
+                      level=DEFAULT_LEVEL):
+    """
+    Migrate a directory of page files into its segment store, in page order
+
+    Args:
+        directory (str): Crawl output directory (e.g. alonhadat.com/json)
+        pattern (str): Page files to migrate; every *.jsonl and *.json file if None
+        delete (bool): Remove each page file once its frame is written
+
+    Returns:
+        dict: Store statistics after the migration
+    """
+    directory = Path(directory)
+    patterns = [pattern] if pattern else ["*.jsonl", "*.json"]
+    paths = sorted({path for p in patterns for path in directory.glob(p)},
+                   key=lambda path: page_sort_key(path.name.split(".")[0]))
+    store = SegmentStore(directory, max_segment_bytes=max_segment_bytes, level=level)
+    before = sum(path.stat().st_size for path in paths)
+    started = time.perf_counter()
+    for path in paths:
+        store.append(path.name.split(".")[0], list(iter_records(path)))
+        if delete:
+            path.unlink()
+    stats = store.stats()
+    print(f"Converted {len(paths)} files ({before / 1e6:.2f} MB) into {stats['segments']} segments "
+          f"({stats['bytes'] / 1e6:.2f} MB, {before / max(stats['bytes'], 1):.1f}x smaller) "
+          f"in {time.perf_counter() - started:.2f}s")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Segment store of crawl output")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="Migrate page files into the segment store")
+    convert.add_argument("directory")
+    convert.add_argument("--pattern", help="Page files to migrate (default: *.jsonl and *.json)")
+    convert.add_argument("--delete", action="store_true", help="Remove the page files once migrated")
+    convert.add_argument("--max-segment-mb", type=float, default=DEFAULT_MAX_SEGMENT_BYTES / (1 << 20))
+    convert.add_argument("--level", type=int, default=DEFAULT_LEVEL, help="zstd compression level")
+    stats = sub.add_parser("stats", help="Segments, pages and sizes of a store")
+    stats.add_argument("directory")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert_directory(args.directory, args.pattern, args.delete, int(args.max_segment_mb * (1 << 20)), args.level)
+    else:
+        for name, value in SegmentStore(args.directory, read_only=True).stats().items():
+            print(f"{name:<10}{value:>14,}")
@@ -0,0 +1,173 @@
+"""
+Streaming JSONL/JSON -> CSV merger shared by the per-source merge.py scripts.
+
+The merge makes two passes over the input files and never holds more than a
+few files' worth of records in memory:
+
+1. schema discovery: the union of field names across all records (skipped
+   when the caller passes a known `fieldnames` list)
+2. write: every file is encoded to CSV rows and appended to the output
+
+Segment files (segment_store.py) are split into chunks of about 1 MB of
+records, so a segment costs no more memory than a few page files and its
+chunks are spread over the pool. Both passes fan out over a process pool;
+results are consumed in file order with a bounded number of work units in
+flight.
+"""
+import csv
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / "Data Preprocessing"))
+from instrumentation import NO_METRICS
+
+
+def iter_records(path):
+    """
+    Yield the records of one crawl file
+
+    `.json` files hold a list of dicts; segment files (segment_store.py)
+    yield the records of their latest frames; any other file is treated as
+    JSONL, skipping blank lines and `//` comment lines.
+    """
+    path = Path(path)
+    if path.name.endswith('.jsonl.zst'):
+        from segment_store import iter_segment_records
+        yield from iter_segment_records(path)
+        return
+    try:
+        with path.open('r', encoding='utf-8') as f:
+            if path.suffix == '.json':
+                records = json.load(f)
+                if isinstance(records, list):
+                    yield from records
+                else:
+                    print(f"File {path.name} does not contain a list, skipping.")
+                return
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('//'):
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"Skipping invalid JSON in {path}, line: {line[:50]}...: {e}")
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error reading {path}: {e}")
+
+
+def work_units(files):
+    """The crawl files to read, with every segment file split into its chunks (`segment_store.segment_chunks`)"""
+    for path in files:
+        if path.name.endswith('.jsonl.zst'):
+            from segment_store import segment_chunks
+            yield from segment_chunks(path)
+        else:
+            yield path
+
+
+def iter_unit_records(unit):
+    """Records of one work unit: a crawl file or a (segment path, index entries) chunk"""
+    if isinstance(unit, tuple):
+        from segment_store import read_segment_frames
+        for _, records in read_segment_frames(*unit):
+            yield from records
+    else:
+        yield from iter_records(unit)
+
+
+def file_fieldnames(unit):
+    """Field names used by the records of one work unit"""
+    fieldnames = set()
+    for record in iter_unit_records(unit):
+        fieldnames.update(record.keys())
+    return fieldnames
+
+
+def encode_file(unit, fieldnames):
+    """Encode one work unit's records as CSV rows; returns (csv text, record count)"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, quoting=csv.QUOTE_NONNUMERIC, extrasaction='ignore')
+    count = 0
+    for record in iter_unit_records(unit):
+        writer.writerow(record)
+        count += 1
+    return buffer.getvalue(), count
+
+
+def _ordered_map(func, items, workers, *args):
+    """Map `func` over `items` in order, in a process pool with at most 2 * workers tasks in flight"""
+    if workers <= 1:
+        for item in items:
+            yield func(item, *args)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for item in items:
+            pending.append(executor.submit(func, item, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def default_workers():
+    return min(4, os.cpu_count() or 1)
+
+
+def discover_fieldnames(files, workers=None):
+    """Sorted union of the field names of every record in `files`"""
+    workers = default_workers() if workers is None else workers
+    fieldnames = set()
+    for names in _ordered_map(file_fieldnames, work_units(files), workers):
+        fieldnames.update(names)
+    return sorted(fieldnames)
+
+
+def merge_files_to_csv(files, output_path, fieldnames=None, workers=None, metrics=NO_METRICS):
+    """
+    Merge crawl files into one CSV without loading every record at once
+
+    Args:
+        files (list): JSONL or JSON files to merge, written in this order
+        output_path (str): CSV file to write
+        fieldnames (list): Known column order; discovered from the files if None
+        workers (int): Processes used for parsing; 1 parses in-process
+        metrics (Metrics): Receives the "discover_fieldnames" and "write_csv" timings and counts
+
+    Returns:
+        int: Number of records written
+    """
+    files = [Path(f) for f in files]
+    workers = default_workers() if workers is None else workers
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+
+    started = time.perf_counter()
+    if fieldnames is None:
+        with metrics.stage("discover_fieldnames"):
+            fieldnames = discover_fieldnames(files, workers)
+        print(f"Discovered {len(fieldnames)} columns in {time.perf_counter() - started:.2f}s")
+    if not fieldnames:
+        print("No records to write")
+        return 0
+
+    total = 0
+    with metrics.stage("write_csv"), open(output_path, 'w', newline='', encoding='utf-8-sig') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, quoting=csv.QUOTE_NONNUMERIC)
+        writer.writeheader()
+        for rows, count in _ordered_map(encode_file, work_units(files), workers, fieldnames):
+            csvfile.write(rows)
+            total += count
+        metrics.count("files", len(files))
+        metrics.count("records", total)
+
+    elapsed = time.perf_counter() - started
+    print(f"Merged {total} records from {len(files)} files into {output_path}")
+    print(f"Took {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} records/s)")
+    print("Columns:", fieldnames)
+    return total
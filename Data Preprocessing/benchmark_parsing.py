@@ -0,0 +1,146 @@
+"""
+Benchmark the vectorized parsers in parsing.py against the row-wise notebook
+implementations, and check that both produce the same values.
+
+Input rows come from the raw fields kept in the processed CSVs (alonhadat
+`address`/`price`/`area`, nhatot's raw crawl CSV), repeated up to `--rows`.
+The vectorized parsers work on distinct values, so the distinct counts are
+printed alongside the timings.
+
+Usage:
+    python benchmark_parsing.py --rows 100000
+"""
+import argparse
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import parsing
+
+HERE = Path(__file__).resolve().parent
+NHATOT_RAW = HERE.parent / "Data Collection" / "Datasets" / "nhatot.com" / "raw" / "nhatot.csv"
+
+
+# --- Row-wise reference implementations (from the preprocessing notebooks) ----
+
+def extract_address_components(address):
+    road, ward, district = None, None, None
+    if isinstance(address, str):
+        road_match = re.search(parsing.ROAD_PATTERN, address, re.IGNORECASE)
+        ward_match = re.search(parsing.WARD_PATTERN, address, re.IGNORECASE)
+        district_match = re.search(parsing.DISTRICT_PATTERN, address, re.IGNORECASE)
+        if road_match:
+            road = road_match.group(1).strip()
+        if ward_match:
+            ward = ward_match.group(1).strip()
+        if district_match:
+            district = district_match.group(1).strip()
+    return road, ward, district
+
+
+def parse_price(price_str):
+    if pd.isna(price_str):
+        return np.nan
+    price_str_lower = str(price_str).lower()
+    if 'thỏa thuận' in price_str_lower:
+        return np.nan
+    cleaned_price_str = price_str_lower.replace(',', '.')
+    num_part_match = re.search(r'(\d+(?:\.\d+)?)', cleaned_price_str)
+    if not num_part_match:
+        return np.nan
+    num_val = float(num_part_match.group(1))
+    if 'tỷ' in price_str_lower:
+        return num_val * 1000
+    elif 'triệu' in price_str_lower:
+        return num_val
+    return num_val / 1e6
+
+
+def is_price_per_m2(price_str):
+    if pd.isna(price_str):
+        return False
+    return bool(re.search(r'\s*\/\s*m2|\s*\/\s*m²', str(price_str).lower()))
+
+
+def extract_numeric_price(price_str):
+    if pd.isna(price_str):
+        return np.nan
+    price_str = str(price_str).strip().lower()
+    numeric_match = re.search(r'([\d,.]+)', price_str)
+    if not numeric_match:
+        return np.nan
+    numeric_value = numeric_match.group(1).replace('.', '').replace(',', '.')
+    try:
+        value = float(numeric_value)
+    except ValueError:
+        return np.nan
+    if 'tỷ' in price_str:
+        return value * 1000.0
+    return value
+
+
+# --- Benchmark ----------------------------------------------------------------
+
+def load_frames(rows):
+    alonhadat = pd.read_csv(HERE / "alonhadat_processed.csv", usecols=["address", "price", "area"], dtype=str)
+    nhatot = pd.read_csv(NHATOT_RAW, usecols=["Price"], dtype=str)
+    repeat = lambda df: pd.concat([df] * -(-rows // len(df)), ignore_index=True).iloc[:rows]
+    return repeat(alonhadat), repeat(nhatot)
+
+
+def timed(label, rowwise, vectorized, compare):
+    started = time.perf_counter()
+    expected = rowwise()
+    rowwise_s = time.perf_counter() - started
+    started = time.perf_counter()
+    actual = vectorized()
+    vectorized_s = time.perf_counter() - started
+    status = "ok" if compare(expected, actual) else "MISMATCH"
+    print(f"{label:<22}{rowwise_s:>10.3f}{vectorized_s:>12.3f}{rowwise_s / vectorized_s:>9.1f}x  {status}")
+
+
+def same_floats(a, b):
+    return np.allclose(np.asarray(a, dtype=float), np.asarray(b, dtype=float), rtol=0, atol=0, equal_nan=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark row-wise vs vectorized listing parsers")
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    alonhadat, nhatot = load_frames(args.rows)
+    print(f"{args.rows:,} rows per parser ({alonhadat['address'].nunique():,} distinct addresses, "
+          f"{alonhadat['price'].nunique():,} distinct prices)\n")
+    print(f"{'parser':<22}{'row-wise':>10}{'vectorized':>12}{'speedup':>10}  parity")
+
+    timed(
+        "address components",
+        lambda: alonhadat['address'].apply(lambda x: pd.Series(extract_address_components(x))),
+        lambda: parsing.extract_address_components(alonhadat['address']),
+        lambda a, b: a.fillna("<NA>").values.tolist() == b.fillna("<NA>").values.tolist(),
+    )
+    timed(
+        "price (tỷ/triệu)",
+        lambda: alonhadat['price'].apply(parse_price),
+        lambda: parsing.parse_price(alonhadat['price']),
+        same_floats,
+    )
+    timed(
+        "price per m² flag",
+        lambda: alonhadat['price'].apply(is_price_per_m2),
+        lambda: parsing.is_price_per_m2(alonhadat['price']),
+        lambda a, b: a.tolist() == b.tolist(),
+    )
+    timed(
+        "nhatot price",
+        lambda: nhatot['Price'].apply(extract_numeric_price),
+        lambda: parsing.parse_nhatot_price(nhatot['Price']),
+        same_floats,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Unified training corpus: the three sources' raw crawl files in one schema.
+
+Each source is normalized in its own worker process, straight from its crawl
+files (Data Collection/Datasets/<site>/json), with the vectorized parsers of
+parsing.py and the gazetteer, into the canonical columns:
+
+    listing_id        ID of the listing within its source (crawl_index.record_id)
+    title, address    raw text (batdongsan: its URL slug; nhatot: its district)
+    road, ward, district, address_complete
+    area              m²
+    bedrooms, floors  nullable counts (nhatot has no floors)
+    price_converted   total price, millions of VND (negotiable and rental prices dropped)
+    price_per_m2      millions of VND per m²
+    is_outlier        outside the source's IQR bounds of area or price_per_m2
+
+The per-source normalizers and `SOURCES` below are the one definition of a
+source's canonical listing: dedup.py indexes the same columns.
+
+batdongsan lists the whole country: its listings outside Hanoi have no
+district. Its slugs have no commas, so only gazetteer names are taken from
+them (a marker followed by an unknown name gives no road or ward rather
+than the rest of the slug).
+
+Every worker writes its own partition of the corpus
+(`dataset/corpus/source=<source>/crawl_date=<date>/part-0.parquet`), so a
+rebuild takes as long as the slowest source rather than the sum of all
+three. Read it back with `dataset_store.load_corpus`.
+
+Usage:
+    python corpus.py                    # rebuild every source in parallel
+    python corpus.py nhatot --workers 1
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+import parsing
+from dataset_store import CORPUS_ROOT, write_dataset
+from gazetteer import get_gazetteer
+from instrumentation import NO_METRICS, Metrics, add_arguments, instrumented
+from outliers import IQRFilter
+
+DATASETS_DIR = Path(__file__).resolve().parent.parent / "Data Collection" / "Datasets"
+sys.path.insert(0, str(DATASETS_DIR))
+sys.path.insert(0, str(DATASETS_DIR.parent / "Crawler"))
+from crawl_index import record_id
+from segment_store import crawl_files
+from stream_merge import iter_records
+
+CORPUS_DTYPES = {
+    "listing_id": "string", "title": "string", "address": "string", "road": "category",
+    "ward": "category", "district": "category", "address_complete": "int8", "area": "float64",
+    "bedrooms": "Int64", "floors": "Int64", "price_converted": "float64", "price_per_m2": "float64",
+    "is_outlier": "bool",
+}
+OUTLIER_COLUMNS = ['area', 'price_per_m2']
+
+
+def field(records, name):
+    """Raw column `name`; all missing when no record of the batch has that field"""
+    return records[name] if name in records else pd.Series(None, index=records.index, dtype=object)
+
+
+def normalize_alonhadat(records):
+    area = parsing.parse_area(field(records, 'area'))
+    return pd.DataFrame({
+        'title': field(records, 'title'),
+        'address': field(records, 'address'),
+        'area': area,
+        'bedrooms': parsing.parse_count(field(records, 'bedrooms')),
+        'floors': parsing.parse_count(field(records, 'floors')),
+        'price_converted': parsing.parse_total_price(field(records, 'price'), area, monthly_as_nan=True),
+    }, index=records.index)
+
+
+def normalize_batdongsan(records):
+    # No address field: the URL slug ("ban-nha-rieng-duong-x-phuong-y-...") names the street and ward
+    slug = field(records, 'url').fillna('').str.extract(r'batdongsan\.com\.vn/([^/]+)', expand=False)
+    return pd.DataFrame({
+        'title': field(records, 'title'),
+        'address': slug.str.replace('-', ' '),
+        'area': parsing.parse_area(field(records, 'Diện tích')),
+        'bedrooms': parsing.parse_count(field(records, 'Số phòng ngủ')),
+        'floors': parsing.parse_count(field(records, 'Số tầng')),
+        'price_converted': parsing.parse_price(field(records, 'Mức giá'), monthly_as_nan=True),
+    }, index=records.index)
+
+
+def normalize_nhatot(records):
+    description = parsing.split_nhatot_description(field(records, 'Description'))
+    location = parsing.split_nhatot_location(field(records, 'Location'))
+    return pd.DataFrame({
+        'title': field(records, 'Title'),
+        'address': location['district_name'],
+        'area': parsing.parse_nhatot_space(field(records, 'Space')),
+        'bedrooms': description['bedrooms'].astype('Int64'),
+        'floors': pd.Series(pd.NA, index=records.index, dtype='Int64'),
+        'price_converted': parsing.parse_nhatot_price(field(records, 'Price')),
+    }, index=records.index)
+
+
+# source -> (crawl file directory, glob, normalizer to the canonical raw columns)
+SOURCES = {
+    'alonhadat': (DATASETS_DIR / "alonhadat.com" / "json", "*.jsonl", normalize_alonhadat),
+    'batdongsan': (DATASETS_DIR / "batdongsan.com" / "json", "*.jsonl", normalize_batdongsan),
+    'nhatot': (DATASETS_DIR / "nhatot.com" / "json", "*.json", normalize_nhatot),
+}
+# Addresses without commas (URL slugs): the raw text after a marker would run to the end of the slug
+MATCHED_NAMES_ONLY = {'batdongsan'}
+
+
+def load_source(source, metrics=NO_METRICS):
+    """
+    Canonical listings of one source, from its crawl files and segments
+
+    Reposted listings (same `listing_id`) keep their latest crawl; listings
+    without a positive price and area are dropped.
+
+    Returns:
+        pd.DataFrame: The `CORPUS_DTYPES` columns
+    """
+    directory, pattern, normalize = SOURCES[source]
+    with metrics.stage("read"):
+        raw = [record for path in crawl_files(directory, pattern) for record in iter_records(path)]
+        metrics.count("records", len(raw))
+    if not raw:
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in CORPUS_DTYPES.items()})
+    with metrics.stage("normalize"):
+        records = pd.DataFrame(raw)
+        df = normalize(records)
+        df.insert(0, 'listing_id', [record_id(record) for record in raw])
+        df = df.drop_duplicates('listing_id', keep='last')
+        df = df[(df['price_converted'] > 0) & (df['area'] > 0)].reset_index(drop=True)
+
+    with metrics.stage("resolve_addresses"):
+        parts = get_gazetteer().resolve_many(df['address'], raw_fallback=source not in MATCHED_NAMES_ONLY)
+        df[['road', 'ward', 'district']] = parts[['road', 'ward', 'district']]
+        df['address_complete'] = (parts[['road', 'ward', 'district']].notna().all(axis=1)
+                                  & ~parts['district_inferred'].astype(bool)).astype(int)
+    with metrics.stage("outliers"):
+        df['price_per_m2'] = df['price_converted'] / df['area']
+        df['is_outlier'] = ~IQRFilter(OUTLIER_COLUMNS).fit(df).inside(df)
+    metrics.count("rows", len(df))
+    return df[list(CORPUS_DTYPES)].astype(CORPUS_DTYPES)
+
+
+def build_source(source, crawl_date=None, root=CORPUS_ROOT, trace_memory=False):
+    """
+    Normalize one source and write its corpus partition
+
+    Returns:
+        tuple: (source, rows, seconds, stages), `stages` being the worker's `Metrics` snapshot stages
+    """
+    started = time.perf_counter()
+    metrics = Metrics(source, trace_memory=trace_memory)
+    with metrics.stage(source):
+        df = load_source(source, metrics)
+        with metrics.stage("write"):
+            write_dataset(df, source, crawl_date=crawl_date, root=root, dtypes=CORPUS_DTYPES)
+    return source, len(df), time.perf_counter() - started, metrics.snapshot()["stages"]
+
+
+def build_corpus(sources=None, crawl_date=None, root=CORPUS_ROOT, workers=None, metrics=NO_METRICS):
+    """
+    Rebuild the corpus partitions of `sources`, one worker process per source
+
+    Args:
+        sources (list): Sources to rebuild; all of `SOURCES` if None
+        crawl_date (str): ISO date of the partitions; defaults to today
+        root (Path): Corpus root directory
+        workers (int): Worker processes; 1 builds the sources one after another
+        metrics (Metrics): Receives every source's stage timings ("<source>/read", ...), measured in its worker
+
+    Returns:
+        dict: source -> (rows, seconds)
+    """
+    sources = list(sources or SOURCES)
+    workers = min(len(sources), os.cpu_count() or 1) if workers is None else workers
+    trace_memory = getattr(metrics, "trace_memory", False)
+    if workers <= 1:
+        results = [build_source(source, crawl_date, root, trace_memory) for source in sources]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(build_source, source, crawl_date, root, trace_memory) for source in sources]
+            results = [future.result() for future in as_completed(futures)]
+    for _, _, _, stages in results:
+        for stage, entry in stages.items():
+            metrics.record(stage, entry["seconds"], entry["cpu_seconds"], entry["alloc_peak_bytes"],
+                           entry["peak_rss_bytes"], **entry["counters"])
+    return {source: (rows, seconds) for source, rows, seconds, _ in results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the canonical multi-source corpus from the crawl files")
+    parser.add_argument("sources", nargs="*", help=f"Sources to rebuild among {', '.join(SOURCES)} (default: all)")
+    parser.add_argument("--crawl-date", help="ISO date of the partitions (default: today)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per source)")
+    add_arguments(parser)
+    args = parser.parse_args()
+    unknown = set(args.sources) - set(SOURCES)
+    if unknown:
+        parser.error(f"unknown sources: {', '.join(sorted(unknown))}")
+
+    started = time.perf_counter()
+    with instrumented("corpus", args.metrics, args.trace_memory, args.profile) as metrics:
+        built = build_corpus(args.sources, args.crawl_date, workers=args.workers, metrics=metrics)
+    wall = time.perf_counter() - started
+    for source, (rows, seconds) in sorted(built.items()):
+        print(f"{source:<12}{rows:>8} rows{seconds:>8.2f}s")
+    print(f"{'total':<12}{sum(rows for rows, _ in built.values()):>8} rows{wall:>8.2f}s wall "
+          f"(sum of sources {sum(seconds for _, seconds in built.values()):.2f}s)")
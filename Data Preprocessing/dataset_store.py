@@ -0,0 +1,290 @@
+"""
+Typed, partitioned Parquet dataset for the processed listings.
+
+Layout (hive-style partitions, one directory per source and crawl date):
+
+    Data Preprocessing/dataset/source=alonhadat/crawl_date=2025-05-20/part-0.parquet
+
+Each source keeps its own schema. Dtypes such as nullable `Int64` counts and
+`category` text columns are stored in the Parquet/pandas metadata, so they
+come back without re-inference. Readers only decode the columns they ask for,
+and `filters` are pushed down to the row-group statistics.
+
+corpus.py writes all sources in one canonical schema to the same layout
+under `dataset/corpus/`; read it with `load_corpus`.
+
+`load_processed(..., compact=True)` (or `compact_dtypes`) further shrinks a
+frame without changing any value: numbers are downcast to the smallest
+integer/float type that holds them exactly, and repetitive text columns
+become `category` (Arrow dictionary columns once written back to Parquet).
+
+Usage:
+    python dataset_store.py            # convert the three *_processed.csv files
+    python dataset_store.py --memory   # memory of each source: raw CSV, typed, compact
+"""
+import argparse
+import operator
+import os
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DATASET_ROOT = Path(__file__).resolve().parent / "dataset"
+# Canonical multi-source corpus written by corpus.py, same partition layout
+CORPUS_ROOT = DATASET_ROOT / "corpus"
+PROCESSED_DIR = Path(__file__).resolve().parent
+
+# Explicit dtypes for the processed CSVs, so nothing is left to pandas' inference
+PROCESSED_DTYPES = {
+    "alonhadat": {
+        "address": "string", "area": "float64", "bedrooms": "Int64", "date": "category",
+        "floors": "Int64", "price": "string", "title": "string", "road": "category",
+        "ward": "category", "district": "category", "address_complete": "int8",
+        "road_cat": "int32", "ward_cat": "int32", "district_cat": "int32",
+        "price_converted": "float64", "is_price_per_m2": "bool", "price_per_m2": "float64",
+    },
+    "batdongsan": {
+        "area": "float64", "balcony_direction": "Int64", "house_direction": "Int64",
+        "facade_width": "float64", "price": "float64", "interior": "int8", "legality": "int8",
+        "bedrooms": "Int64", "bathrooms": "Int64", "floors": "Int64", "title": "string",
+        "road_width": "float64", "price_per_m2": "float64",
+    },
+    "nhatot": {
+        "Title": "string", "price_converted": "float64", "price_per_m2": "float64",
+        "area": "float64", "bedrooms": "Int64", "property_type": "category",
+        "district": "category", "property_cat": "int32", "district_cat": "int32",
+    },
+}
+
+
+def apply_dtypes(df, dtypes):
+    """Cast the columns present in `df` to the given dtypes"""
+    return df.astype({col: dtype for col, dtype in dtypes.items() if col in df.columns})
+
+
+def compact_dtype(series, category_ratio=0.5):
+    """
+    Smallest dtype holding every value of `series` exactly
+
+    Integers (numpy or nullable) go to the narrowest integer type of their
+    range, floats to float32 when all values survive the round trip, and
+    text with fewer than `category_ratio` distinct values per row to
+    `category`; anything else keeps its dtype.
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(dtype):
+        return dtype
+    if pd.api.types.is_integer_dtype(dtype):
+        values = series.dropna()
+        if values.empty:
+            return dtype
+        for candidate in ('int8', 'int16', 'int32'):
+            info = np.iinfo(candidate)
+            if info.min <= values.min() and values.max() <= info.max:
+                return candidate.capitalize() if isinstance(dtype, pd.api.extensions.ExtensionDtype) else candidate
+        return dtype
+    if pd.api.types.is_float_dtype(dtype):
+        values = series.to_numpy(dtype='float64', na_value=np.nan)
+        return 'float32' if np.array_equal(values.astype('float32').astype('float64'), values, equal_nan=True) else dtype
+    if pd.api.types.is_string_dtype(dtype) or dtype == object:
+        return 'category' if series.nunique() < category_ratio * len(series) else dtype
+    return dtype
+
+
+def compact_dtypes(df, category_ratio=0.5):
+    """`df` with every column cast to its `compact_dtype` (values unchanged)"""
+    dtypes = {column: compact_dtype(df[column], category_ratio) for column in df.columns}
+    return df.astype({column: dtype for column, dtype in dtypes.items() if dtype != df[column].dtype})
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def partition_dir(source, crawl_date, root=DATASET_ROOT):
+    return Path(root) / f"source={source}" / f"crawl_date={crawl_date}"
+
+
+def write_dataset(df, source, crawl_date=None, root=DATASET_ROOT, row_group_size=50_000, dtypes=None):
+    """
+    Write `df` as the (source, crawl_date) partition, replacing any previous version
+
+    Args:
+        df (pd.DataFrame): Processed listings of one source
+        source (str): Source name, e.g. "alonhadat"
+        crawl_date (str): ISO date of the crawl; defaults to today
+        root (Path): Dataset root directory
+        row_group_size (int): Rows per Parquet row group (the unit of predicate pushdown)
+        dtypes (dict): Column dtypes to store; the source's `PROCESSED_DTYPES` if None
+
+    Returns:
+        Path: The written Parquet file
+    """
+    crawl_date = date.fromisoformat(crawl_date).isoformat() if crawl_date else date.today().isoformat()
+    dtypes = PROCESSED_DTYPES.get(source) if dtypes is None else dtypes
+    if dtypes:
+        df = apply_dtypes(df, dtypes)
+    out_dir = partition_dir(source, crawl_date, root)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for old in out_dir.glob("*.parquet"):
+        old.unlink()
+    out_path = out_dir / "part-0.parquet"
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(table, out_path, row_group_size=row_group_size, compression="zstd")
+    print(f"Wrote {len(df)} rows to {out_path}")
+    return out_path
+
+
+def list_sources(root=DATASET_ROOT):
+    return sorted(p.name.split("=", 1)[1] for p in Path(root).glob("source=*") if p.is_dir())
+
+
+def list_crawl_dates(source, root=DATASET_ROOT):
+    return sorted(p.name.split("=", 1)[1] for p in (Path(root) / f"source={source}").glob("crawl_date=*"))
+
+
+def load_dataset(sources=None, columns=None, filters=None, crawl_dates="latest", root=DATASET_ROOT):
+    """
+    Load listings from the Parquet dataset
+
+    Args:
+        sources (list or str): Sources to read; all sources if None
+        columns (list): Columns to decode; every column if None. Sources lacking
+            a requested column get it filled with NA.
+        filters (list): pyarrow filter tuples pushed down to the scan,
+            e.g. [("price_converted", ">", 0), ("district", "in", ["Đống Đa"])]
+        crawl_dates (str or list): "latest" (default), "all" or explicit ISO dates
+        root (Path): Dataset root directory
+
+    Returns:
+        pd.DataFrame: Rows of every selected partition, with `source` and `crawl_date` columns
+    """
+    if isinstance(sources, str):
+        sources = [sources]
+    sources = sources or list_sources(root)
+
+    frames = []
+    for source in sources:
+        available = list_crawl_dates(source, root)
+        if crawl_dates == "latest":
+            dates = available[-1:]
+        elif crawl_dates == "all":
+            dates = available
+        else:
+            dates = [d for d in crawl_dates if d in available]
+
+        for crawl_date in dates:
+            path = partition_dir(source, crawl_date, root)
+            schema = pq.read_schema(next(path.glob("*.parquet")))
+            present = None if columns is None else [c for c in columns if c in schema.names]
+            # Filters on columns this source does not have cannot match any row
+            if filters and any(f[0] not in schema.names for f in filters):
+                continue
+            table = pq.read_table(path, columns=present, filters=filters)
+            df = table.to_pandas()
+            if columns is not None:
+                df = df.reindex(columns=[c for c in columns if c not in ("source", "crawl_date")])
+            df["source"] = source
+            df["crawl_date"] = crawl_date
+            frames.append(df)
+
+    if not frames:
+        return pd.DataFrame(columns=list(columns or []))
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    df["source"] = df["source"].astype("category")
+    df["crawl_date"] = df["crawl_date"].astype("category")
+    return df
+
+
+FILTER_OPS = {
+    "==": operator.eq, "=": operator.eq, "!=": operator.ne, "<": operator.lt,
+    "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+}
+
+
+def apply_filters(df, filters):
+    """Evaluate pyarrow-style filter tuples on an in-memory DataFrame"""
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters or []:
+        if op == "in":
+            mask &= df[column].isin(value)
+        elif op == "not in":
+            mask &= ~df[column].isin(value)
+        else:
+            mask &= FILTER_OPS[op](df[column], value)
+    return df[mask]
+
+
+def load_processed(source, columns=None, filters=None, root=DATASET_ROOT, processed_dir=PROCESSED_DIR,
+                   compact=False):
+    """
+    Load one source's processed listings with the trainers' dtypes
+
+    Reads the latest Parquet partition when the dataset has been built, and
+    falls back to `<source>_processed.csv` (parsed with the same explicit
+    dtypes and column projection) otherwise. With `compact`, columns are
+    further narrowed by `compact_dtypes`.
+    """
+    if list_crawl_dates(source, root):
+        df = load_dataset(source, columns=columns, filters=filters, root=root)
+        df = df.drop(columns=["source", "crawl_date"])
+    else:
+        dtypes = PROCESSED_DTYPES.get(source, {})
+        filter_cols = [f[0] for f in filters or []]
+        usecols = None if columns is None else list(dict.fromkeys(list(columns) + filter_cols))
+        df = pd.read_csv(Path(processed_dir) / f"{source}_processed.csv", usecols=usecols)
+        df = apply_filters(apply_dtypes(df, dtypes), filters)
+        df = (df if columns is None else df[list(columns)]).reset_index(drop=True)
+    return compact_dtypes(df) if compact else df
+
+
+def load_corpus(sources=None, columns=None, filters=None, root=CORPUS_ROOT):
+    """
+    Load the canonical corpus built by corpus.py: every source in one schema
+
+    Same arguments as `load_dataset`; rows keep their `source` column.
+    """
+    df = load_dataset(sources, columns=columns, filters=filters, root=root)
+    df = df.drop(columns=["crawl_date"]) if "crawl_date" in df.columns else df
+    # Per-source categories differ, so the concatenation falls back to plain text
+    return df.astype({column: "category" for column in ("road", "ward", "district") if column in df.columns})
+
+
+def memory_report(processed_dir=PROCESSED_DIR, root=DATASET_ROOT):
+    """Print each source's in-memory size: default CSV read, typed load, compact load"""
+    print(f"{'source':<12}{'rows':>8}{'raw CSV MB':>12}{'typed MB':>10}{'compact MB':>12}{'saving':>8}")
+    for source in PROCESSED_DTYPES:
+        csv_path = Path(processed_dir) / f"{source}_processed.csv"
+        if not csv_path.exists():
+            continue
+        raw = memory_mb(pd.read_csv(csv_path))
+        typed = load_processed(source, root=root, processed_dir=processed_dir)
+        compact = memory_mb(compact_dtypes(typed))
+        print(f"{source:<12}{len(typed):>8}{raw:>12.2f}{memory_mb(typed):>10.2f}{compact:>12.2f}{raw / compact:>7.1f}x")
+
+
+def convert_processed_csvs(processed_dir=PROCESSED_DIR, root=DATASET_ROOT, crawl_date=None):
+    """One-shot conversion of the `<source>_processed.csv` files into the dataset"""
+    for source, dtypes in PROCESSED_DTYPES.items():
+        csv_path = Path(processed_dir) / f"{source}_processed.csv"
+        if not csv_path.exists():
+            print(f"Skipping {source}: {csv_path} not found")
+            continue
+        crawl = crawl_date or date.fromtimestamp(os.path.getmtime(csv_path)).isoformat()
+        df = pd.read_csv(csv_path, dtype={c: t for c, t in dtypes.items() if t in ("string", "category")})
+        write_dataset(df, source, crawl_date=crawl, root=root)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the Parquet dataset from the processed CSVs")
+    parser.add_argument("crawl_date", nargs="?", help="ISO crawl date of the partitions (default: CSV mtime)")
+    parser.add_argument("--memory", action="store_true", help="Only report the memory of each source")
+    args = parser.parse_args()
+    if args.memory:
+        memory_report()
+    else:
+        convert_processed_csvs(crawl_date=args.crawl_date)
@@ -0,0 +1,357 @@
+"""
+Hanoi gazetteer: resolve an address to (road, ward, district) in one pass.
+
+The vocabulary (every road, ward and district name seen in the processed
+datasets, plus the 30 Hanoi districts) is built once into `gazetteer.json`.
+At load time it is compiled into a word-level Aho-Corasick automaton over
+diacritic-free lowercase tokens, so "Quận Đống Đa", "quan dong da" and
+"Q. Đống Đa" all hit the same entry and an address is scanned once,
+whatever the size of the vocabulary.
+
+Resolution of the matches (leftmost-longest, never across commas):
+1. A name right after a marker word ("Đường", "Phường", "Quận", "P.", ...)
+   takes the marker's kind; after "Ngõ"/"Hẻm" the alley and house numbers
+   ("Ngõ 5 Láng Hạ", "Hẻm 12/3 ngách 4 ...") are skipped first. A marker
+   followed by an unknown name keeps the raw text up to the next comma, as
+   the regexes of parsing.py do (unless `raw_fallback` is off, for text
+   without commas such as URL slugs).
+2. Unmarked names fill the kinds still missing: the district from the
+   rightmost district name, the ward from the rightmost ward name, the road
+   from the leftmost road name.
+3. A ward (marked or not) is kept only if the datasets have it in the
+   address's district: "Nguyễn Trãi, Thanh Xuân" is the road, since the ward
+   Nguyễn Trãi is in Hà Đông, while Minh Khai is a ward of both Hai Bà Trưng
+   and Bắc Từ Liêm.
+4. A missing district is inferred from the ward (else the road) when the
+   datasets place that name in one district most of the time.
+
+The app, batch scoring, the compiled runtime and the alonhadat
+preprocessing notebook all resolve addresses through `get_gazetteer()`.
+
+Usage:
+    python gazetteer.py                 # rebuild gazetteer.json from the processed datasets
+    python gazetteer.py "Số 1 Đại Cồ Việt, Hai Bà Trưng, Hà Nội"
+"""
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gazetteer.json')
+PROCESSED_DIR = os.path.dirname(os.path.abspath(__file__))
+KINDS = ('road', 'ward', 'district')
+
+HANOI_DISTRICTS = [
+    "Ba Đình", "Hoàn Kiếm", "Tây Hồ", "Long Biên", "Cầu Giấy",
+    "Đống Đa", "Hai Bà Trưng", "Hoàng Mai", "Thanh Xuân", "Hà Đông",
+    "Bắc Từ Liêm", "Nam Từ Liêm", "Sơn Tây", "Ba Vì", "Chương Mỹ",
+    "Đan Phượng", "Đông Anh", "Gia Lâm", "Hoài Đức", "Mê Linh",
+    "Mỹ Đức", "Phú Xuyên", "Phúc Thọ", "Quốc Oai", "Sóc Sơn",
+    "Thạch Thất", "Thanh Oai", "Thanh Trì", "Thường Tín", "Ứng Hòa",
+]
+# Words announcing the kind of the name that follows (same prefixes as parsing.py's patterns)
+MARKERS = {
+    'road': ["Đường", "Phố", "Ngõ", "Hẻm", "Đại lộ", "Tỉnh Lộ", "Quốc lộ", "QL", "TL"],
+    'ward': ["Phường", "Xã", "Thị trấn", "P", "X", "TT"],
+    'district': ["Quận", "Huyện", "Thị xã", "Thành phố", "Q", "H"],
+}
+# Road markers followed by an alley/house number before the road name ("Ngõ 5 Láng Hạ")
+NUMBERED_MARKERS = {"Ngõ", "Hẻm"}
+# Tokens skipped after those markers: numbers ("5", "12a") and the alley words between them
+HOUSE_NUMBER_TOKEN = re.compile(r'^(\d+[a-z]?|ngo|ngach|hem|kiet|so)$')
+# Matched so that "Thành phố Hà Nội" is not read as a district called "Hà Nội"
+CITY_NAMES = ["Hà Nội"]
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+@lru_cache(maxsize=65536)
+def normalize_token(token):
+    """Lowercase and strip Vietnamese diacritics ("Đống" -> "dong")"""
+    text = unicodedata.normalize('NFD', token.lower().replace('đ', 'd'))
+    return ''.join(ch for ch in text if unicodedata.category(ch) != 'Mn')
+
+
+def normalize_name(name):
+    return tuple(normalize_token(token) for token in TOKEN_PATTERN.findall(name))
+
+
+def lower_name(name):
+    return tuple(token.lower() for token in TOKEN_PATTERN.findall(name))
+
+
+def tokenize(address):
+    """
+    Split an address into word tokens; commas become a ',' token
+
+    Returns:
+        tuple: (normalized tokens, lowercase tokens with diacritics, spans in `address`)
+    """
+    tokens, lowered, spans, last = [], [], [], 0
+    for match in TOKEN_PATTERN.finditer(address):
+        if ',' in address[last:match.start()] and tokens:
+            tokens.append(',')
+            lowered.append(',')
+            spans.append((last, match.start()))
+        tokens.append(normalize_token(match.group()))
+        lowered.append(match.group().lower())
+        spans.append(match.span())
+        last = match.end()
+    return tokens, lowered, spans
+
+
+class Gazetteer:
+    """
+    Word-level Aho-Corasick automaton over the gazetteer names
+
+    Args:
+        names (dict): kind -> list of canonical names
+        district_of (dict): 'ward'/'road' -> {name: most common district}
+        ward_districts (dict): ward name -> every district the datasets place it in
+    """
+
+    def __init__(self, names, district_of=None, ward_districts=None):
+        self.names = names
+        self.district_of = district_of or {}
+        self.ward_districts = ward_districts or {}
+        # Entries are (kind, canonical name, lowercase tokens); markers have kind
+        # 'marker:<kind>', the city 'city'
+        patterns = defaultdict(list)
+        for kind, values in names.items():
+            for name in values:
+                patterns[normalize_name(name)].append((kind, name, lower_name(name)))
+        for kind, words in MARKERS.items():
+            for word in words:
+                patterns[normalize_name(word)].append(('marker:' + kind, word, lower_name(word)))
+        for name in CITY_NAMES:
+            patterns[normalize_name(name)].append(('city', name, lower_name(name)))
+
+        self._build(patterns)
+
+    def _build(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]  # (pattern length, entries) of every pattern ending at the node
+        for tokens, entries in patterns.items():
+            if not tokens:
+                continue
+            node = 0
+            for token in tokens:
+                if token not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][token] = len(self.goto) - 1
+                node = self.goto[node][token]
+            self.output[node].append((len(tokens), entries))
+
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for token, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and token not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(token, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def matches(self, tokens, lowered):
+        """
+        Leftmost-longest non-overlapping matches: list of (start, end, entries)
+
+        Among the matches starting on the same token, one spelled with the
+        same diacritics as the address wins over longer ones that only match
+        once diacritics are stripped ("Đường Xã Đàn" is a road marker, not
+        the ward "Dương Xá").
+        """
+        found = []
+        node = 0
+        for i, token in enumerate(tokens):
+            while node and token not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(token, 0)
+            for length, entries in self.output[node]:
+                start = i - length + 1
+                exact = [entry for entry in entries if entry[2] == tuple(lowered[start:i + 1])]
+                found.append((start, i + 1, exact or entries, bool(exact)))
+        found.sort(key=lambda match: (match[0], not match[3], -match[1]))
+        marker_starts = {start for start, _, entries, _ in found if entries[0][0].startswith('marker:')}
+        selected, end = [], 0
+        for start, stop, entries, _ in found:
+            if start < end:
+                continue
+            # Names starting with a marker word ("Phố Yên", "Quốc lộ 21B") only count right after
+            # a marker: "Phố Yên Lạc" is the marker "Phố" and the road "Yên Lạc"
+            if start in marker_starts and not entries[0][0].startswith('marker:') and \
+                    not (selected and selected[-1][1] == start and selected[-1][2][0][0].startswith('marker:')):
+                continue
+            selected.append((start, stop, [entry[:2] for entry in entries]))
+            end = stop
+        return selected
+
+    def in_district(self, ward, district):
+        """Whether `ward` can be in `district` (True when either is unknown or the ward's districts are)"""
+        districts = self.ward_districts.get(ward)
+        return district is None or not districts or district in districts
+
+    def resolve(self, address, raw_fallback=True):
+        """
+        Road, ward and district of one address
+
+        Args:
+            address (str): Address text
+            raw_fallback (bool): Keep the raw text after a marker when no known name follows it;
+                off, only gazetteer names are returned
+
+        Returns:
+            dict: `road`, `ward`, `district` (None where unknown) and
+            `district_inferred` (True if the district came from the ward/road)
+        """
+        result = {'road': None, 'ward': None, 'district': None, 'district_inferred': False}
+        if not isinstance(address, str) or not address:
+            return result
+        tokens, lowered, spans = tokenize(address)
+        matches = self.matches(tokens, lowered)
+
+        unmarked, consumed = [], 0
+        for i, (start, end, entries) in enumerate(matches):
+            if start < consumed:
+                continue  # the name (or raw text) of the previous marker
+            marker, word = next(((kind[7:], name) for kind, name in entries if kind.startswith('marker:')),
+                                (None, None))
+            if marker is None:
+                unmarked.append(entries)
+                continue
+            name_start = end
+            if word in NUMBERED_MARKERS:
+                while name_start < len(tokens) and HOUSE_NUMBER_TOKEN.match(tokens[name_start]):
+                    name_start += 1
+            following = next((match for match in matches[i + 1:] if match[0] >= name_start), None)
+            if following is not None and following[0] != name_start:
+                following = None
+            kinds = dict(following[2]) if following is not None else {}
+            if 'city' in kinds:
+                continue
+            if kinds and not any(kind.startswith('marker:') for kind in kinds):
+                name, consumed = kinds.get(marker, following[2][0][1]), following[1]
+            elif not raw_fallback:
+                continue
+            else:
+                # Unknown name: keep the raw text up to the next comma
+                consumed = next((j for j in range(name_start, len(tokens)) if tokens[j] == ','), len(tokens))
+                name = address[spans[name_start][0]:spans[consumed - 1][1]].strip() if consumed > name_start else None
+            if result[marker] is None:
+                result[marker] = name
+
+        for kind, order in (('district', reversed), ('ward', reversed), ('road', iter)):
+            if kind == 'ward' and result['ward'] is not None and not self.in_district(result['ward'], result['district']):
+                result['ward'] = None
+            if result[kind] is None:
+                for entries in order(unmarked):
+                    names = dict(entries)
+                    if kind == 'ward' and not self.in_district(names.get('ward'), result['district']):
+                        continue
+                    if kind in names and names[kind] not in (result['road'], result['ward'], result['district']):
+                        result[kind] = names[kind]
+                        break
+
+        if result['district'] is None:
+            for kind in ('ward', 'road'):
+                district = self.district_of.get(kind, {}).get(result[kind])
+                if district:
+                    result['district'], result['district_inferred'] = district, True
+                    break
+        return result
+
+    def resolve_many(self, addresses, raw_fallback=True):
+        """
+        Resolve a Series of addresses, once per distinct value (see `resolve` for `raw_fallback`)
+
+        Returns:
+            pd.DataFrame: Columns road, ward, district, district_inferred aligned on `addresses`
+        """
+        import pandas as pd
+        codes, uniques = pd.factorize(addresses, use_na_sentinel=True)
+        resolved = pd.DataFrame([self.resolve(address, raw_fallback) for address in uniques] + [self.resolve(None)])
+        out = resolved.iloc[codes].reset_index(drop=True)
+        out.index = addresses.index
+        return out
+
+    def save(self, path=GAZETTEER_PATH):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'names': self.names, 'district_of': self.district_of, 'ward_districts': self.ward_districts},
+                      f, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, path=GAZETTEER_PATH):
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+        return cls(state['names'], state['district_of'], state.get('ward_districts'))
+
+
+def build_gazetteer(processed_dir=PROCESSED_DIR):
+    """
+    Collect the names of the processed datasets
+
+    Roads and wards come from alonhadat's parsed addresses, districts from
+    alonhadat, nhatot and the list of Hanoi districts. Each road/ward is
+    linked to its most common district when that district holds at least
+    80% of its listings, and each ward to every district it appears in.
+    """
+    import pandas as pd
+    alonhadat = pd.read_csv(os.path.join(processed_dir, 'alonhadat_processed.csv'),
+                            usecols=['road', 'ward', 'district'])
+    names = {}
+    for kind in KINDS:
+        counts = alonhadat[kind].dropna().astype(str).str.strip().value_counts()
+        if kind == 'district':
+            nhatot = pd.read_csv(os.path.join(processed_dir, 'nhatot_processed.csv'), usecols=['district'])
+            stripped = nhatot['district'].dropna().str.replace(r'^(Quận|Huyện|Thị xã)\s+', '', regex=True)
+            counts = counts.add(stripped.value_counts(), fill_value=0)
+            counts = counts.add(pd.Series(1, index=HANOI_DISTRICTS), fill_value=0)
+        # One spelling per name up to case (the most frequent), most frequent names first so
+        # that they win when only the diacritic-free form matches
+        canonical = {}
+        for name, _ in counts.sort_values(ascending=False, kind='stable').items():
+            canonical.setdefault(lower_name(name), name)
+        names[kind] = [name for key, name in canonical.items() if key]
+
+    district_of = {}
+    for kind in ('ward', 'road'):
+        pairs = alonhadat.dropna(subset=[kind, 'district']).groupby(kind)['district']
+        top = pairs.agg(lambda districts: Counter(districts).most_common(1)[0])
+        district_of[kind] = {name: district for name, (district, n) in top.items()
+                             if n >= 0.8 * pairs.get_group(name).size}
+    ward_districts = {ward: sorted(districts.unique())
+                      for ward, districts in alonhadat.dropna(subset=['ward', 'district']).groupby('ward')['district']}
+    return Gazetteer(names, district_of, ward_districts)
+
+
+_gazetteer = None
+
+
+def get_gazetteer(path=GAZETTEER_PATH):
+    """The process-wide gazetteer, loaded from `path` (built from the datasets if missing)"""
+    global _gazetteer
+    if _gazetteer is None:
+        if os.path.exists(path):
+            _gazetteer = Gazetteer.load(path)
+        else:
+            _gazetteer = build_gazetteer()
+            _gazetteer.save(path)
+    return _gazetteer
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for address in sys.argv[1:]:
+            print(address, '->', get_gazetteer().resolve(address))
+    else:
+        started = time.perf_counter()
+        gazetteer = build_gazetteer()
+        gazetteer.save()
+        print(f"Wrote {GAZETTEER_PATH} in {time.perf_counter() - started:.2f}s: "
+              + ", ".join(f"{len(gazetteer.names[kind])} {kind}s" for kind in KINDS))
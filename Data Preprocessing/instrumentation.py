@@ -0,0 +1,358 @@
+"""
+Stage timers, counters and memory tracking for the pipeline's entry points.
+
+A `Metrics` object collects, per named stage:
+
+    calls, seconds, cpu_seconds   wall and CPU time of the stage's thread (summed over calls)
+    peak_rss_bytes                process peak RSS when the stage last ended (a high-water mark)
+    alloc_peak_bytes              peak Python allocations inside the stage, above what was
+                                  allocated when it started (only with `trace_memory`; tracemalloc
+                                  slows allocation-heavy code down noticeably)
+    counters                      e.g. rows, pages, records, added with `count`
+
+Stages nest ("fit" inside "export" is reported as "export/fit") and may run
+on several threads at once; repeated calls of a stage (one per crawled
+page, one per prediction) are aggregated. tracemalloc's peak is process-wide,
+so the allocation peaks of stages running concurrently include each other.
+
+    from instrumentation import instrumented
+
+    with instrumented("export_model", metrics_path="metrics.json") as metrics:
+        with metrics.stage("load"):
+            df = load()
+            metrics.count("rows", len(df))
+
+        @metrics.timed("fit")
+        def fit(): ...
+
+The snapshot is written as JSON, appended as one JSON line (`.jsonl`, to
+keep a history of nightly runs), or as Prometheus text (`.prom`, for the
+node_exporter textfile collector). `profile_path` additionally records the
+run with cProfile (`.prof`, for pstats/snakeviz), or with pyinstrument
+when the path ends with `.html` and pyinstrument is installed.
+
+Entry points take `--metrics`, `--profile` and `--trace-memory` (see
+`add_arguments`); scripts without a command line (the merge scripts, the
+Streamlit app) read the `PIPELINE_METRICS`, `PIPELINE_PROFILE` and
+`PIPELINE_TRACE_MEMORY` environment variables instead. With none of them
+set, the timers still run (a few microseconds per stage) but nothing is
+written. Library functions take a `metrics` argument defaulting to
+`NO_METRICS`, which measures nothing.
+"""
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_ENV = "PIPELINE_METRICS"
+PROFILE_ENV = "PIPELINE_PROFILE"
+TRACE_MEMORY_ENV = "PIPELINE_TRACE_MEMORY"
+PROMETHEUS_PREFIX = "realestate"
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far (None where unavailable)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _new_stage():
+    return {"calls": 0, "seconds": 0.0, "cpu_seconds": 0.0, "peak_rss_bytes": None, "alloc_peak_bytes": None,
+            "counters": {}}
+
+
+class Metrics:
+    """
+    Per-stage timings, counters and memory of one pipeline run
+
+    Args:
+        pipeline (str): Name of the run, e.g. "export_model"; a label of every exported metric
+        trace_memory (bool): Track Python allocations per stage with tracemalloc
+    """
+
+    def __init__(self, pipeline, trace_memory=False):
+        self.pipeline = pipeline
+        self.trace_memory = trace_memory
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def _path(self, name):
+        stack = self._stack()
+        return "/".join([frame["name"] for frame in stack] + [name]) if stack else name
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as stage `name` (nested inside the current stage, if any)"""
+        stack = self._stack()
+        path = self._path(name)
+        frame = {"name": name, "inner_peak": 0}
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # reset_peak() below would lose the enclosing stage's peak so far
+                stack[-1]["inner_peak"] = max(stack[-1]["inner_peak"], peak)
+            tracemalloc.reset_peak()
+            frame["alloc_start"] = current
+        stack.append(frame)
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        try:
+            yield self
+        finally:
+            seconds, cpu_seconds = time.perf_counter() - started, time.thread_time() - cpu_started
+            stack.pop()
+            alloc_peak = None
+            if tracing:
+                peak = max(tracemalloc.get_traced_memory()[1], frame["inner_peak"])
+                alloc_peak = max(0, peak - frame["alloc_start"])
+                if stack:
+                    stack[-1]["inner_peak"] = max(stack[-1]["inner_peak"], peak)
+            self.record(path, seconds, cpu_seconds, alloc_peak=alloc_peak)
+
+    def timed(self, name=None):
+        """Decorator timing every call of a function as stage `name` (default: the function name)"""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or func.__name__):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def record(self, stage, seconds, cpu_seconds=None, alloc_peak=None, peak_rss=None, **counters):
+        """
+        Add a call of `stage` timed elsewhere, e.g. in a worker process
+
+        Args:
+            stage (str): Full stage name
+            seconds (float): Wall time of the call
+            cpu_seconds (float): CPU time of the call, if known
+            alloc_peak (int): Peak Python allocations of the call, if known
+            peak_rss (int): Peak RSS of the process that ran the call; this process's if None
+            **counters: Counters to add to the stage, e.g. rows=1000
+        """
+        rss = peak_rss if peak_rss is not None else peak_rss_bytes()
+        with self.lock:
+            entry = self.stages.setdefault(stage, _new_stage())
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["cpu_seconds"] += cpu_seconds or 0.0
+            entry["peak_rss_bytes"] = rss
+            if alloc_peak is not None:
+                entry["alloc_peak_bytes"] = max(entry["alloc_peak_bytes"] or 0, alloc_peak)
+            for counter, n in counters.items():
+                entry["counters"][counter] = entry["counters"].get(counter, 0) + n
+                self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def count(self, name, n=1):
+        """Add `n` to counter `name`, for the run and for the current stage"""
+        stack = self._stack()
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+            if stack:
+                path = "/".join(frame["name"] for frame in stack)
+                counters = self.stages.setdefault(path, _new_stage())["counters"]
+                counters[name] = counters.get(name, 0) + n
+
+    def snapshot(self):
+        """Everything measured so far as a JSON-serializable dict"""
+        with self.lock:
+            stages = {name: {**entry, "counters": dict(entry["counters"])} for name, entry in self.stages.items()}
+            counters = dict(self.counters)
+        return {
+            "pipeline": self.pipeline,
+            "started_at": self.started_at,
+            "wall_seconds": time.perf_counter() - self.started,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "counters": counters,
+            "stages": stages,
+        }
+
+    def to_prometheus(self):
+        """The snapshot in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            samples = [(labels, value) for labels, value in samples if value is not None]
+            if not samples:
+                return
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                labels = ",".join(f'{key}="{escape(v)}"' for key, v in {"pipeline": self.pipeline, **labels}.items())
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{labels}}} {value}")
+
+        stages = snapshot["stages"].items()
+        metric("wall_seconds", "gauge", "Wall time of the run", [({}, snapshot["wall_seconds"])])
+        metric("peak_rss_bytes", "gauge", "Peak resident set size of the run", [({}, snapshot["peak_rss_bytes"])])
+        metric("items_total", "counter", "Items counted during the run",
+               [({"counter": counter}, n) for counter, n in snapshot["counters"].items()])
+        metric("stage_calls_total", "counter", "Calls of each stage",
+               [({"stage": name}, entry["calls"]) for name, entry in stages])
+        metric("stage_seconds_total", "counter", "Wall time spent in each stage",
+               [({"stage": name}, entry["seconds"]) for name, entry in stages])
+        metric("stage_cpu_seconds_total", "counter", "CPU time of the threads running each stage",
+               [({"stage": name}, entry["cpu_seconds"]) for name, entry in stages])
+        metric("stage_peak_rss_bytes", "gauge", "Process peak RSS when each stage last ended",
+               [({"stage": name}, entry["peak_rss_bytes"]) for name, entry in stages])
+        metric("stage_alloc_peak_bytes", "gauge", "Peak Python allocations inside each stage (tracemalloc)",
+               [({"stage": name}, entry["alloc_peak_bytes"]) for name, entry in stages])
+        metric("stage_items_total", "counter", "Items counted in each stage",
+               [({"stage": name, "counter": counter}, n)
+                for name, entry in stages for counter, n in entry["counters"].items()])
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Write the snapshot to `path`
+
+        `.prom` files get Prometheus text, `.jsonl` files one appended JSON
+        line per run, anything else indented JSON.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".prom":
+            path.write_text(self.to_prometheus(), encoding="utf-8")
+        elif path.suffix == ".jsonl":
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.snapshot(), ensure_ascii=False) + "\n")
+        else:
+            path.write_text(json.dumps(self.snapshot(), ensure_ascii=False, indent=2), encoding="utf-8")
+
+    def report(self):
+        """Print one line per stage: calls, wall and CPU seconds, peak RSS and allocations"""
+        snapshot = self.snapshot()
+        mb = lambda value: f"{value / 2 ** 20:,.1f}" if value is not None else "-"
+        print(f"\n{self.pipeline}: {snapshot['wall_seconds']:.2f}s wall, peak RSS {mb(snapshot['peak_rss_bytes'])} MB")
+        if snapshot["counters"]:
+            print(", ".join(f"{counter}={n:,}" for counter, n in snapshot["counters"].items()))
+        print(f"{'stage':<32}{'calls':>8}{'seconds':>10}{'cpu s':>10}{'rss MB':>10}{'alloc MB':>10}  counters")
+        for name, entry in snapshot["stages"].items():
+            counters = ", ".join(f"{counter}={n:,}" for counter, n in entry["counters"].items())
+            print(f"{name:<32}{entry['calls']:>8}{entry['seconds']:>10.3f}{entry['cpu_seconds']:>10.3f}"
+                  f"{mb(entry['peak_rss_bytes']):>10}{mb(entry['alloc_peak_bytes']):>10}  {counters}")
+
+
+class NullMetrics:
+    """Stand-in for `Metrics` in functions called without one: every method does nothing"""
+
+    @contextmanager
+    def stage(self, name):
+        yield self
+
+    def timed(self, name=None):
+        return lambda func: func
+
+    def record(self, stage, seconds, cpu_seconds=None, alloc_peak=None, peak_rss=None, **counters):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+
+# Default of the `metrics` argument of instrumented functions
+NO_METRICS = NullMetrics()
+
+
+@contextmanager
+def profiled(path):
+    """Profile the enclosed block to `path`: pyinstrument HTML for `.html` (if installed), else cProfile stats"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".html":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument is not installed, writing cProfile stats instead")
+            path = path.with_suffix(".prof")
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                path.write_text(profiler.output_html(), encoding="utf-8")
+                print(f"Profile written to {path}")
+            return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"Profile written to {path} (python -m pstats {path})")
+
+
+@contextmanager
+def instrumented(pipeline, metrics_path=None, trace_memory=None, profile_path=None, report=None):
+    """
+    Run the enclosed block with a fresh `Metrics`, then write (and print) what it measured
+
+    Args:
+        pipeline (str): Name of the run
+        metrics_path (str): Where to write the metrics; `PIPELINE_METRICS` if None, nowhere if neither is set
+        trace_memory (bool): Track allocations with tracemalloc; `PIPELINE_TRACE_MEMORY` if None
+        profile_path (str): cProfile/pyinstrument output; `PIPELINE_PROFILE` if None
+        report (bool): Print the per-stage summary; defaults to whenever metrics are written
+    """
+    metrics_path = metrics_path or os.environ.get(METRICS_ENV)
+    profile_path = profile_path or os.environ.get(PROFILE_ENV)
+    if trace_memory is None:
+        trace_memory = os.environ.get(TRACE_MEMORY_ENV, "") not in ("", "0")
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    metrics = Metrics(pipeline, trace_memory=trace_memory)
+    try:
+        if profile_path:
+            with profiled(profile_path):
+                yield metrics
+        else:
+            yield metrics
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        if metrics_path:
+            metrics.write(metrics_path)
+            print(f"Metrics written to {metrics_path}")
+        if bool(metrics_path) if report is None else report:
+            metrics.report()
+
+
+def add_arguments(parser):
+    """Add the --metrics, --profile and --trace-memory options used by `instrumented`"""
+    group = parser.add_argument_group("instrumentation")
+    group.add_argument("--metrics", help="Write stage timings and memory: JSON, appended JSON line (.jsonl) "
+                                         "or Prometheus text (.prom)")
+    group.add_argument("--profile", help="Profile the run: cProfile stats (.prof) or pyinstrument HTML (.html)")
+    group.add_argument("--trace-memory", action="store_true", default=None,
+                       help="Track Python allocations per stage with tracemalloc (slower)")
+    return parser
@@ -0,0 +1,167 @@
+"""
+IQR outlier filtering shared by the preprocessing notebooks, the feature
+table and the scoring code.
+
+`IQRFilter.fit` computes the quartiles of every column with a single
+`DataFrame.quantile` call, and `inside` compares all columns against their
+bounds at once, so filtering makes one copy of the data whatever the
+number of columns. Unlike the old column-by-column loops, every column's
+bounds come from the same (unfiltered) rows, which makes them independent
+of the column order and reusable: `save`/`load` persist them as JSON, and
+`out_of_range` flags new listings against the training data's bounds.
+
+For data that does not fit in memory, `fit_stream` estimates the
+quartiles from an iterable of chunks with a fixed-size `QuantileSketch`.
+
+Usage:
+    from outliers import IQRFilter
+    iqr = IQRFilter(['area', 'bedrooms', 'floors', 'price_converted']).fit(df)
+    df = iqr.filter(df)
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+
+class QuantileSketch:
+    """
+    Approximate quantiles of a stream in bounded memory (a compacting KLL-style sketch)
+
+    Values are buffered at level 0; a level holding more than `k` values is
+    sorted and every other value (random offset) moves up a level with
+    twice the weight. Rank error is roughly `log2(n / k) / k` of the count.
+
+    Args:
+        k (int): Values kept per level
+        seed (int): Seed of the compaction offsets
+    """
+
+    def __init__(self, k=4096, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+        self.count = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self.k:
+                items = np.sort(self.levels[level])
+                # An odd value out stays behind so the total weight is preserved
+                leftover, items = (items[-1:], items[:-1]) if len(items) % 2 else (items[:0], items)
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[self.rng.integers(2)::2]])
+                self.levels[level] = leftover
+            level += 1
+        return self
+
+    def quantile(self, q):
+        """Approximate `q` quantile(s), NaN if no value has been seen"""
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(values), 2.0 ** level) for level, values in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cumulative = items[order], np.cumsum(weights[order])
+        ranks = np.asarray(q) * cumulative[-1]
+        return items[np.minimum(np.searchsorted(cumulative, ranks), len(items) - 1)]
+
+
+class IQRFilter:
+    """
+    Keep rows within [Q1 - multiplier * IQR, Q3 + multiplier * IQR] of every column
+
+    Args:
+        columns (list): Numeric columns to filter on
+        multiplier (float): IQR multiplier (1.5 is Tukey's fences)
+    """
+
+    def __init__(self, columns, multiplier=1.5):
+        self.columns = list(columns)
+        self.multiplier = multiplier
+        self.bounds = {}
+
+    def _set_quartiles(self, q1, q3):
+        iqr = np.asarray(q3, dtype='float64') - np.asarray(q1, dtype='float64')
+        lower = np.asarray(q1, dtype='float64') - self.multiplier * iqr
+        upper = np.asarray(q3, dtype='float64') + self.multiplier * iqr
+        self.bounds = {column: (float(lo), float(hi)) for column, lo, hi in zip(self.columns, lower, upper)}
+        return self
+
+    def fit(self, df):
+        """Quartiles of all columns from one vectorized `quantile` call"""
+        quartiles = df[self.columns].astype('float64').quantile([0.25, 0.75])
+        return self._set_quartiles(quartiles.loc[0.25].to_numpy(), quartiles.loc[0.75].to_numpy())
+
+    def fit_stream(self, chunks, k=4096):
+        """
+        Approximate quartiles from an iterable of DataFrame chunks
+
+        Args:
+            chunks (iterable): DataFrames holding at least `columns`, e.g. `pd.read_csv(..., chunksize=...)`
+            k (int): Sketch size per column (memory is about `k * log2(n / k)` values)
+        """
+        sketches = [QuantileSketch(k, seed=i) for i in range(len(self.columns))]
+        for chunk in chunks:
+            values = self._values(chunk, self.columns)
+            for i, sketch in enumerate(sketches):
+                sketch.update(values[:, i])
+        quartiles = np.array([sketch.quantile([0.25, 0.75]) for sketch in sketches]).reshape(-1, 2)
+        return self._set_quartiles(quartiles[:, 0], quartiles[:, 1])
+
+    @staticmethod
+    def _values(df, columns):
+        return df[columns].to_numpy(dtype='float64', na_value=np.nan)
+
+    def _limits(self, columns):
+        lower = np.array([self.bounds[column][0] for column in columns])
+        upper = np.array([self.bounds[column][1] for column in columns])
+        return lower, upper
+
+    def inside(self, df):
+        """Boolean array: rows within the bounds of every column (missing values count as outside)"""
+        if not self.bounds:
+            raise ValueError("IQRFilter is not fitted")
+        values = self._values(df, self.columns)
+        lower, upper = self._limits(self.columns)
+        return ((values >= lower) & (values <= upper)).all(axis=1)
+
+    def filter(self, df):
+        """Rows of `df` within the bounds, selected with one combined mask"""
+        return df[self.inside(df)]
+
+    def out_of_range(self, df):
+        """
+        Per-column flags for scoring: True where a present value is outside the bounds
+
+        Only the filter's columns that `df` has are checked; missing values are not flagged.
+        """
+        columns = [column for column in self.columns if column in df.columns]
+        values = self._values(df, columns)
+        lower, upper = self._limits(columns)
+        return pd.DataFrame((values < lower) | (values > upper), index=df.index, columns=columns)
+
+    def to_dict(self):
+        return {'columns': self.columns, 'multiplier': self.multiplier,
+                'bounds': {column: list(bound) for column, bound in self.bounds.items()}}
+
+    @classmethod
+    def from_dict(cls, state):
+        iqr = cls(state['columns'], state['multiplier'])
+        iqr.bounds = {column: tuple(bound) for column, bound in state['bounds'].items()}
+        return iqr
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,172 @@
+"""
+Vectorized parsers for the raw listing fields of all three sources.
+
+Every function takes a pandas Series of raw strings and returns a Series
+(or DataFrame) aligned on the same index. They reproduce the row-wise
+functions of the preprocessing notebooks value for value, but run as
+`str.extract` / `str.contains` passes instead of one Python call per row.
+
+Listing fields repeat a lot (reposted ads, common price strings), so each
+parser runs on the distinct values only and broadcasts the result back.
+
+Conventions: prices are returned in millions of VND, areas in m².
+"""
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+ROAD_PATTERN = r'(?:Đường|Phố|Ngõ|Hẻm|Đại lộ|Tỉnh Lộ|Quốc lộ|QL|TL)\s+([^,]+)'
+WARD_PATTERN = r'(?:Phường|Xã|Thị trấn|P\.|X\.|TT\.)\s+([^,]+)'
+DISTRICT_PATTERN = r'(?:Quận|Huyện|Thị xã|Thành phố|Q\.|H\.)\s+([^,\.]+)'
+PER_M2_PATTERN = r'\s*\/\s*m2|\s*\/\s*m²'
+DECIMAL_PATTERN = r'(\d+(?:\.\d+)?)'
+VN_NUMBER_PATTERN = r'([\d,.]+)'
+
+
+def on_unique_values(func):
+    """Run a Series parser once per distinct value and broadcast the result to every row"""
+    @wraps(func)
+    def wrapper(series, *args, **kwargs):
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        # Missing values get code -1, which indexes the trailing None appended here
+        distinct = pd.Series(list(uniques) + [None], dtype=series.dtype if len(uniques) else object)
+        parsed = func(distinct, *args, **kwargs).iloc[codes]
+        parsed.index = series.index
+        return parsed
+    return wrapper
+
+
+def _as_text(series):
+    """Raw values as a nullable string Series (missing values stay NA)"""
+    return series.astype("string")
+
+
+def _contains(text, pattern, regex=False, case=True):
+    return text.str.contains(pattern, regex=regex, case=case).fillna(False).to_numpy(dtype=bool)
+
+
+@on_unique_values
+def extract_address_components(addresses):
+    """
+    Split addresses into road, ward and district names
+
+    Returns:
+        pd.DataFrame: Columns `road`, `ward`, `district` (NaN where not found)
+    """
+    text = _as_text(addresses)
+    parts = pd.DataFrame({
+        name: text.str.extract(pattern, flags=2, expand=False).str.strip()  # 2 == re.IGNORECASE
+        for name, pattern in (("road", ROAD_PATTERN), ("ward", WARD_PATTERN), ("district", DISTRICT_PATTERN))
+    }, index=addresses.index)
+    return parts.astype(object).where(parts.notna(), None)
+
+
+@on_unique_values
+def parse_price(prices, monthly_as_nan=False):
+    """
+    Parse alonhadat / batdongsan price strings ("7,5 tỷ", "850 triệu", "36,6 triệu / m2")
+
+    Commas are decimal separators. "Thỏa thuận" (negotiable) and, with
+    `monthly_as_nan`, rental prices ("... / tháng") become NaN. Per-m² prices are
+    returned as-is; combine with `is_price_per_m2` to get a total.
+    """
+    text = _as_text(prices).str.lower()
+    number = pd.to_numeric(
+        text.str.replace(',', '.', regex=False).str.extract(DECIMAL_PATTERN, expand=False), errors='coerce'
+    ).to_numpy(dtype=float)
+
+    billions = _contains(text, 'tỷ')
+    millions = _contains(text, 'triệu')
+    value = np.where(billions, number * 1000, np.where(millions, number, number / 1e6))
+
+    invalid = _contains(text, 'thỏa thuận')
+    if monthly_as_nan:
+        invalid |= _contains(text, 'tháng')
+    return pd.Series(np.where(invalid, np.nan, value), index=prices.index)
+
+
+@on_unique_values
+def is_price_per_m2(prices):
+    """Flag prices quoted per m² ("36,6 triệu / m2")"""
+    text = _as_text(prices).str.lower()
+    return pd.Series(_contains(text, PER_M2_PATTERN, regex=True, case=False), index=prices.index)
+
+
+def parse_total_price(prices, areas, monthly_as_nan=False):
+    """Price in millions, multiplying per-m² quotes by the listing's area"""
+    value = parse_price(prices, monthly_as_nan=monthly_as_nan)
+    per_m2 = is_price_per_m2(prices)
+    return value.where(~per_m2, value * areas)
+
+
+@on_unique_values
+def parse_area(areas):
+    """Parse "80 m2" / "1.111 m²" / "36,5 m2" (dots are thousand separators, commas decimal)"""
+    text = areas.astype(str).str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    return pd.to_numeric(text.str.extract(DECIMAL_PATTERN, expand=False), errors='coerce')
+
+
+@on_unique_values
+def parse_count(values):
+    """First integer of strings such as "4 phòng ngủ" or "7 lầu", as nullable Int64"""
+    return pd.to_numeric(values.astype(str).str.extract(r'(\d+)', expand=False), errors='coerce').astype('Int64')
+
+
+def _vn_number(text):
+    """First Vietnamese-formatted number of each string ("1.234,5" -> 1234.5)"""
+    raw = text.str.extract(VN_NUMBER_PATTERN, expand=False)
+    raw = raw.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    return pd.to_numeric(raw, errors='coerce').to_numpy(dtype=float)
+
+
+@on_unique_values
+def parse_nhatot_price(prices):
+    """nhatot "Price" strings ("2,9 tỷ", "850 triệu") in millions of VND"""
+    text = _as_text(prices).str.strip().str.lower()
+    value = _vn_number(text)
+    return pd.Series(np.where(_contains(text, 'tỷ'), value * 1000.0, value), index=prices.index)
+
+
+@on_unique_values
+def parse_nhatot_price_per_m2(prices):
+    """nhatot "Price per m²" strings ("25 tr/m²") in millions of VND per m²"""
+    text = _as_text(prices).str.strip().str.lower()
+    value = _vn_number(text)
+    millions = _contains(text, 'tr/m²') | _contains(text, 'tr/m2') | _contains(text, 'triệu/m²')
+    billions = _contains(text, 'tỷ/m²') & ~millions
+    return pd.Series(np.where(billions, value * 1000.0, value), index=prices.index)
+
+
+@on_unique_values
+def parse_nhatot_space(spaces):
+    """nhatot "Space" strings ("116 m²", "1,2 ha") in m²"""
+    text = _as_text(spaces).str.strip().str.lower()
+    value = _vn_number(text)
+    square_metres = _contains(text, 'm²') | _contains(text, 'm2')
+    hectares = _contains(text, 'ha') & ~square_metres
+    return pd.Series(np.where(hectares, value * 10000.0, value), index=spaces.index)
+
+
+@on_unique_values
+def split_nhatot_description(descriptions):
+    """Bedrooms ("3 PN") and property type (text after the first "•") of nhatot descriptions"""
+    text = _as_text(descriptions).str.strip()
+    bedrooms = pd.to_numeric(text.str.extract(r'(\d+)\s*PN', expand=False), errors='coerce')
+    property_type = text.str.split('•').str[1].str.strip()
+    return pd.DataFrame({
+        'bedrooms': bedrooms,
+        'property_type': property_type.astype(object).where(property_type.notna(), None),
+    }, index=descriptions.index)
+
+
+@on_unique_values
+def split_nhatot_location(locations):
+    """District and posting date of nhatot "Location" strings ("Quận X • hôm qua")"""
+    text = _as_text(locations).str.strip()
+    parts = text.str.split('•')
+    out = pd.DataFrame({
+        'district_name': parts.str[0].str.strip(),
+        'date_posted': parts.str[1].str.strip(),
+    }, index=locations.index)
+    return out.astype(object).where(out.notna(), None)
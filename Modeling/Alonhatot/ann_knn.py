@@ -0,0 +1,157 @@
+"""
+Approximate nearest-neighbor KNN regression.
+
+`ANNKNeighborsRegressor` is a drop-in replacement for sklearn's
+`KNeighborsRegressor` (same `n_neighbors`, `weights` and `p` parameters,
+usable as the `regressor` step of the notebook's Pipeline and inside
+GridSearchCV) backed by an IVF index instead of a brute-force or tree search:
+
+- fit: k-means, trained on a sample of at most `SAMPLE_PER_LIST` rows per
+  cell, splits the training rows into `n_lists` cells (about sqrt(n) by
+  default); rows are stored as float32, sorted by cell, so every cell is
+  one contiguous slice.
+- query: only the `n_probe` cells whose centroids are closest to the query
+  are scanned exactly. `n_probe` is the recall/latency knob: 1 scans about
+  1/n_lists of the data, `n_probe = n_lists` is exact search.
+
+The query cost grows with the size of the probed cells (about
+n_probe * n / n_lists rows) instead of with the whole corpus.
+
+A pipeline using it unpickles only where this module is importable (add
+Modeling/Alonhatot to sys.path before loading a knn_model.joblib built with it).
+
+Usage:
+    from ann_knn import ANNKNeighborsRegressor
+    knn_pipeline = Pipeline(steps=[('preprocessor', preprocessor),
+                                   ('regressor', ANNKNeighborsRegressor(n_neighbors=20, n_probe=8))])
+"""
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.cluster import KMeans
+from sklearn.utils.validation import check_array, check_is_fitted, check_X_y
+
+# Rows per cell used to train the k-means centroids; every row is then assigned to its nearest one
+SAMPLE_PER_LIST = 64
+
+
+class IVFIndex:
+    """
+    Inverted-file index: k-means cells scanned exactly at query time
+
+    Args:
+        n_lists (int): Number of k-means cells
+        n_iter (int): k-means iterations
+        random_state (int): Seed of k-means
+    """
+
+    def __init__(self, n_lists, n_iter=10, random_state=0):
+        self.n_lists = n_lists
+        self.n_iter = n_iter
+        self.random_state = random_state
+
+    def build(self, X):
+        X = np.asarray(X, dtype='float32')
+        n_lists = max(1, min(self.n_lists, len(X)))
+        rng = np.random.default_rng(self.random_state)
+        sample = X[rng.choice(len(X), SAMPLE_PER_LIST * n_lists, replace=False)] \
+            if len(X) > SAMPLE_PER_LIST * n_lists else X
+        kmeans = KMeans(n_clusters=n_lists, n_init=1, max_iter=self.n_iter, random_state=self.random_state).fit(sample)
+        self.centroids = kmeans.cluster_centers_.astype('float32')
+        labels = np.argmin(self._centroid_distances(X), axis=1)
+        order = np.argsort(labels, kind='stable')
+        self.data = X[order]
+        self.ids = order  # position in `data` -> row of the training data
+        counts = np.bincount(labels, minlength=n_lists)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        return self
+
+    def _centroid_distances(self, X, chunk_size=65536):
+        """Squared Euclidean distances from every row of X to every centroid"""
+        norms = np.einsum('ij,ij->i', self.centroids, self.centroids)[None, :]
+        return np.vstack([np.einsum('ij,ij->i', chunk, chunk)[:, None] - 2 * chunk @ self.centroids.T + norms
+                          for chunk in np.array_split(X, max(1, -(-len(X) // chunk_size)))])
+
+    def search(self, X, k, n_probe, p=2):
+        """
+        k approximate nearest neighbors of every row of X
+
+        Cells are probed nearest centroid first; more than `n_probe` cells are
+        scanned when the first ones hold fewer than `k` rows.
+
+        Returns:
+            tuple: (distances, training row indices), both of shape (len(X), k), nearest first
+        """
+        X = np.asarray(X, dtype='float32')
+        k = min(k, len(self.data))
+        probe_order = np.argsort(self._centroid_distances(X), axis=1)
+        sizes = np.diff(self.offsets)
+
+        distances = np.empty((len(X), k), dtype='float64')
+        indices = np.empty((len(X), k), dtype='int64')
+        for row, (query, cells) in enumerate(zip(X, probe_order)):
+            # Enough cells to hold k candidates, and at least n_probe of them
+            n_cells = max(n_probe, int(np.searchsorted(np.cumsum(sizes[cells]), k)) + 1)
+            candidates = np.concatenate([np.arange(self.offsets[cell], self.offsets[cell + 1])
+                                         for cell in cells[:n_cells]])
+            diff = self.data[candidates] - query
+            d = np.abs(diff).sum(axis=1) if p == 1 else np.sqrt(np.einsum('ij,ij->i', diff, diff))
+            nearest = np.argpartition(d, k - 1)[:k] if len(d) > k else np.arange(len(d))
+            nearest = nearest[np.argsort(d[nearest], kind='stable')]
+            distances[row] = d[nearest]
+            indices[row] = self.ids[candidates[nearest]]
+        return distances, indices
+
+
+class ANNKNeighborsRegressor(RegressorMixin, BaseEstimator):
+    """
+    KNN regression over an IVF approximate nearest-neighbor index
+
+    Args:
+        n_neighbors (int): Number of neighbors averaged
+        weights (str): 'uniform' or 'distance' (inverse distance), as in KNeighborsRegressor
+        p (int): 1 for Manhattan, 2 for Euclidean distance
+        n_lists (int): k-means cells; sqrt(n_samples) if None
+        n_probe (int): Cells scanned per query (higher: better recall, slower queries)
+        n_iter (int): k-means iterations at fit time
+        random_state (int): Seed of k-means
+    """
+
+    def __init__(self, n_neighbors=5, weights='uniform', p=2, n_lists=None, n_probe=8, n_iter=10, random_state=0):
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+        self.p = p
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        if self.weights not in ('uniform', 'distance'):
+            raise ValueError(f"weights must be 'uniform' or 'distance', got {self.weights!r}")
+        if self.p not in (1, 2):
+            raise ValueError(f"p must be 1 or 2, got {self.p!r}")
+        X, y = check_X_y(X, y, accept_sparse=False, dtype='float32', y_numeric=True)
+        n_lists = self.n_lists or max(1, int(round(np.sqrt(len(X)))))
+        self.index_ = IVFIndex(n_lists, self.n_iter, self.random_state).build(X)
+        self.y_ = np.asarray(y, dtype='float64')
+        self.n_features_in_ = X.shape[1]
+        return self
+
+    def kneighbors(self, X, n_neighbors=None, return_distance=True):
+        check_is_fitted(self, 'index_')
+        X = check_array(X, accept_sparse=False, dtype='float32')
+        distances, indices = self.index_.search(X, n_neighbors or self.n_neighbors, self.n_probe, self.p)
+        return (distances, indices) if return_distance else indices
+
+    def predict(self, X):
+        distances, indices = self.kneighbors(X)
+        neighbors = self.y_[indices]
+        if self.weights == 'uniform':
+            return neighbors.mean(axis=1)
+        # Inverse distance weights; exact matches (distance 0) share all the weight, as in sklearn
+        with np.errstate(divide='ignore'):
+            weights = 1.0 / distances
+        exact = np.isinf(weights)
+        rows = exact.any(axis=1)
+        weights[rows] = exact[rows]
+        return (neighbors * weights).sum(axis=1) / weights.sum(axis=1)
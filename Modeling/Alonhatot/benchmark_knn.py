@@ -0,0 +1,106 @@
+"""
+Benchmark exact KNN regression against ANNKNeighborsRegressor (ann_knn.py)
+on the alonhadat listings, with the features and preprocessing of
+knn_regression_model.ipynb (scaled numerics plus one-hot `ward_cat`).
+
+For each model: fit time, batch query time (whole test set), single-listing
+latency, recall of the exact k nearest neighbors and test MAPE. `--scale`
+grows the training corpus by repeating it with jittered numeric features,
+to show how query cost follows corpus size.
+
+Usage:
+    python benchmark_knn.py
+    python benchmark_knn.py --scale 8 --probes 1 2 4 8 16
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.compose import ColumnTransformer
+from sklearn.model_selection import train_test_split
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from ann_knn import ANNKNeighborsRegressor
+from feature_store import load_features
+
+NUMERIC_FEATURES = ['area', 'bedrooms', 'floors', 'bedroom_per_area', 'is_main_road', 'is_corner', 'has_car_access']
+CATEGORICAL_FEATURES = ['ward_cat']
+
+
+def load_matrices(scale=1, seed=42):
+    """Preprocessed train/test matrices; the training rows are repeated `scale` times with jitter"""
+    df, _ = load_features('alonhadat', columns=NUMERIC_FEATURES + CATEGORICAL_FEATURES + ['price_converted'])
+    X_train, X_test, y_train, y_test = train_test_split(
+        df[NUMERIC_FEATURES + CATEGORICAL_FEATURES], df['price_converted'], test_size=0.2, random_state=42)
+    preprocessor = ColumnTransformer(transformers=[
+        ('num', StandardScaler(), NUMERIC_FEATURES),
+        ('cat', OneHotEncoder(handle_unknown='ignore', sparse_output=False), CATEGORICAL_FEATURES),
+    ])
+    X_train_t = preprocessor.fit_transform(X_train)
+    X_test_t = preprocessor.transform(X_test)
+    y_train = y_train.to_numpy()
+    if scale > 1:
+        rng = np.random.default_rng(seed)
+        copies = [X_train_t]
+        for _ in range(scale - 1):
+            jittered = X_train_t.copy()
+            jittered[:, :len(NUMERIC_FEATURES)] += rng.normal(0, 0.05, (len(jittered), len(NUMERIC_FEATURES)))
+            copies.append(jittered)
+        X_train_t, y_train = np.vstack(copies), np.tile(y_train, scale)
+    return X_train_t, X_test_t, y_train, y_test.to_numpy()
+
+
+def mean_absolute_percentage_error(y_true, y_pred):
+    return np.mean(np.abs((y_true - y_pred) / np.maximum(y_true, 1e-10))) * 100
+
+
+def run(label, model, X_train, X_test, y_train, y_test, exact_neighbors, singles=200):
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    y_pred = model.predict(X_test)
+    batch_s = time.perf_counter() - started
+
+    timings = []
+    for row in X_test[:singles]:
+        started = time.perf_counter()
+        model.predict(row[None, :])
+        timings.append(time.perf_counter() - started)
+
+    neighbors = model.kneighbors(X_test, return_distance=False)
+    k = exact_neighbors.shape[1]
+    recall = np.mean([len(np.intersect1d(a, b)) / k for a, b in zip(neighbors, exact_neighbors)])
+    print(f"{label:<24}{fit_s:>8.2f}{batch_s * 1000 / len(X_test) * 1000:>14.1f}"
+          f"{np.median(timings) * 1e6:>12.0f}{recall:>9.3f}{mean_absolute_percentage_error(y_test, y_pred):>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exact vs approximate KNN regression: latency and MAPE")
+    parser.add_argument("--scale", type=int, default=1, help="Repeat the training rows this many times")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--weights", default="distance")
+    parser.add_argument("--p", type=int, default=1)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    X_train, X_test, y_train, y_test = load_matrices(args.scale)
+    print(f"{len(X_train):,} training rows x {X_train.shape[1]} features, {len(X_test):,} queries, "
+          f"k={args.k}, weights={args.weights}, p={args.p}\n")
+    print(f"{'model':<24}{'fit s':>8}{'ms/1k queries':>14}{'single us':>12}{'recall':>9}{'MAPE %':>9}")
+
+    params = dict(n_neighbors=args.k, weights=args.weights, p=args.p)
+    brute = KNeighborsRegressor(algorithm='brute', **params).fit(X_train, y_train)
+    exact_neighbors = brute.kneighbors(X_test, return_distance=False)
+    for algorithm in ('brute', 'auto'):
+        run(f"exact ({algorithm})", KNeighborsRegressor(algorithm=algorithm, **params),
+            X_train, X_test, y_train, y_test, exact_neighbors)
+    for n_probe in args.probes:
+        run(f"ANN IVF n_probe={n_probe}", ANNKNeighborsRegressor(n_probe=n_probe, **params),
+            X_train, X_test, y_train, y_test, exact_neighbors)
+
+
+if __name__ == "__main__":
+    main()
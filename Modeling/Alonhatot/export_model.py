@@ -1,113 +1,136 @@
 """
 Export XGBoost regression model from notebook to a file.
 """
-import pandas as pd
 import numpy as np
 import joblib
 import pickle
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, OneHotEncoder, PowerTransformer, RobustScaler
+from sklearn.preprocessing import StandardScaler, OneHotEncoder, OrdinalEncoder, PowerTransformer, RobustScaler
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 import xgboost as xgb
+import argparse
+import json
 import os
 import sys
 
-def main():
-    print("Exporting XGBoost model for Streamlit application...")
-    
-    # Load the preprocessed data
-    print("Loading data...")
-    df = pd.read_csv('../../Data Preprocessing/alonhadat_processed.csv')
-    print(f"Loaded {len(df)} records")
-    
-    # Define features
-    numeric_features = ['area', 'bedrooms', 'floors', 'address_complete', 'bedroom_per_area',
-                       'is_main_road', 'is_corner', 'has_car_access']
-    categorical_features = ['district', 'district_price_category']
-    
-    # Create derived features
-    print("Creating derived features...")
-    df['bedroom_per_area'] = df['bedrooms'] / df['area']
-    df['is_corner'] = df['title'].str.contains('GÓC|GÓCH?', case=False, regex=True).astype(int)
-    df['is_main_road'] = df['title'].str.contains('MẶT PHỐ|MẶT TIỀN|MẶT ĐƯỜNG', case=False, regex=True).astype(int)
-    df['has_car_access'] = df['title'].str.contains('Ô TÔ|OTO|XE HƠI', case=False, regex=True).astype(int)
-    
-    # Create district price categories
-    district_price = df.groupby('district')['price_converted'].median().sort_values()
-    price_percentiles = np.percentile(district_price, [33, 66])
-    price_labels = ['low_price', 'mid_price', 'high_price']
-    district_price_category = pd.cut(district_price, 
-                                    bins=[0] + list(price_percentiles) + [float('inf')], 
-                                    labels=price_labels)
-    district_to_price_category = dict(zip(district_price.index, district_price_category))
-    df['district_price_category'] = df['district'].map(district_to_price_category)
-    
-    # Create log-transformed target
-    print("Creating log-transformed target variable...")
-    df['price_converted_log'] = np.log1p(df['price_converted'])
-    
-    # Handle outliers
-    print("Removing outliers...")
-    # Define IQR outlier removal function
-    def remove_outliers_iqr(df, column):
-        Q1 = df[column].quantile(0.25)
-        Q3 = df[column].quantile(0.75)
-        IQR = Q3 - Q1
-        lower_bound = Q1 - 1.5 * IQR
-        upper_bound = Q3 + 1.5 * IQR
-        return df[(df[column] >= lower_bound) & (df[column] <= upper_bound)]
-    
-    # Apply outlier removal
-    df_clean = df.copy()
-    for column in ['area', 'price_converted', 'bedrooms', 'floors']:
-        df_clean = remove_outliers_iqr(df_clean, column)
-    
-    print(f"After outlier removal: {len(df_clean)} records ({len(df_clean)/len(df)*100:.2f}% of original data)")
-    
-    # Update dataset to use cleaned version
-    df = df_clean.copy()
-    df['price_converted_log'] = np.log1p(df['price_converted'])
-    
-    # Define features and targets
-    X = df[numeric_features + categorical_features].copy()
-    y = df['price_converted']
-    y_log = df['price_converted_log']
-    
-    # Split the data
-    print("Splitting data into train and test sets...")
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    _, _, y_train_log, y_test_log = train_test_split(X, y_log, test_size=0.2, random_state=42)
-    
-    # Create preprocessing pipeline
-    print("Creating preprocessing pipeline...")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from feature_store import BINARY_FEATURES, CATEGORICAL_FEATURES, NUMERIC_FEATURES, load_features, load_outlier_filter
+from instrumentation import NO_METRICS, add_arguments, instrumented
+
+# Used unless tune.py has written a winning configuration
+DEFAULT_XGB_PARAMS = {
+    'n_estimators': 600,
+    'max_depth': 6,
+    'eta': 0.01,
+    'gamma': 1,
+    'subsample': 1,
+    'colsample_bytree': 0.8,
+    'objective': 'reg:squarederror',
+    'random_state': 42
+}
+TUNED_PARAMS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'xgb_tuned_params.json')
+
+
+def load_training_data():
+    """
+    Load the alonhadat feature table (see feature_store.py), outliers removed
+    
+    Returns:
+        tuple: (df, district_to_price_category)
+    """
+    print("Loading features...")
+    df, district_to_price_category = load_features(
+        'alonhadat', columns=NUMERIC_FEATURES + CATEGORICAL_FEATURES + ['price_converted', 'price_converted_log'])
+    print(f"Loaded {len(df)} records after outlier removal")
+    return df, district_to_price_category
+
+
+def train_test_data(df):
+    """The export's 80/20 split: (X_train, X_test, y_train_log, y_test_log)"""
+    X = df[NUMERIC_FEATURES + CATEGORICAL_FEATURES].copy()
+    return train_test_split(X, df['price_converted_log'], test_size=0.2, random_state=42)
+
+
+def build_preprocessor(numeric_features=NUMERIC_FEATURES, categorical_features=CATEGORICAL_FEATURES,
+                       native_categorical=False, binary_features=BINARY_FEATURES):
+    """
+    Power transform + robust scaling for numeric features; categorical ones are
+    one-hot encoded (dense), or with `native_categorical` ordinal-coded for
+    XGBoost's own categorical splits (one column per feature, unknown -> missing)
+
+    Numeric features listed in `binary_features` pass through unchanged: the
+    Yeo-Johnson lambda of a nearly constant 0/1 column (address_complete) runs
+    into the hundreds and pushes its values past float32 range, which XGBoost
+    rejects.
+    """
     numeric_transformer = Pipeline(steps=[
         ('power', PowerTransformer(method='yeo-johnson', standardize=False)),
         ('scaler', RobustScaler())
     ])
     
-    categorical_transformer = Pipeline(steps=[
-        ('onehot', OneHotEncoder(handle_unknown='ignore', sparse_output=False))
-    ])
-    
-    preprocessor = ColumnTransformer(
+    if native_categorical:
+        categorical_transformer = Pipeline(steps=[
+            ('ordinal', OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=np.nan,
+                                       encoded_missing_value=np.nan))
+        ])
+    else:
+        categorical_transformer = Pipeline(steps=[
+            ('onehot', OneHotEncoder(handle_unknown='ignore', sparse_output=False))
+        ])
+    
+    return ColumnTransformer(
         transformers=[
-            ('num', numeric_transformer, numeric_features),
+            ('num', numeric_transformer, [f for f in numeric_features if f not in binary_features]),
+            ('bin', 'passthrough', [f for f in numeric_features if f in binary_features]),
             ('cat', categorical_transformer, categorical_features)
         ]
     )
+
+
+def load_xgb_params(tuned_path=TUNED_PARAMS_PATH):
+    """
+    XGBoost parameters for the export: the defaults, overridden by tune.py's winner if present
+    
+    Args:
+        tuned_path (str): JSON written by tune.py; ignored if it does not exist
+    """
+    xgb_params = dict(DEFAULT_XGB_PARAMS)
+    if tuned_path and os.path.exists(tuned_path):
+        with open(tuned_path, encoding='utf-8') as f:
+            tuned = json.load(f)
+        xgb_params.update(tuned['params'])
+        xgb_params['n_estimators'] = tuned['n_estimators']
+        print(f"Using tuned parameters from {tuned_path} (CV RMSE on log price {tuned['cv_rmse_log']:.4f})")
+    return xgb_params
+
+
+def main(compiled=False, tuned_path=TUNED_PARAMS_PATH, native_categorical=False, metrics=NO_METRICS):
+    print("Exporting XGBoost model for Streamlit application...")
+    
+    # Define features
+    numeric_features = NUMERIC_FEATURES
+    categorical_features = CATEGORICAL_FEATURES
+    
+    with metrics.stage("load_features"):
+        df, district_to_price_category = load_training_data()
+    metrics.count("rows", len(df))
+    
+    # Split the data
+    print("Splitting data into train and test sets...")
+    X_train, X_test, y_train_log, y_test_log = train_test_data(df)
+    metrics.count("train_rows", len(X_train))
+    
+    # Create preprocessing pipeline
+    print("Creating preprocessing pipeline...")
+    preprocessor = build_preprocessor(numeric_features, categorical_features, native_categorical)
     
     # Define XGBoost parameters
-    xgb_params = {
-        'n_estimators': 600,
-        'max_depth': 6,
-        'eta': 0.01,
-        'gamma': 1,
-        'subsample': 1,
-        'colsample_bytree': 0.8,
-        'objective': 'reg:squarederror',
-        'random_state': 42
-    }
+    xgb_params = load_xgb_params(tuned_path)
+    if native_categorical:
+        # The ordinal codes are flagged as categorical ('c') so XGBoost partitions them as sets
+        xgb_params.update(enable_categorical=True,
+                          feature_types=['q'] * len(numeric_features) + ['c'] * len(categorical_features))
     
     # Create and train the log-transformed model
     print("Training XGBoost model with log-transformed target...")
@@ -116,7 +139,8 @@ def main():
         ('regressor', xgb.XGBRegressor(**xgb_params))
     ])
     
-    xgb_model_log.fit(X_train, y_train_log)
+    with metrics.stage("fit"):
+        xgb_model_log.fit(X_train, y_train_log)
     
     # Save the trained model
     print("Saving model to Application directory...")
@@ -126,19 +150,49 @@ def main():
     model_path = os.path.join(app_dir, 'xgboost_model.joblib')
     features_path = os.path.join(app_dir, 'model_features.pkl')
     
-    joblib.dump(xgb_model_log, model_path)
+    with metrics.stage("save"):
+        joblib.dump(xgb_model_log, model_path)
     
     # Save feature information
+    model_features = {
+        'numeric_features': numeric_features,
+        'categorical_features': categorical_features,
+        'is_log_transformed': True,  # Since we're using the log-transformed model
+        'categorical_encoding': 'native' if native_categorical else 'onehot',
+        'district_price_category': district_to_price_category,  # Needed to score new listings
+        'outlier_bounds': load_outlier_filter('alonhadat').to_dict()  # To flag inputs outside the training range
+    }
     with open(features_path, 'wb') as f:
-        pickle.dump({
-            'numeric_features': numeric_features,
-            'categorical_features': categorical_features,
-            'is_log_transformed': True  # Since we're using the log-transformed model
-        }, f)
+        pickle.dump(model_features, f)
+    
+    # Optionally also write the pandas/sklearn-free artifacts (native booster + frozen preprocessing)
+    if compiled:
+        sys.path.insert(0, app_dir)
+        from compiled_model import freeze
+        with metrics.stage("freeze"):
+            freeze(xgb_model_log, model_features,
+                   booster_path=os.path.join(app_dir, 'xgboost_model.ubj'),
+                   frozen_path=os.path.join(app_dir, 'xgboost_model_frozen.json'),
+                   trees_path=os.path.join(app_dir, 'xgboost_model_trees.npz'))
     
     print(f"Model saved to {model_path}")
     print(f"Feature information saved to {features_path}")
     print("Done! The model is ready to use with the Streamlit app.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Train and export the XGBoost price model")
+    parser.add_argument("--compiled", action="store_true",
+                        help="Also export the native booster and frozen preprocessing for compiled_model.py")
+    parser.add_argument("--params", default=TUNED_PARAMS_PATH,
+                        help="Tuned parameters written by tune.py (defaults are used if the file is missing)")
+    parser.add_argument("--default-params", action="store_true", help="Ignore tuned parameters")
+    parser.add_argument("--native-categorical", action="store_true",
+                        help="Feed the categorical features to XGBoost as categories instead of one-hot columns "
+                             "(not supported by --compiled)")
+    add_arguments(parser)
+    args = parser.parse_args()
+    if args.compiled and args.native_categorical:
+        parser.error("--compiled only supports the one-hot export")
+    with instrumented("export_model", args.metrics, args.trace_memory, args.profile) as metrics:
+        main(compiled=args.compiled, tuned_path=None if args.default_params else args.params,
+             native_categorical=args.native_categorical, metrics=metrics)
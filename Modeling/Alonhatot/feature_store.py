@@ -0,0 +1,202 @@
+"""
+Feature table shared by export_model.py, tune.py and the modeling notebooks.
+
+The features the models train on (`bedroom_per_area`, the title flags,
+`district_price_category`, the log target and the outliers.py IQR flag)
+and the geocoding.py location features (`SPATIAL_FEATURES`) are defined
+here once and computed once per version of the processed data. The result is cached as a Parquet table named after a content hash of the
+source file `load_processed` reads plus `FEATURE_VERSION`:
+
+    Modeling/Alonhatot/feature_cache/alonhadat-<hash>-v5.parquet
+
+A new crawl or a new feature definition gives a new file name, so a stale
+table is never read. Bump `FEATURE_VERSION` whenever a definition below
+changes. Serving (batch_predict.py, compiled_model.py) derives features for
+new listings from the same definitions.
+
+Usage:
+    python feature_store.py            # build (or reuse) the alonhadat feature table
+    python feature_store.py --rebuild
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../Data Preprocessing')))
+from dataset_store import DATASET_ROOT, PROCESSED_DIR, compact_dtypes, list_crawl_dates, load_processed, partition_dir
+from geocoding import add_spatial_features
+from outliers import IQRFilter
+
+FEATURE_VERSION = 5
+CACHE_DIR = Path(__file__).resolve().parent / "feature_cache"
+
+NUMERIC_FEATURES = ['area', 'bedrooms', 'floors', 'address_complete', 'bedroom_per_area',
+                    'is_main_road', 'is_corner', 'has_car_access']
+CATEGORICAL_FEATURES = ['district', 'district_price_category']
+# 0/1 features among NUMERIC_FEATURES, fed to the model unscaled
+BINARY_FEATURES = ['address_complete', 'is_main_road', 'is_corner', 'has_car_access']
+# Binary features flagged by a (case-insensitive) pattern in the listing title
+TITLE_FLAGS = {
+    'is_corner': 'GÓC|GÓCH?',
+    'is_main_road': 'MẶT PHỐ|MẶT TIỀN|MẶT ĐƯỜNG',
+    'has_car_access': 'Ô TÔ|OTO|XE HƠI',
+}
+# Offline-geocoded location features; knn_price_per_m2 is computed leave-one-out over all rows,
+# so recompute it on the training rows only before using it as a model input
+SPATIAL_FEATURES = ['dist_center_km', 'knn_price_per_m2']
+# Rows outside the IQR bounds of any of these are flagged `is_outlier`
+OUTLIER_COLUMNS = ['area', 'price_converted', 'bedrooms', 'floors']
+
+
+def add_derived_features(df):
+    """
+    Add the title/ratio features the model is trained on
+
+    Args:
+        df (pd.DataFrame): Listings with `area`, `bedrooms` and `title` columns
+
+    Returns:
+        pd.DataFrame: `df` with bedroom_per_area, is_corner, is_main_road and has_car_access
+    """
+    df['bedroom_per_area'] = df['bedrooms'] / df['area']
+    for flag, pattern in TITLE_FLAGS.items():
+        df[flag] = df['title'].str.contains(pattern, case=False, regex=True).astype(int)
+    return df
+
+
+def district_price_categories(df):
+    """
+    Bucket districts into low/mid/high price by their median price (33rd/66th percentiles)
+
+    Returns:
+        dict: district name -> 'low_price' | 'mid_price' | 'high_price'
+    """
+    district_price = df.groupby('district', observed=True)['price_converted'].median().sort_values()
+    price_percentiles = np.percentile(district_price, [33, 66])
+    price_labels = ['low_price', 'mid_price', 'high_price']
+    district_price_category = pd.cut(district_price,
+                                    bins=[0] + list(price_percentiles) + [float('inf')],
+                                    labels=price_labels)
+    return {district: str(category) for district, category in zip(district_price.index, district_price_category)}
+
+
+def source_file(source, root=DATASET_ROOT, processed_dir=PROCESSED_DIR):
+    """The file `load_processed(source)` reads: the latest Parquet partition, else the processed CSV"""
+    crawl_dates = list_crawl_dates(source, root)
+    if crawl_dates:
+        return next(partition_dir(source, crawl_dates[-1], root).glob("*.parquet"))
+    return Path(processed_dir) / f"{source}_processed.csv"
+
+
+def content_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def feature_table_path(source='alonhadat', cache_dir=CACHE_DIR):
+    return Path(cache_dir) / f"{source}-{content_hash(source_file(source))}-v{FEATURE_VERSION}.parquet"
+
+
+def build_features(source='alonhadat'):
+    """
+    Compute the feature table from the processed listings
+
+    Returns:
+        tuple: (df with every processed column plus the features, district_to_price_category,
+            the fitted IQRFilter behind `is_outlier`)
+    """
+    df = load_processed(source)
+    df = add_derived_features(df)
+    district_to_price_category = district_price_categories(df)
+    df['district_price_category'] = df['district'].map(district_to_price_category)
+    df['price_converted_log'] = np.log1p(df['price_converted'])
+    df = add_spatial_features(df)
+    outlier_filter = IQRFilter(OUTLIER_COLUMNS).fit(df)
+    df['is_outlier'] = ~outlier_filter.inside(df)
+    return df, district_to_price_category, outlier_filter
+
+
+def write_features(df, district_to_price_category, outlier_filter, path):
+    """
+    Write the table with the district buckets and outlier bounds in its schema metadata
+
+    Columns are stored with their `compact_dtypes` (same values, narrower
+    types, dictionary-encoded text), which readers get back as is.
+    """
+    table = pa.Table.from_pandas(compact_dtypes(df), preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'district_price_category'] = json.dumps(district_to_price_category, ensure_ascii=False).encode('utf-8')
+    metadata[b'outlier_bounds'] = json.dumps(outlier_filter.to_dict()).encode('utf-8')
+    metadata[b'feature_version'] = str(FEATURE_VERSION).encode()
+    table = table.replace_schema_metadata(metadata)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(path).with_suffix('.tmp')
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, path)
+
+
+def ensure_features(source='alonhadat', rebuild=False, cache_dir=CACHE_DIR):
+    """Path of the feature table for the current data and definitions, building it if missing"""
+    path = feature_table_path(source, cache_dir)
+    if rebuild or not path.exists():
+        started = time.perf_counter()
+        df, district_to_price_category, outlier_filter = build_features(source)
+        write_features(df, district_to_price_category, outlier_filter, path)
+        print(f"Built feature table {path.name} ({len(df)} rows) in {time.perf_counter() - started:.2f}s")
+    return path
+
+
+def load_outlier_filter(source='alonhadat', cache_dir=CACHE_DIR):
+    """The IQRFilter fitted on the feature table, to flag new listings outside the training range"""
+    metadata = pq.read_schema(ensure_features(source, cache_dir=cache_dir)).metadata
+    return IQRFilter.from_dict(json.loads(metadata[b'outlier_bounds']))
+
+
+def load_features(source='alonhadat', columns=None, drop_outliers=True, rebuild=False, cache_dir=CACHE_DIR):
+    """
+    Load the feature table, building it first if this data/definition version has none
+
+    Args:
+        source (str): Processed source to featurize
+        columns (list): Columns to decode; every column if None
+        drop_outliers (bool): Drop the rows outside the IQR bounds of `OUTLIER_COLUMNS`
+        rebuild (bool): Recompute even if a cached table exists
+        cache_dir (Path): Where feature tables are kept
+
+    Returns:
+        tuple: (df, district_to_price_category); the buckets are fitted on all rows, outliers included
+    """
+    path = ensure_features(source, rebuild, cache_dir)
+    read_columns = None if columns is None else list(dict.fromkeys(list(columns) + ['is_outlier']))
+    table = pq.read_table(path, columns=read_columns)
+    district_to_price_category = json.loads(table.schema.metadata[b'district_price_category'])
+    df = table.to_pandas()
+    if drop_outliers:
+        df = df[~df['is_outlier']].reset_index(drop=True)
+    if columns is not None:
+        df = df[list(columns)]
+    return df, district_to_price_category
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the cached feature table")
+    parser.add_argument("--source", default="alonhadat")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute even if the table exists")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    df, _ = load_features(args.source, drop_outliers=False, rebuild=args.rebuild)
+    print(f"{feature_table_path(args.source)}: {len(df)} rows, {int(df['is_outlier'].sum())} flagged as outliers "
+          f"({time.perf_counter() - started:.2f}s)")
@@ -0,0 +1,272 @@
+"""
+Hyperparameter search for the exported XGBoost model.
+
+Random configurations are raced with successive halving: every config is
+cross-validated with a small boosting-round budget, the best third moves
+on to a budget three times larger, and so on up to `--max-rounds`. Each
+fit early-stops on its fold's validation set, so the winner also gets its
+number of trees.
+
+The preprocessing of export_model.py (PowerTransformer, RobustScaler,
+OneHotEncoder) is fitted once per fold and shared with the worker
+processes as arrays, instead of being refit for every candidate and fold
+as in the notebooks' GridSearchCV. Every finished trial is stored in
+`tuning_trials.sqlite`, keyed by its parameters, budget and a fingerprint
+of the training data and preprocessing, so an interrupted or repeated run
+skips the trials it already has, and a changed `build_preprocessor` starts
+over.
+
+The winner is written to `xgb_tuned_params.json`, which export_model.py
+picks up.
+
+Usage:
+    python tune.py --configs 27 --workers 4
+    python tune.py --configs 27 --min-rounds 100 --max-rounds 2700 --folds 3
+    python export_model.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import sklearn
+import xgboost as xgb
+from sklearn.model_selection import KFold
+
+from export_model import TUNED_PARAMS_PATH, build_preprocessor, load_training_data, train_test_data
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+TRIALS_PATH = os.path.join(MODEL_DIR, 'tuning_trials.sqlite')
+EARLY_STOPPING_ROUNDS = 50
+# Fixed for every trial
+BASE_PARAMS = {'objective': 'reg:squarederror', 'eval_metric': 'rmse', 'tree_method': 'hist', 'seed': 42}
+
+
+def sample_config(rng):
+    """One random configuration of the tuned XGBoost parameters"""
+    return {
+        'max_depth': int(rng.integers(3, 11)),
+        'eta': round(float(10 ** rng.uniform(-2, -0.7)), 4),
+        'min_child_weight': round(float(10 ** rng.uniform(0, 1.5)), 2),
+        'subsample': round(float(rng.uniform(0.6, 1.0)), 2),
+        'colsample_bytree': round(float(rng.uniform(0.5, 1.0)), 2),
+        'gamma': round(float(rng.choice([0, 0.1, 0.5, 1, 2])), 2),
+        'reg_lambda': round(float(10 ** rng.uniform(-1, 1)), 3),
+    }
+
+
+def halving_budgets(min_rounds, max_rounds, factor):
+    """Boosting-round budgets of the successive halving rungs, e.g. 100, 300, 900, 2700"""
+    budgets = [min_rounds]
+    while budgets[-1] * factor <= max_rounds:
+        budgets.append(budgets[-1] * factor)
+    return budgets
+
+
+def data_fingerprint(X, y, n_folds, seed):
+    """Hash of the training rows, the fold split, the preprocessing and the XGBoost/scikit-learn versions"""
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(X, index=True).values.tobytes())
+    digest.update(pd.util.hash_pandas_object(y, index=True).values.tobytes())
+    # The full definition (a plain repr elides long ones), so trials scored on another transform are not reused
+    digest.update(build_preprocessor().__repr__(N_CHAR_MAX=1 << 20).encode())
+    digest.update(f"{n_folds}:{seed}:{xgb.__version__}:{sklearn.__version__}".encode())
+    return digest.hexdigest()[:16]
+
+
+def trial_key(config, budget, fingerprint):
+    return hashlib.sha256(json.dumps([config, budget, fingerprint], sort_keys=True).encode()).hexdigest()
+
+
+class TrialStore:
+    """
+    SQLite table of finished trials
+
+    Args:
+        path (str): Database file; created if missing
+    """
+
+    def __init__(self, path=TRIALS_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS trials (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                params TEXT NOT NULL,
+                budget INTEGER NOT NULL,
+                rmse REAL NOT NULL,
+                best_iteration INTEGER NOT NULL,
+                rounds_trained INTEGER NOT NULL,
+                seconds REAL NOT NULL,
+                finished_at TEXT NOT NULL
+            )""")
+        self.conn.commit()
+
+    def get(self, key):
+        row = self.conn.execute("SELECT rmse, best_iteration, rounds_trained, seconds FROM trials WHERE key = ?",
+                                (key,)).fetchone()
+        if row is None:
+            return None
+        return {'rmse': row[0], 'best_iteration': row[1], 'rounds_trained': row[2], 'seconds': row[3]}
+
+    def put(self, key, fingerprint, config, budget, result):
+        self.conn.execute("INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                          (key, fingerprint, json.dumps(config, sort_keys=True), budget, result['rmse'],
+                           result['best_iteration'], result['rounds_trained'], result['seconds'],
+                           datetime.now().isoformat(timespec='seconds')))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def preprocess_folds(X, y, n_folds, seed):
+    """
+    Fit export_model's preprocessor once per fold
+
+    Returns:
+        list: (X_fit, y_fit, X_valid, y_valid) float32 arrays per fold
+    """
+    folds = []
+    for fit_index, valid_index in KFold(n_splits=n_folds, shuffle=True, random_state=seed).split(X):
+        preprocessor = build_preprocessor()
+        X_fit = preprocessor.fit_transform(X.iloc[fit_index])
+        X_valid = preprocessor.transform(X.iloc[valid_index])
+        folds.append((X_fit.astype(np.float32), y.iloc[fit_index].to_numpy(np.float32),
+                      X_valid.astype(np.float32), y.iloc[valid_index].to_numpy(np.float32)))
+    return folds
+
+
+# Per-process fold matrices, built once by `_init_worker`
+_worker = {}
+
+
+def _init_worker(folds, n_threads):
+    _worker['folds'] = [(xgb.DMatrix(X_fit, label=y_fit), xgb.DMatrix(X_valid, label=y_valid))
+                        for X_fit, y_fit, X_valid, y_valid in folds]
+    _worker['n_threads'] = n_threads
+
+
+def _run_trial(config, budget):
+    """Cross-validate one config with at most `budget` rounds; RMSE is on the log price"""
+    started = time.perf_counter()
+    params = {**BASE_PARAMS, **config, 'nthread': _worker['n_threads']}
+    scores, best_iterations, rounds_trained = [], [], 0
+    for dtrain, dvalid in _worker['folds']:
+        booster = xgb.train(params, dtrain, num_boost_round=budget, evals=[(dvalid, 'valid')],
+                            early_stopping_rounds=EARLY_STOPPING_ROUNDS, verbose_eval=False)
+        scores.append(booster.best_score)
+        best_iterations.append(booster.best_iteration + 1)
+        rounds_trained += booster.num_boosted_rounds()
+    return {'rmse': float(np.mean(scores)), 'best_iteration': int(np.mean(best_iterations)),
+            'rounds_trained': rounds_trained, 'seconds': time.perf_counter() - started}
+
+
+def successive_halving(folds, store, fingerprint, n_configs=27, min_rounds=100, max_rounds=2700,
+                       factor=3, workers=1, seed=42):
+    """
+    Race `n_configs` random configurations over growing round budgets
+
+    Args:
+        folds (list): Output of `preprocess_folds`
+        store (TrialStore): Finished trials; hits are not rerun
+        fingerprint (str): `data_fingerprint` of the training data
+        n_configs (int): Configurations in the first rung
+        min_rounds (int): Boosting-round budget of the first rung
+        max_rounds (int): Largest budget
+        factor (int): Budget multiplier and survivor divisor between rungs
+        workers (int): Trial processes
+
+    Returns:
+        tuple: (best config, its result, boosting rounds trained in this run)
+    """
+    rng = np.random.default_rng(seed)
+    configs = [sample_config(rng) for _ in range(n_configs)]
+    n_threads = max(1, (os.cpu_count() or 1) // workers)
+    rounds_trained = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(folds, n_threads)) as executor:
+        for budget in halving_budgets(min_rounds, max_rounds, factor):
+            results, futures = {}, {}
+            for i, config in enumerate(configs):
+                key = trial_key(config, budget, fingerprint)
+                cached = store.get(key)
+                if cached is not None:
+                    results[i] = cached
+                else:
+                    futures[executor.submit(_run_trial, config, budget)] = (i, key)
+            print(f"Budget {budget} rounds: {len(configs)} configs "
+                  f"({len(results)} from the trial store, {len(futures)} to run)")
+            for future in as_completed(futures):
+                i, key = futures[future]
+                results[i] = future.result()
+                store.put(key, fingerprint, configs[i], budget, results[i])
+                rounds_trained += results[i]['rounds_trained']
+
+            ranked = sorted(results, key=lambda i: results[i]['rmse'])
+            best = ranked[0]
+            print(f"  best RMSE (log price) {results[best]['rmse']:.4f} "
+                  f"at {results[best]['best_iteration']} rounds: {configs[best]}")
+            if len(configs) == 1:
+                break
+            configs = [configs[i] for i in ranked[:max(1, len(configs) // factor)]]
+    return configs[0], results[best], rounds_trained
+
+
+def save_tuned_params(config, result, path=TUNED_PARAMS_PATH):
+    """Write the winner in the form export_model.load_xgb_params reads"""
+    tuned = {
+        'params': config,
+        'n_estimators': result['best_iteration'],
+        'cv_rmse_log': result['rmse'],
+        'tuned_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(tuned, f, indent=2)
+    print(f"Tuned parameters saved to {path}")
+
+
+def main(n_configs=27, min_rounds=100, max_rounds=2700, factor=3, n_folds=3, workers=1, seed=42,
+         trials_path=TRIALS_PATH, output_path=TUNED_PARAMS_PATH):
+    started = time.perf_counter()
+    df, _ = load_training_data()
+    # Tune on the export's training split only; its test split stays unseen
+    X_train, _, y_train_log, _ = train_test_data(df)
+
+    print(f"Preprocessing {n_folds} folds...")
+    folds = preprocess_folds(X_train, y_train_log, n_folds, seed)
+    fingerprint = data_fingerprint(X_train, y_train_log, n_folds, seed)
+
+    store = TrialStore(trials_path)
+    try:
+        config, result, rounds_trained = successive_halving(folds, store, fingerprint, n_configs, min_rounds,
+                                                            max_rounds, factor, workers, seed)
+    finally:
+        store.close()
+    save_tuned_params(config, result, output_path)
+
+    exhaustive = n_configs * n_folds * halving_budgets(min_rounds, max_rounds, factor)[-1]
+    print(f"Trained {rounds_trained:,} boosting rounds in {time.perf_counter() - started:.1f}s "
+          f"(cross-validating every config at the full budget: {exhaustive:,} rounds)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune the XGBoost price model with successive halving")
+    parser.add_argument("--configs", type=int, default=27, help="Random configurations in the first rung")
+    parser.add_argument("--min-rounds", type=int, default=100, help="Boosting rounds of the first rung")
+    parser.add_argument("--max-rounds", type=int, default=2700, help="Largest boosting-round budget")
+    parser.add_argument("--factor", type=int, default=3, help="Budget multiplier / survivor divisor per rung")
+    parser.add_argument("--folds", type=int, default=3, help="Cross-validation folds")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Trial processes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--trials", default=TRIALS_PATH, help="SQLite trial store")
+    parser.add_argument("--output", default=TUNED_PARAMS_PATH, help="Where to write the winning parameters")
+    args = parser.parse_args()
+
+    main(args.configs, args.min_rounds, args.max_rounds, args.factor, args.folds, args.workers, args.seed,
+         args.trials, args.output)